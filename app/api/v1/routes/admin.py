@@ -0,0 +1,89 @@
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Request, Query
+from fastapi.responses import StreamingResponse
+
+from app.db.session import get_engine, get_replica_router
+from app.db.setup import pool_stats
+from app.dependencies.repo import RepoRequestDep
+from app.dependencies.user import CurrentAdminDep
+from app.db.models.user import Role
+from app.schemas.user import UserPageSchema
+from app.services.user_export import MEDIA_TYPES, export_users
+from app.services.user_import import UserImporter
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    responses={403: {"description": "Admin role required"}},
+)
+
+
+@router.get("/db/pool")
+async def db_pool_stats(admin: CurrentAdminDep):
+    """
+    Connection pool usage of the database engines, use it to size the pool per deployment
+    :param admin: Current admin user
+    :return: pool stats, replicas included when configured
+    """
+    stats = pool_stats(get_engine())
+    replica_router = get_replica_router()
+    if replica_router is not None:
+        stats["replicas"] = [
+            {"url": replica.url.render_as_string(), **pool_stats(replica)} for replica in replica_router.replicas
+        ]
+    return stats
+
+
+@router.post("/users/import")
+async def import_users(request: Request, admin: CurrentAdminDep, repo: RepoRequestDep,
+                       format: Literal["ndjson", "csv"] = "ndjson"):
+    """
+    Bulk import users from an NDJSON or CSV request body, the body is streamed and inserted in chunks
+    :param request: raw request, the body is read with ``request.stream()``
+    :param admin: Current admin user
+    :param repo: Request repositories
+    :param format: "ndjson" (one json object per line) or "csv" (with a header line)
+    :return: import report with per-line failures
+    """
+    return await UserImporter(repo.user).run(request.stream(), format)
+
+
+@router.get("/users", response_model=UserPageSchema)
+async def list_users(admin: CurrentAdminDep, repo: RepoRequestDep, after_id: int = 0,
+                     limit: int = Query(default=100, ge=1, le=1000), role: Role | None = None,
+                     created_from: datetime | None = None, created_to: datetime | None = None):
+    """
+    List users ordered by id with keyset pagination
+    :param admin: Current admin user
+    :param repo: Request repositories
+    :param after_id: return users with an id above this one, ``next_after_id`` of the previous page
+    :param limit: page size
+    :param role: only users with this role
+    :param created_from: only users created at or after this date
+    :param created_to: only users created before this date
+    :return: the page and the cursor of the next page
+    """
+    users = await repo.user.list_users(after_id=after_id, limit=limit, role=role, created_from=created_from,
+                                       created_to=created_to)
+    return UserPageSchema(items=users, next_after_id=users[-1].id if len(users) == limit else None)
+
+
+@router.get("/users/export")
+async def export_users_file(admin: CurrentAdminDep, repo: RepoRequestDep, format: Literal["ndjson", "csv"] = "ndjson",
+                            role: Role | None = None, created_from: datetime | None = None,
+                            created_to: datetime | None = None):
+    """
+    Stream every matching user as NDJSON or CSV, the table is read with a server side cursor
+    :param admin: Current admin user
+    :param repo: Request repositories
+    :param format: "ndjson" or "csv"
+    :param role: only users with this role
+    :param created_from: only users created at or after this date
+    :param created_to: only users created before this date
+    :return: streaming response
+    """
+    chunks = export_users(repo.user, format, role=role, created_from=created_from, created_to=created_to)
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="users.{format}"'})
@@ -1,21 +1,29 @@
 from typing import Annotated
 from fastapi import HTTPException, Cookie
-from fastapi import APIRouter, Response, Depends, status
+from fastapi import APIRouter, Request, Response, Depends, status
 
-from app.core.config import logger
+from app.core.config import get_settings, logger
+from app.core.rate_limiter import rate_limit_by_ip, rate_limit_by_email
+from app.core.revocation import revocation_list
+from app.core.security import decode_refresh_token, decode_token, token_id
+from app.core.tokens import TokenError
 from app.dependencies.repo import RepoRequestDep
 from app.schemas.auth import TokenSchema, LoginSchema
 from app.schemas.user import UserSchema, UserSchemaIn
 from app.services.auth_service import auth_service
+from app.services.user_cache import user_cache
+
+settings = get_settings()
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-@router.post("/signin", response_model=TokenSchema)
-async def signin(form_data: LoginSchema, response: Response, repo: RepoRequestDep):
+@router.post("/signin", response_model=TokenSchema, dependencies=[Depends(rate_limit_by_ip)])
+async def signin(form_data: LoginSchema, request: Request, response: Response, repo: RepoRequestDep):
     """
     Sign in with an existing user
     """
+    await rate_limit_by_email(form_data.username)
     user = await auth_service.authenticate_user(repo=repo, email=form_data.username, password=form_data.password)
     if not user:
         raise HTTPException(
@@ -24,8 +32,10 @@ async def signin(form_data: LoginSchema, response: Response, repo: RepoRequestDe
         )
     token_schema = await auth_service.create_token(user=user)
 
-    # Save refresh schema
-    await repo.token.save_refresh_token(user_id=user.id, refresh_token=token_schema.refresh_token)
+    # Save refresh schema, the oldest sessions above the per user cap are revoked in the same transaction
+    await repo.token.save_refresh_token(user_id=user.id, refresh_token=token_schema.refresh_token,
+                                        user_agent=request.headers.get("user-agent"),
+                                        max_sessions=settings.max_sessions_per_user)
 
     # set cookies
     response.set_cookie(key="access_token", value=token_schema.access_token, httponly=True, secure=True)
@@ -34,24 +44,13 @@ async def signin(form_data: LoginSchema, response: Response, repo: RepoRequestDe
     return token_schema
 
 
-@router.post("/signup", response_model=UserSchema)
+@router.post("/signup", response_model=UserSchema, dependencies=[Depends(rate_limit_by_ip)])
 async def signup(user: UserSchemaIn, repo: RepoRequestDep):
     """
     Create a new user
     """
-    existing_user = await repo.user.get_by_email_or_username(user.username, user.email)
-    if existing_user:
-        if existing_user.email == user.email:
-            raise HTTPException(status_code=409, detail="Email already registered")
-
-        if existing_user.username == user.username:
-            raise HTTPException(status_code=409, detail="Username already registered")
-
-    user = await repo.user.create(user)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail="There was an issue with your credentials")
-    logger.info(f"New user registered: {user.email}")
+    user = await auth_service.register_user(repo=repo, user=user)
+    logger.info("New user registered: %s", user.email)
     return user
 
 
@@ -66,12 +65,24 @@ async def refresh_token(response: Response, repo: RepoRequestDep,
 
 
 @router.post("/logout")
-async def logout(response: Response, repo: RepoRequestDep, refresh_token: Annotated[str | None, Cookie()] = None):
+async def logout(response: Response, repo: RepoRequestDep, refresh_token: Annotated[str | None, Cookie()] = None,
+                 access_token: Annotated[str | None, Cookie()] = None):
     """
     Logout the user
     """
+    if access_token:
+        try:
+            payload = decode_token(access_token)
+            await revocation_list.revoke(token_id(payload, access_token), payload["exp"])
+        except (TokenError, KeyError):
+            logger.debug("Logout with an undecodable access token, nothing to revoke")
+
     if refresh_token:
         await repo.token.revoked_by_token(refresh_token)
+        try:
+            await user_cache.invalidate_user(int(decode_refresh_token(refresh_token)["sub"]))
+        except (TokenError, KeyError, ValueError):
+            logger.debug("Logout with an undecodable refresh token, user cache not invalidated")
 
     response.delete_cookie("access_token")
     response.delete_cookie("refresh_token")
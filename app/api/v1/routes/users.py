@@ -1,7 +1,14 @@
+from typing import Annotated
+
 from app.dependencies.user import CurrentUserDep
-from fastapi import APIRouter
+from fastapi import APIRouter, Cookie, HTTPException, status
 
+from app.core.revocation import revocation_list
+from app.core.security import hash_refresh_token
+from app.dependencies.repo import RepoRequestDep
+from app.schemas.auth import SessionSchema, RevokedSessionsSchema
 from app.schemas.user import UserSchema
+from app.services.user_cache import user_cache
 
 router = APIRouter(
     prefix="/users",
@@ -19,3 +26,53 @@ async def user_details( user: CurrentUserDep):
     """
 
     return user
+
+
+@router.get("/me/sessions", response_model=list[SessionSchema])
+async def list_sessions(user: CurrentUserDep, repo: RepoRequestDep,
+                        refresh_token: Annotated[str | None, Cookie()] = None):
+    """
+    Active sessions (signed in devices) of the current user, newest first
+    :param user: Current user
+    :param repo: Request repositories
+    :param refresh_token: refresh token of this session, flags it as ``current``
+    :return: sessions
+    """
+    current = hash_refresh_token(refresh_token) if refresh_token else None
+    sessions = await repo.token.list_sessions(user_id=user.id)
+    return [
+        SessionSchema.model_validate(session).model_copy(update={"current": session.token_hash == current})
+        for session in sessions
+    ]
+
+
+@router.delete("/me/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_session(session_id: int, user: CurrentUserDep, repo: RepoRequestDep):
+    """
+    Sign a device out, its refresh token stops working and the access tokens issued so far are revoked,
+    the devices still signed in get a new one on their next request
+    :param session_id: id from the sessions list
+    :param user: Current user
+    :param repo: Request repositories
+    """
+    if not await repo.token.revoke_session(user_id=user.id, session_id=session_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    await revocation_list.revoke_user(user.id)
+
+
+@router.delete("/me/sessions", response_model=RevokedSessionsSchema)
+async def revoke_all_sessions(user: CurrentUserDep, repo: RepoRequestDep, keep_current: bool = True,
+                              refresh_token: Annotated[str | None, Cookie()] = None):
+    """
+    Sign every device out in one statement, their access tokens are revoked too
+    :param user: Current user
+    :param repo: Request repositories
+    :param keep_current: keep the session of this request signed in
+    :param refresh_token: refresh token of this session
+    :return: number of revoked sessions
+    """
+    revoked = await repo.token.revoke_all_sessions(user_id=user.id,
+                                                   keep_token=refresh_token if keep_current else None)
+    await revocation_list.revoke_user(user.id)
+    await user_cache.invalidate_user(user.id)
+    return RevokedSessionsSchema(revoked=revoked)
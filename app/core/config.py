@@ -11,11 +11,88 @@ class Settings(BaseSettings):
     redis_url: str
     jwt_secret_key: str
     jwt_refresh_secret_key: str
+    jwt_backend: str = "hs256"  # "hs256" (built-in), "jose" (python-jose) or "asymmetric" (PyJWT)
+    jwt_algorithm: str = "EdDSA"  # asymmetric backend only: "EdDSA" or "ES256"
+    jwt_private_key_file: str | None = None
+    jwt_active_kid: str | None = None
+    jwt_public_key_files: dict[str, str] = {}  # kid -> PEM file, keep retired keys here during a rotation
+    token_decode_cache_size: int = 10_000  # verified access token payloads kept in memory, 0 disables
     access_token_expire_minutes: int = 15
     refresh_token_expire_days: int = 7
     cookie_secure: bool = True
     rate_limit_per_minute: int = 10
+    rate_limit_email_per_minute: int = 5
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "redis"  # "redis" or "memory", redis falls back to memory while unavailable
+    redis_socket_timeout: float = 0.5
+    database_replica_urls: list[str] = []  # read replicas for the user and refresh token lookups
+    db_replica_strategy: str = "round_robin"  # "round_robin" or "least_connections"
+    db_replica_retry_seconds: float = 30  # a failed replica is skipped for this long
+    db_retry_attempts: int = 2  # replays of a statement after a serialization or connection error
+    db_retry_backoff_seconds: float = 0.05  # first backoff, doubled on every attempt (with jitter)
+    db_echo: bool = False
+    db_pool_size: int = 20
+    db_max_overflow: int = 200
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = False
+    db_query_cache_size: int = 1200
+    db_statement_cache_size: int = 100  # asyncpg server side statement cache per connection
+    db_prepared_statement_cache_size: int = 100  # sqlalchemy asyncpg prepared statement cache per connection
+    password_hash_executor: str = "thread"  # "thread" or "process"
+    password_hash_workers: int | None = None
+    password_hash_max_concurrency: int | None = None
+    # run `python -m app.services.hash_calibration` on the deployment host to pick these
+    password_hash_scheme: str = "bcrypt"  # "bcrypt" or "argon2" (argon2id, needs argon2-cffi)
+    password_bcrypt_rounds: int = 12
+    password_argon2_time_cost: int = 3
+    password_argon2_memory_cost: int = 65536  # KiB
+    password_argon2_parallelism: int = 4
+    password_hash_budget_ms: int = 250  # target hash time used by the calibration
+    password_rehash_on_login: bool = True  # upgrade hashes with outdated parameters on successful signin
+    password_rehash_max_in_flight: int = 1  # background rehashes per worker, later logins upgrade the rest
+    user_cache_enabled: bool = True
+    user_cache_backend: str = "memory"  # "memory" or "redis" (memory in front of a shared redis tier)
+    user_cache_max_size: int = 10_000
+    user_cache_ttl_seconds: int = 60
+    stateless_access_tokens: bool = False  # trust identity claims of access tokens, no user SELECT
+    revocation_backend: str = "redis"  # "redis" or "memory" (single worker)
+    revocation_sync_interval_seconds: float = 5
+    # emails/usernames ever registered, signin for an unknown address skips the database
+    identity_filter_backend: str = "redis"  # "redis" (shared), "memory" (single worker) or "off"
+    identity_filter_capacity: int = 1_000_000
+    identity_filter_error_rate: float = 0.001
+    identity_filter_sync_interval_seconds: float = 5
+    identity_filter_resync_window: int = 1000  # ids below the last seen one read again, for late commits
+    user_import_chunk_size: int = 1000
+    user_import_workers: int | None = None  # hashing processes of the command line, defaults to the CPUs
+    user_import_hash_batch_size: int = 10  # passwords per hasher job, a login waits for one job at most
+    user_export_batch_size: int = 1000  # rows fetched per server side cursor round trip
+    signup_taken_cache_size: int = 10_000  # recently seen emails/usernames, a signup for one skips bcrypt
+    signup_taken_cache_ttl_seconds: int = 300
+    refresh_token_backend: str = "sql"  # "sql" (refresh_tokens table) or "redis" (keys expire with the tokens)
+    max_sessions_per_user: int = 10  # active refresh tokens per user, signin revokes the oldest, 0 = no cap
+    token_reaper_enabled: bool = True
+    token_reaper_interval_seconds: int = 3600
+    token_reaper_batch_size: int = 1000
+    token_reaper_batch_sleep_seconds: float = 0.1
+    token_reaper_retention_hours: int = 24
+    # production server, python -m app.server
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    server_workers: int | None = None  # defaults to the number of CPUs, password hashing is CPU bound
+    server_loop: str = "auto"  # "auto" (uvloop when installed), "uvloop" or "asyncio"
+    server_http: str = "auto"  # "auto" (httptools when installed), "httptools" or "h11"
+    server_graceful_timeout_seconds: int = 30  # on SIGTERM in-flight requests get this long before shutdown
+    server_keepalive_seconds: int = 5
+    server_backlog: int = 2048
+    server_limit_concurrency: int | None = None  # per worker, connections above it get 503
+    server_max_requests: int | None = None  # restart a worker after this many requests
+    server_access_log: bool = True
+    server_forwarded_allow_ips: str = "127.0.0.1"  # proxies trusted for X-Forwarded-For/Proto
     log_level: str = "INFO"
+    log_format: str = "text"  # "text" (colored on a terminal) or "json", one object per line
+    log_rate_limits: dict[str, int] = {"app": 100}  # records per second per call site by logger, 0 = unlimited
     is_production: bool = False
     ENV:str="production"
 
@@ -34,7 +111,6 @@ class Settings(BaseSettings):
 def get_settings(env: str | None = None) -> Settings:
 
     env = os.environ.get("ENV")
-    logging.info(f"From Conf ENV: {env}")
     if env == "test":
         return Settings(
             database_url="sqlite+aiosqlite:///:memory:",
@@ -43,45 +119,19 @@ def get_settings(env: str | None = None) -> Settings:
             jwt_secret_key="test-secret",
             jwt_refresh_secret_key="test-refresh-secret",
             is_production=False,
+            token_reaper_enabled=False,
+            rate_limit_backend="memory",
+            revocation_backend="memory",
+            identity_filter_backend="memory",
+            identity_filter_sync_interval_seconds=3600,  # built once, tests sync their own filters
+            rate_limit_per_minute=1000,
+            rate_limit_email_per_minute=1000,
             log_level="DEBUG"
         )
     else:
         return Settings()
 
 
-import logging
-import sys
-import coloredlogs
-
-
-def setup_logging(debug: bool = False):
-    log_level = logging.DEBUG if debug else logging.INFO
-    logger = logging.getLogger()
-
-    logger.setLevel(log_level)
-    logger.propagate = False
-
-    if not logger.handlers:
-        handler = logging.StreamHandler()
-        logger.addHandler(handler)
-
-    coloredlogs.install(
-        level=log_level,
-        logger=logger,
-        fmt="%(asctime)s | %(name)s | %(filename)s:%(lineno)d | %(levelname)-8s | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        isatty=True,
-        force_color=True,
-        level_styles={
-            'debug': {'color': 'blue'},
-            'info': {'color': 'green'},
-            'warning': {'color': 'yellow'},
-            'error': {'color': 'red'},
-            'critical': {'color': 'red', 'bold': True},
-        }
-    )
-
-    return logger
-
 
-logger = setup_logging(debug=True)
+# Modules log through this logger, handlers are only installed by ``app.core.log.setup_logging`` at startup
+logger = logging.getLogger("app")
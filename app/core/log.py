@@ -0,0 +1,207 @@
+"""
+Logging pipeline: one setup for the API and the CLIs.
+
+Records are handed to a ``QueueHandler`` on the root logger and written by a ``QueueListener`` thread, so a slow
+stdout (full pipe, log shipper back-pressure) never blocks the event loop. Output is colored text for a terminal
+or one JSON object per line for production. High-frequency call sites are rate limited before they are queued.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, UTC
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = "%(asctime)s | %(name)s | %(filename)s:%(lineno)d | %(levelname)-8s | %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+LEVEL_STYLES = {
+    'debug': {'color': 'blue'},
+    'info': {'color': 'green'},
+    'warning': {'color': 'yellow'},
+    'error': {'color': 'red'},
+    'critical': {'color': 'red', 'bold': True},
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, ``extra`` fields included"""
+
+    # attributes every LogRecord has, anything else was passed with ``extra``
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """
+    ``QueueHandler`` that leaves the formatting to the listener's formatter: the stock ``prepare`` renders the
+    whole record, traceback included, into ``msg``. Here only the arguments are merged into the message and the
+    traceback is rendered to ``exc_text`` (the frames don't cross to the listener thread), so the json output
+    keeps ``message`` and ``exc`` apart.
+    """
+
+    traceback_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most ``limit`` records per second through for each call site (logger, file and line), so a hot
+    path logging on every request can't flood the output. The first record let through after a throttled
+    second carries the number of dropped ones (``suppressed``). Errors are never dropped.
+
+    :param limits: records per second by logger name, a logger without an entry uses its closest parent's,
+        0 disables the limit for that logger
+    """
+
+    def __init__(self, limits: dict[str, int]):
+        super().__init__()
+        self.limits = limits
+        self._windows: dict[tuple, list] = {}  # call site -> [window start, records in window, suppressed]
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def limit_for(self, name: str) -> int:
+        while True:
+            if name in self.limits:
+                return self.limits[name]
+            if "." not in name:
+                return self.limits.get("", 0)
+            name = name.rsplit(".", 1)[0]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        limit = self.limit_for(record.name)
+        if not limit:
+            return True
+
+        now = time.monotonic()
+        key = (record.name, record.pathname, record.lineno)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= 1:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                    record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+                return True
+            if window[1] < limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            self.dropped += 1
+            return False
+
+
+class LogPipeline:
+    """The queue handler installed on the root logger and the listener thread writing its records"""
+
+    def __init__(self):
+        self.queue: queue.SimpleQueue | None = None
+        self.listener: QueueListener | None = None
+        self.rate_limit: RateLimitFilter | None = None
+        self.handled = 0
+        atexit.register(self.stop)  # the listener thread is a daemon, write what is still queued at exit
+
+    def _formatter(self, fmt: str, stream) -> logging.Formatter:
+        if fmt == "json":
+            return JsonFormatter()
+        if stream.isatty():
+            import coloredlogs  # pulls in humanfriendly, only worth it for a terminal
+
+            return coloredlogs.ColoredFormatter(fmt=TEXT_FORMAT, datefmt=DATE_FORMAT, level_styles=LEVEL_STYLES)
+        return logging.Formatter(fmt=TEXT_FORMAT, datefmt=DATE_FORMAT)
+
+    def start(self, level: str = "INFO", fmt: str = "text", rate_limits: dict[str, int] | None = None,
+              stream=None):
+        """
+        Route the root logger through the queue, replacing the handlers installed before (a previous
+        ``start``, ``basicConfig``). Calling it again reconfigures the pipeline.
+
+        :param level: root level, "DEBUG" or "INFO"
+        :param fmt: "text" or "json"
+        :param rate_limits: records per second per call site by logger name, see ``RateLimitFilter``
+        :param stream: where the records are written, stdout by default
+        """
+        self.stop()
+        stream = stream or sys.stdout
+        output = logging.StreamHandler(stream)
+        output.setFormatter(self._formatter(fmt, stream))
+
+        self.queue = queue.SimpleQueue()
+        handler = StructuredQueueHandler(self.queue)
+        self.rate_limit = RateLimitFilter(rate_limits or {})
+        handler.addFilter(self.rate_limit)
+        handler.addFilter(self._count)
+
+        root = logging.getLogger()
+        for existing in root.handlers[:]:
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG if level == "DEBUG" else logging.INFO)
+
+        self.listener = QueueListener(self.queue, output, respect_handler_level=True)
+        self.listener.start()
+
+    def _count(self, record: logging.LogRecord) -> bool:
+        self.handled += 1
+        return True
+
+    def stop(self):
+        """Write the queued records and stop the listener thread, the root logger is left without handlers"""
+        if self.listener is None:
+            return
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            if isinstance(handler, QueueHandler) and handler.queue is self.queue:
+                root.removeHandler(handler)
+        self.listener.stop()
+        self.listener = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self.listener is not None,
+            "records": self.handled,
+            "rate_limited": self.rate_limit.dropped if self.rate_limit else 0,
+        }
+
+
+log_pipeline = LogPipeline()
+
+
+def setup_logging(settings):
+    """Start the pipeline with the logging settings (``log_level``, ``log_format``, ``log_rate_limits``)"""
+    log_pipeline.start(settings.log_level, settings.log_format, settings.log_rate_limits)
+    return log_pipeline
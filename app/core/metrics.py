@@ -0,0 +1,143 @@
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+from starlette.responses import Response
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+
+STAGE_LATENCY = Histogram(
+    "auth_stage_duration_seconds",
+    "Latency of the auth pipeline stages (password hashing, repo calls, token signing)",
+    ["stage"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection",
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30),
+)
+
+DB_STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds",
+    "Latency of the repo statements by statement kind and outcome",
+    ["statement", "outcome"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+
+DB_RETRIES = Counter(
+    "db_statement_retries",
+    "Repo statements replayed after a serialization or connection error",
+    ["statement", "reason"],
+)
+
+PASSWORD_REHASHES = Counter(
+    "password_rehashes",
+    "Password hashes upgraded on login, by outcome (updated, stale when the password changed meanwhile, failed, "
+    "deferred to a later login when the hasher is busy)",
+    ["outcome"],
+)
+
+
+@contextmanager
+def timer(stage: str):
+    """Observe the duration of the block in the stage histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+
+def timed(stage: str):
+    """Decorator version of ``timer``, works for sync and async functions"""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class StatsCollector:
+    """
+    Export the ``stats()`` dictionaries of in-process components (hasher pool, caches, reaper, db pool)
+    as gauges named ``<prefix>_<key>``, non numeric values are skipped.
+    """
+
+    def __init__(self):
+        self._sources: dict[str, Callable[[], dict]] = {}
+
+    def register(self, prefix: str, stats: Callable[[], dict]):
+        self._sources[prefix] = stats
+
+    def collect(self):
+        for prefix, stats in self._sources.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield GaugeMetricFamily(f"{prefix}_{key}", f"{prefix} {key.replace('_', ' ')}", value=value)
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording the latency of every HTTP request, labelled by route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status_code)
+            ).observe(time.perf_counter() - start)
+
+
+def metrics_response() -> Response:
+    """Render the metrics, aggregated across workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client.multiprocess import MultiProcessCollector
+
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        registry.register(stats_collector)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
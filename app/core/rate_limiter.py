@@ -0,0 +1,145 @@
+import math
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request, status
+
+from app.core.config import get_settings, logger
+from app.core.redis import get_redis
+
+settings = get_settings()
+
+# Sliding window log: one sorted set member per accepted hit, scored by its time in milliseconds.
+# KEYS[1] = bucket key, ARGV = now (ms), window (ms), limit, unique member
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local count = redis.call('ZCARD', key)
+if count < limit then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, window)
+    return {1, limit - count - 1, 0}
+end
+
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, 0, tonumber(oldest[2]) + window - now}
+"""
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    remaining: int
+    retry_after: float  # seconds
+
+
+class TokenBucket:
+    """
+    In-process token bucket, used when redis is not configured or unavailable.
+    Each key refills ``limit`` tokens per ``window`` seconds, at most ``max_keys`` keys are tracked (LRU).
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100_000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def hit(self, key: str) -> RateLimitResult:
+        rate = self.limit / self.window
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(self.limit), now))
+        tokens = min(float(self.limit), tokens + (now - updated) * rate)
+
+        if tokens >= 1:
+            result = RateLimitResult(allowed=True, remaining=int(tokens - 1), retry_after=0)
+            tokens -= 1
+        else:
+            result = RateLimitResult(allowed=False, remaining=0, retry_after=(1 - tokens) / rate)
+
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return result
+
+
+class RateLimiter:
+    """
+    Allow ``limit`` hits per ``window`` seconds per key.
+
+    With a redis client the limit is shared by every worker through an atomic sliding window script,
+    if redis fails the limiter switches to a local token bucket and retries redis after ``redis_retry`` seconds.
+    :param name: key namespace, e.g. "ip" or "email"
+    """
+
+    def __init__(self, name: str, limit: int, window: float = 60, redis=None, redis_retry: float = 5):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.redis = redis
+        self.redis_retry = redis_retry
+        self.fallback = TokenBucket(limit, window)
+        self._script = None
+        self._redis_down_until = 0.0
+
+    def _key(self, key: str) -> str:
+        return f"rate_limit:{self.name}:{key}"
+
+    async def _hit_redis(self, key: str) -> RateLimitResult:
+        if self._script is None:
+            self._script = self.redis.register_script(SLIDING_WINDOW_LUA)
+        now_ms = int(time.time() * 1000)
+        allowed, remaining, retry_after_ms = await self._script(
+            keys=[self._key(key)],
+            args=[now_ms, int(self.window * 1000), self.limit, f"{now_ms}-{uuid.uuid4().hex}"],
+        )
+        return RateLimitResult(allowed=bool(allowed), remaining=int(remaining),
+                               retry_after=max(0.0, float(retry_after_ms) / 1000))
+
+    async def hit(self, key: str) -> RateLimitResult:
+        """Record a hit for ``key`` and tell whether it is allowed"""
+        if self.redis is not None and time.monotonic() >= self._redis_down_until:
+            try:
+                return await self._hit_redis(key)
+            except Exception as exc:
+                logger.warning("Rate limiter redis unavailable, using local buckets: %s", exc)
+                self._redis_down_until = time.monotonic() + self.redis_retry
+        return self.fallback.hit(self._key(key))
+
+    async def check(self, key: str):
+        """Record a hit and raise 429 with a ``Retry-After`` header when the limit is exceeded"""
+        result = await self.hit(key)
+        if not result.allowed:
+            logger.warning("Rate limit exceeded for %s:%s", self.name, key)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(result.retry_after))},
+            )
+
+
+def _create_limiter(name: str, limit: int) -> RateLimiter:
+    redis = get_redis() if settings.rate_limit_backend == "redis" else None
+    return RateLimiter(name=name, limit=limit, window=60, redis=redis)
+
+
+ip_rate_limiter = _create_limiter("ip", settings.rate_limit_per_minute)
+email_rate_limiter = _create_limiter("email", settings.rate_limit_email_per_minute)
+
+
+async def rate_limit_by_ip(request: Request):
+    """Dependency that limits requests per client IP"""
+    if settings.rate_limit_enabled and request.client is not None:
+        await ip_rate_limiter.check(request.client.host)
+
+
+async def rate_limit_by_email(email: str):
+    """Limit sign-in attempts per account email"""
+    if settings.rate_limit_enabled:
+        await email_rate_limiter.check(email.strip().lower())
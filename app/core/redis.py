@@ -0,0 +1,24 @@
+from functools import lru_cache
+
+from app.core.config import get_settings, logger
+
+
+@lru_cache()
+def get_redis():
+    """
+    Return the shared async redis client built from ``settings.redis_url``.
+    The connection is opened lazily on the first command, returns None if the redis package is missing.
+    """
+    try:
+        from redis import asyncio as aioredis
+    except ImportError:
+        logger.warning("redis package is not installed, redis backed features are disabled")
+        return None
+
+    settings = get_settings()
+    return aioredis.from_url(
+        settings.redis_url,
+        decode_responses=True,
+        socket_timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_socket_timeout,
+    )
@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+from app.core.config import get_settings, logger
+from app.core.redis import get_redis
+from app.utils.bloom import BloomFilter
+
+settings = get_settings()
+
+
+class AccessTokenRevocationList:
+    """
+    Revoked access tokens (by ``jti``) kept in memory so checking a token never leaves the process.
+
+    Lookups go through a bloom filter first, only bloom hits are confirmed against the exact set.
+    Revocations are published to a redis sorted set scored by token expiry; every worker reloads it
+    each ``sync_interval`` seconds, so a logout takes effect everywhere within that window.
+
+    Signing devices out revokes every access token of the user issued before that moment ("not before"),
+    kept in a second sorted set scored by the cutoff until the last token it covers expired.
+    :param token_ttl: lifetime of an access token in seconds, how long a user cutoff is kept
+    """
+
+    REDIS_KEY = "revoked_access_tokens"
+    USERS_REDIS_KEY = "revoked_access_users"
+
+    def __init__(self, redis=None, sync_interval: float = 5, capacity: int = 100_000, error_rate: float = 0.001,
+                 token_ttl: float = 900):
+        self.redis = redis
+        self.sync_interval = sync_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.token_ttl = token_ttl
+        self._revoked: dict[str, float] = {}
+        self._not_before: dict[str, float] = {}
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._task: asyncio.Task | None = None
+
+    def _rebuild(self, revoked: dict[str, float]):
+        bloom = BloomFilter(max(self.capacity, len(revoked)), self.error_rate)
+        for jti in revoked:
+            bloom.add(jti)
+        self._revoked, self._bloom = revoked, bloom
+
+    def is_revoked(self, jti: str) -> bool:
+        if jti not in self._bloom:
+            return False
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    async def revoke(self, jti: str, expires_at: float):
+        """Revoke the token locally right away and publish it for the other workers"""
+        if expires_at <= time.time():
+            return
+        self._revoked[jti] = expires_at
+        self._bloom.add(jti)
+
+        if self.redis is not None:
+            try:
+                await self.redis.zadd(self.REDIS_KEY, {jti: expires_at})
+            except Exception as exc:
+                logger.warning("Failed to publish access token revocation: %s", exc)
+
+    def is_revoked_for_user(self, user_id: int, issued_at: float | None) -> bool:
+        """True if the token was issued before the user's sessions were revoked, tokens without iat included"""
+        not_before = self._not_before.get(str(user_id))
+        return not_before is not None and (issued_at or 0) < not_before
+
+    async def revoke_user(self, user_id: int):
+        """Revoke every access token of the user issued until now, locally right away and for the other workers"""
+        now = time.time()
+        self._not_before[str(user_id)] = now
+
+        if self.redis is not None:
+            try:
+                await self.redis.zadd(self.USERS_REDIS_KEY, {str(user_id): now}, gt=True)
+            except Exception as exc:
+                logger.warning("Failed to publish access token revocation of user %s: %s", user_id, exc)
+
+    async def sync(self):
+        """Drop expired entries and reload the shared list from redis"""
+        now = time.time()
+        shared, shared_users = {}, {}
+        if self.redis is not None:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zremrangebyscore(self.REDIS_KEY, "-inf", now)
+                pipe.zrange(self.REDIS_KEY, 0, -1, withscores=True)
+                pipe.zremrangebyscore(self.USERS_REDIS_KEY, "-inf", now - self.token_ttl)
+                pipe.zrange(self.USERS_REDIS_KEY, 0, -1, withscores=True)
+                _, shared, _, shared_users = await pipe.execute()
+
+        # read the local entries after the await, a revoke() made meanwhile may not be in the redis snapshot
+        revoked = {jti: expires_at for jti, expires_at in self._revoked.items() if expires_at > now}
+        revoked.update(dict(shared))
+        self._rebuild(revoked)
+        not_before = {user_id: cutoff for user_id, cutoff in self._not_before.items()
+                      if cutoff > now - self.token_ttl}
+        for user_id, cutoff in shared_users:
+            not_before[user_id] = max(cutoff, not_before.get(user_id, 0))
+        self._not_before = not_before
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as exc:
+                logger.warning("Access token revocation sync failed: %s", exc)
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever(), name="revocation-sync")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "revoked": len(self._revoked),
+            "revoked_users": len(self._not_before),
+            "bloom_bytes": self._bloom.memory_bytes,
+            "bloom_false_positive_rate": self._bloom.false_positive_rate(),
+        }
+
+
+revocation_list = AccessTokenRevocationList(
+    redis=get_redis() if settings.revocation_backend == "redis" else None,
+    sync_interval=settings.revocation_sync_interval_seconds,
+    token_ttl=settings.access_token_expire_minutes * 60,
+)
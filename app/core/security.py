@@ -1,18 +1,63 @@
+import asyncio
 import hashlib
+import os
+import re
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, UTC
+from functools import lru_cache
 
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import get_settings
+from app.core.metrics import timer, timed
+from app.core.tokens import TokenCodec, CachedTokenCodec, create_codec
 
 settings = get_settings()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/signin")
 
-pwd_context = CryptContext(
-    schemes=["bcrypt"],
-    bcrypt__ident="2b",
-    deprecated="auto",
+
+
+def build_pwd_context(scheme: str = "bcrypt", bcrypt_rounds: int = 12, argon2_time_cost: int = 3,
+                      argon2_memory_cost: int = 65536, argon2_parallelism: int = 4) -> CryptContext:
+    """
+    New passwords are hashed with ``scheme`` and its parameters, bcrypt hashes stay verifiable when argon2 is
+    configured. A stored hash made with another scheme or other parameters is reported by ``needs_update`` and
+    replaced on the next successful login, see ``AuthService.authenticate_user``.
+    :param scheme: "bcrypt" or "argon2" (argon2id, needs argon2-cffi)
+    """
+    if scheme == "bcrypt":
+        return CryptContext(
+            schemes=["bcrypt"],
+            bcrypt__ident="2b",
+            bcrypt__default_rounds=bcrypt_rounds,
+            bcrypt__min_rounds=bcrypt_rounds,
+            bcrypt__max_rounds=bcrypt_rounds,
+            deprecated="auto",
+        )
+    if scheme == "argon2":
+        from passlib.hash import argon2
+
+        if not argon2.has_backend():
+            raise RuntimeError('password_hash_scheme="argon2" requires: pip install argon2-cffi')
+        return CryptContext(
+            schemes=["argon2", "bcrypt"],
+            bcrypt__ident="2b",
+            argon2__type="ID",
+            argon2__time_cost=argon2_time_cost,
+            argon2__memory_cost=argon2_memory_cost,
+            argon2__parallelism=argon2_parallelism,
+            deprecated="auto",
+        )
+    raise ValueError(f"Unknown password hash scheme: {scheme}")
+
+
+pwd_context = build_pwd_context(
+    settings.password_hash_scheme,
+    bcrypt_rounds=settings.password_bcrypt_rounds,
+    argon2_time_cost=settings.password_argon2_time_cost,
+    argon2_memory_cost=settings.password_argon2_memory_cost,
+    argon2_parallelism=settings.password_argon2_parallelism,
 )
 
 
@@ -36,46 +81,213 @@ def hash_password(password: str) -> str:
     return pwd_context.hash(normalized)
 
 
+# Bcrypt digests imported from other systems hash the raw password, not our sha256 normalized form
+IMPORTED_HASH_PREFIX = "imported:"
+BCRYPT_HASH_PATTERN = re.compile(r"^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$")
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """This Function is used to verify the password"""
+    if hashed_password.startswith(IMPORTED_HASH_PREFIX):
+        return pwd_context.verify(plain_password, hashed_password.removeprefix(IMPORTED_HASH_PREFIX))
     normalized = _normalize_password(plain_password)
     return pwd_context.verify(normalized, hashed_password)
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True when the hash was imported or made with another scheme/cost than the configured one"""
+    return hashed_password.startswith(IMPORTED_HASH_PREFIX) or pwd_context.needs_update(hashed_password)
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """Hash a batch of passwords, one executor job per batch keeps process pool overhead low"""
+    return [hash_password(password) for password in passwords]
+
+
+def mark_imported_hash(bcrypt_hash: str) -> str:
+    """Store an external bcrypt digest so ``verify_password`` checks it against the raw password"""
+    if not BCRYPT_HASH_PATTERN.match(bcrypt_hash):
+        raise ValueError("hashed_password is not a bcrypt digest")
+    return IMPORTED_HASH_PREFIX + bcrypt_hash
+
+
+class PasswordHasherPool:
+    """
+    Run bcrypt hashing and verification on a bounded worker pool so they never block the event loop.
+
+    At most ``max_concurrency`` jobs are handed to the executor at once, the rest wait on a semaphore;
+    ``queue_depth`` is the number of callers currently waiting for a slot.
+    :param executor: "thread" or "process"
+    :param max_workers: executor size, defaults to the number of CPUs (at most 4)
+    :param max_concurrency: in-flight jobs cap, defaults to ``max_workers``
+    """
+
+    def __init__(self, executor: str = "thread", max_workers: int | None = None,
+                 max_concurrency: int | None = None):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor: {executor}")
+        self.executor_kind = executor
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_concurrency = max_concurrency or self.max_workers
+        self.queue_depth = 0
+        self.in_flight = 0
+        self._executor: Executor | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pwd-hash")
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # A semaphore is bound to the loop it first waits on, recreate it when the loop changes (tests, reload)
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def run(self, func, *args):
+        """Run ``func(*args)`` on the pool once a concurrency slot is free"""
+        semaphore = self._get_semaphore()
+        self.queue_depth += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+
+        self.in_flight += 1
+        try:
+            return await self._loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.executor_kind,
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+        }
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+password_hasher = PasswordHasherPool(
+    executor=settings.password_hash_executor,
+    max_workers=settings.password_hash_workers,
+    max_concurrency=settings.password_hash_max_concurrency,
+)
+
+
+async def hash_password_async(password: str) -> str:
+    """Same as ``hash_password`` but runs on the password hasher pool"""
+    with timer("hash_password"):
+        return await password_hasher.run(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Same as ``verify_password`` but runs on the password hasher pool"""
+    with timer("verify_password"):
+        return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
+@lru_cache()
+def _dummy_password_hash() -> str:
+    return hash_password(uuid.uuid4().hex)
+
+
+def verify_dummy_password(plain_password: str) -> bool:
+    """Verify against the hash of a random password: a signin for an unknown user takes as long as a real one"""
+    verify_password(plain_password, _dummy_password_hash())
+    return False
+
+
+async def verify_dummy_password_async(plain_password: str) -> bool:
+    with timer("verify_password"):
+        return await password_hasher.run(verify_dummy_password, plain_password)
+
+
+# Access tokens may use an asymmetric key (verifiable by other services), refresh tokens are only
+# verified here and stay on HMAC ("jose" keeps python-jose, anything else uses the built-in HS256 codec)
+access_token_codec: TokenCodec = create_codec(
+    settings.jwt_backend,
+    secret=settings.jwt_secret_key,
+    algorithm=settings.jwt_algorithm,
+    private_key_file=settings.jwt_private_key_file,
+    active_kid=settings.jwt_active_kid,
+    public_key_files=settings.jwt_public_key_files,
+)
+if settings.token_decode_cache_size > 0:
+    access_token_codec = CachedTokenCodec(access_token_codec, max_size=settings.token_decode_cache_size)
+
+refresh_token_codec: TokenCodec = create_codec(
+    "jose" if settings.jwt_backend == "jose" else "hs256",
+    secret=settings.jwt_refresh_secret_key,
+)
+
+
 def decode_token(token: str) -> dict:
-    """This function is used to decode the token"""
-    return jwt.decode(token, settings.jwt_secret_key, algorithms=["HS256"])
+    """This function is used to decode the token, raises ``TokenError``/``ExpiredTokenError``"""
+    return access_token_codec.decode(token)
+
 
+def decode_refresh_token(token: str) -> dict:
+    """This function is used to decode the refresh token, raises ``TokenError``/``ExpiredTokenError``"""
+    return refresh_token_codec.decode(token)
 
-def _create_token(data: dict, expires_data: timedelta, secret_kry: str) -> str:
-    """This function is used to create a new token"""
+
+def hash_refresh_token(token: str) -> str:
+    """Refresh tokens are stored and looked up by their fixed width SHA-256 hex digest, never in clear"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def token_id(payload: dict, token: str) -> str:
+    """Return the ``jti`` of the token, tokens issued without one are identified by their signature"""
+    return payload.get("jti") or token.rsplit(".", 1)[-1]
+
+
+@timed("create_token")
+def _create_token(data: dict, expires_data: timedelta, codec: TokenCodec) -> str:
+    """This function is used to create a new token, every token gets a unique ``jti``"""
     to_encode = data.copy()
-    expire = datetime.now(UTC) + expires_data
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, secret_kry, algorithm="HS256")
+    now = datetime.now(UTC)
+    # iat keeps its fraction, a token issued right after the user's sessions were revoked is not covered
+    to_encode.update({"exp": now + expires_data, "iat": now.timestamp()})
+    to_encode.setdefault("jti", uuid.uuid4().hex)
+    return codec.encode(to_encode)
 
 
 def create_access_token(data: dict,
-                        expires_data: timedelta = timedelta(settings.access_token_expire_minutes),
-                        secret_kry: str = settings.jwt_secret_key) -> str:
+                        expires_data: timedelta = timedelta(minutes=settings.access_token_expire_minutes),
+                        codec: TokenCodec = access_token_codec) -> str:
     """This function is used to create a new access token, default access token expire time is 15 minutes
     :param data:
     :param expires_data: Default expires time is 15 minutes
-    :param secret_kry:
+    :param codec:
     """
     return _create_token(data,
                          expires_data=expires_data,
-                         secret_kry=secret_kry)
+                         codec=codec)
 
 
 def create_refresh_token(data: dict,
-                         expires_data: timedelta = timedelta(settings.refresh_token_expire_days),
-                         secret_kry: str = settings.jwt_refresh_secret_key) -> str:
-    """This function is used to create a new refresh token, default refresh token expire time is 7 days
+                         expires_data: timedelta | None = None,
+                         codec: TokenCodec = refresh_token_codec) -> str:
+    """This function is used to create a new refresh token, it expires with the stored session
     :param data:
-    :param expires_data: Default expires time is 7 days
-    :param secret_kry:
+    :param expires_data: Default expires time is ``settings.refresh_token_expire_days``
+    :param codec:
     """
     return _create_token(data,
-                         expires_data=expires_data,
-                         secret_kry=secret_kry)
+                         expires_data=expires_data or timedelta(days=settings.refresh_token_expire_days),
+                         codec=codec)
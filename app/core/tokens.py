@@ -0,0 +1,224 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Protocol
+
+
+class TokenError(Exception):
+    """The token is malformed, has a bad signature or unexpected algorithm"""
+
+
+class ExpiredTokenError(TokenError):
+    """The token signature is valid but its ``exp`` is in the past"""
+
+
+class TokenCodec(Protocol):
+    def encode(self, claims: dict) -> str:
+        ...
+
+    def decode(self, token: str) -> dict:
+        ...
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _numeric_dates(claims: dict) -> dict:
+    return {key: int(value.timestamp()) if isinstance(value, datetime) else value for key, value in claims.items()}
+
+
+def _check_exp(payload: dict):
+    exp = payload.get("exp")
+    if exp is not None:
+        if not isinstance(exp, (int, float)):
+            raise TokenError("Invalid exp claim")
+        if exp <= time.time():
+            raise ExpiredTokenError("Signature has expired")
+
+
+class HS256Codec:
+    """
+    Hand rolled HS256 JWT codec.
+
+    The HMAC key schedule and the encoded header segment are computed once, encoding and verifying a token
+    is a ``hmac.copy()``, one json dump/load and base64. Tokens are interchangeable with python-jose/PyJWT.
+    """
+
+    HEADER = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode())
+
+    def __init__(self, secret: str):
+        self._mac = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return mac.digest()
+
+    def encode(self, claims: dict) -> str:
+        payload = _b64encode(json.dumps(_numeric_dates(claims), separators=(",", ":")).encode())
+        signing_input = self.HEADER + b"." + payload
+        return (signing_input + b"." + _b64encode(self._sign(signing_input))).decode("ascii")
+
+    def decode(self, token: str) -> dict:
+        try:
+            header, payload, signature = token.split(".")
+            if header.encode("ascii") != self.HEADER and json.loads(_b64decode(header)).get("alg") != "HS256":
+                raise TokenError("Unexpected token algorithm")
+            expected = self._sign(f"{header}.{payload}".encode("ascii"))
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                raise TokenError("Signature verification failed")
+            claims = json.loads(_b64decode(payload))
+        except TokenError:
+            raise
+        except (ValueError, UnicodeError, AttributeError) as exc:
+            raise TokenError(f"Malformed token: {exc}") from exc
+        if not isinstance(claims, dict):
+            raise TokenError("Malformed token payload")
+        _check_exp(claims)
+        return claims
+
+
+class JoseCodec:
+    """The previous python-jose implementation, kept for comparison and as a fallback"""
+
+    def __init__(self, key: str, algorithm: str = "HS256"):
+        from jose import jwt
+
+        self._jwt = jwt
+        self.key = key
+        self.algorithm = algorithm
+
+    def encode(self, claims: dict) -> str:
+        return self._jwt.encode(claims, self.key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        from jose import ExpiredSignatureError, JWTError
+
+        try:
+            return self._jwt.decode(token, self.key, algorithms=[self.algorithm])
+        except ExpiredSignatureError as exc:
+            raise ExpiredTokenError(str(exc)) from exc
+        except JWTError as exc:
+            raise TokenError(str(exc)) from exc
+
+
+class AsymmetricCodec:
+    """
+    EdDSA / ES256 codec with key ids, requires ``pip install "pyjwt[crypto]"``.
+
+    Tokens are signed with the private key of ``active_kid`` and carry it in the ``kid`` header, they are
+    verified with the public key of their ``kid`` so old keys keep verifying during a rotation.
+    :param private_key: PEM private key of the active key
+    :param public_keys: kid -> PEM public key, must contain ``active_kid``
+    """
+
+    def __init__(self, private_key: str, active_kid: str, public_keys: dict[str, str], algorithm: str = "EdDSA"):
+        try:
+            import jwt
+            from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+        except ImportError as exc:
+            raise RuntimeError('Asymmetric JWT signing requires: pip install "pyjwt[crypto]"') from exc
+
+        if algorithm not in ("EdDSA", "ES256"):
+            raise ValueError(f"Unsupported asymmetric algorithm: {algorithm}")
+        if active_kid not in public_keys:
+            raise ValueError(f"No public key for the active kid {active_kid}")
+
+        self._jwt = jwt
+        self.algorithm = algorithm
+        self.active_kid = active_kid
+        # Parse the PEM keys once, PyJWT would otherwise load them on every call
+        self._private_key = load_pem_private_key(private_key.encode(), password=None)
+        self._public_keys = {kid: load_pem_public_key(pem.encode()) for kid, pem in public_keys.items()}
+
+    def encode(self, claims: dict) -> str:
+        return self._jwt.encode(_numeric_dates(claims), self._private_key, algorithm=self.algorithm,
+                                headers={"kid": self.active_kid})
+
+    def decode(self, token: str) -> dict:
+        try:
+            kid = self._jwt.get_unverified_header(token).get("kid")
+            key = self._public_keys.get(kid)
+            if key is None:
+                raise TokenError(f"Unknown key id: {kid}")
+            return self._jwt.decode(token, key, algorithms=[self.algorithm])
+        except self._jwt.ExpiredSignatureError as exc:
+            raise ExpiredTokenError(str(exc)) from exc
+        except self._jwt.PyJWTError as exc:
+            raise TokenError(str(exc)) from exc
+
+
+class CachedTokenCodec:
+    """
+    Wrap a codec with a bounded LRU of verified payloads keyed by the raw token.
+
+    A chatty client sends the same access token on every request, a hit skips base64, json and the signature
+    check entirely. Entries are served until the token ``exp`` only, tokens without ``exp`` are not cached.
+    """
+
+    def __init__(self, codec: TokenCodec, max_size: int = 10_000):
+        self.codec = codec
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def encode(self, claims: dict) -> str:
+        return self.codec.encode(claims)
+
+    def decode(self, token: str) -> dict:
+        entry = self._entries.get(token)
+        if entry is not None:
+            exp, payload = entry
+            if exp > time.time():
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return dict(payload)
+            del self._entries[token]
+
+        self.misses += 1
+        payload = self.codec.decode(token)
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            self._entries[token] = (exp, dict(payload))
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return payload
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_codec(backend: str, secret: str, algorithm: str = "EdDSA", private_key_file: str | None = None,
+                 active_kid: str | None = None, public_key_files: dict[str, str] | None = None) -> TokenCodec:
+    """
+    Build a codec
+    :param backend: "hs256" (built-in HMAC), "jose" (python-jose HS256) or "asymmetric" (PyJWT EdDSA/ES256)
+    """
+    if backend == "hs256":
+        return HS256Codec(secret)
+    if backend == "jose":
+        return JoseCodec(secret)
+    if backend == "asymmetric":
+        if not private_key_file or not active_kid:
+            raise ValueError("Asymmetric JWT signing requires jwt_private_key_file and jwt_active_kid")
+        public_keys = {kid: Path(path).read_text() for kid, path in (public_key_files or {}).items()}
+        return AsymmetricCodec(Path(private_key_file).read_text(), active_kid, public_keys, algorithm)
+    raise ValueError(f"Unknown JWT backend: {backend}")
@@ -0,0 +1,62 @@
+"""
+Typed database errors raised by the repos instead of driver/SQLAlchemy exceptions.
+
+Callers can handle them without parsing messages, the API maps them to 409 / 503 / 504 in ``app.main``.
+"""
+from sqlalchemy.exc import DBAPIError, IntegrityError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+# PostgreSQL SQLSTATE codes
+SERIALIZATION_FAILURES = {"40001", "40P01"}  # serialization_failure, deadlock_detected
+QUERY_CANCELED = "57014"  # statement_timeout
+
+
+class RepoError(Exception):
+    """A database operation failed"""
+    retryable = False
+    outcome = "error"
+
+
+class ConflictError(RepoError):
+    """A unique or foreign key constraint rejected the write"""
+    outcome = "conflict"
+
+
+class SerializationError(RepoError):
+    """The transaction lost a serialization race or a deadlock, replaying it usually succeeds"""
+    retryable = True
+    outcome = "serialization"
+
+
+class UnavailableError(RepoError):
+    """The database can't be reached or dropped the connection"""
+    retryable = True
+    outcome = "unavailable"
+
+
+class RepoTimeoutError(RepoError):
+    """No pooled connection in time or the statement hit its timeout"""
+    outcome = "timeout"
+
+
+def _sqlstate(error: Exception) -> str | None:
+    orig = getattr(error, "orig", None)
+    return getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+
+
+def classify(error: Exception) -> RepoError:
+    """Map a driver/SQLAlchemy exception to the matching ``RepoError``, the message is kept"""
+    if isinstance(error, RepoError):
+        return error
+
+    sqlstate = _sqlstate(error)
+    if isinstance(error, IntegrityError) or (sqlstate or "").startswith("23"):
+        return ConflictError(str(error))
+    if isinstance(error, (PoolTimeoutError, TimeoutError)) or sqlstate == QUERY_CANCELED:
+        return RepoTimeoutError(str(error))
+    if sqlstate in SERIALIZATION_FAILURES:
+        return SerializationError(str(error))
+    if (isinstance(error, DBAPIError) and error.connection_invalidated) or isinstance(
+            error, (OperationalError, InterfaceError, OSError)):
+        return UnavailableError(str(error))
+    return RepoError(str(error))
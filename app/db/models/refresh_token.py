@@ -1,8 +1,7 @@
 import enum
 from datetime import timedelta, datetime, UTC
 
-from sqlalchemy import String, Enum, Boolean, DateTime, func, ForeignKey
-from sqlalchemy.dialects.postgresql import TIMESTAMP
+from sqlalchemy import String, Enum, Boolean, DateTime, Index, TIMESTAMP, func, ForeignKey
 from sqlalchemy.orm import Mapped, MappedColumn, relationship
 
 from .user import User
@@ -11,12 +10,17 @@ from ..setup import Base
 
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
+    __table_args__ = (
+        # active sessions of a user: WHERE user_id = ? AND is_revoked = false AND expire_at > now()
+        Index("ix_refresh_tokens_user_active", "user_id", "is_revoked", "expire_at"),
+    )
 
     id: Mapped[int] = MappedColumn(primary_key=True, unique=True, )
     user_id: Mapped[int] = MappedColumn(ForeignKey("users.id", ondelete="CASCADE"))
-    token: Mapped[str] = MappedColumn(unique=True, index=True)
+    token_hash: Mapped[str] = MappedColumn(String(64), unique=True, index=True)  # sha256 hex digest of the token
     is_revoked: Mapped[bool] = MappedColumn(default=False)
     expire_at: Mapped[DateTime] = MappedColumn(TIMESTAMP(True),nullable=False)
+    user_agent: Mapped[str | None] = MappedColumn(String(255), nullable=True)  # device of the session
     create_at: Mapped[DateTime] = MappedColumn(TIMESTAMP(True), server_default=func.now())
     update_at: Mapped[DateTime] = MappedColumn(TIMESTAMP(True), server_default=func.now(), onupdate=func.now())
 
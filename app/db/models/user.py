@@ -1,7 +1,6 @@
 import enum
 
-from sqlalchemy import String, Enum, Boolean, DateTime, func
-from sqlalchemy.dialects.postgresql import TIMESTAMP
+from sqlalchemy import String, Enum, Boolean, DateTime, Index, TIMESTAMP, func
 from sqlalchemy.orm import Mapped, MappedColumn, relationship
 
 from ..setup import Base
@@ -19,6 +18,10 @@ class Role(enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # keyset pages filtered by role: WHERE role = ? AND id > ? ORDER BY id
+        Index("ix_users_role_id", "role", "id"),
+    )
 
     id: Mapped[int] = MappedColumn(primary_key=True)
     username: Mapped[str] = MappedColumn(index=True, unique=True)
@@ -1,6 +1,158 @@
+import asyncio
+import inspect
+import random
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import Executable, Result, event
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings, logger
+from app.core.metrics import DB_RETRIES, DB_STATEMENT_LATENCY, timed
+from app.db.errors import UnavailableError, classify
+from app.db.routing import USE_REPLICA, is_write
+
+settings = get_settings()
+
+# Errors a statement can fail with, anything else is a bug and propagates as is
+DB_ERRORS = (SQLAlchemyError, OSError)
+
+# session.info key holding the transaction that wrote, a stale value (the transaction ended) means no writes
+WRITE_TRANSACTION = "write_transaction"
+
+
+def _mark_written(session: Session):
+    session.info[WRITE_TRANSACTION] = session.get_transaction()
+
+
+@event.listens_for(Session, "after_flush")
+def _flushed(session: Session, flush_context):
+    # ORM changes flushed (autoflush before a query included) are no longer in new/dirty/deleted
+    _mark_written(session)
 
 
 class BaseRepo:
     def __init__(self, session):
         self.session: AsyncSession = session
+
+    @property
+    def _grouped(self) -> bool:
+        """True inside ``transaction()``, commits are deferred to the end of the block"""
+        return self.session.info.get("grouped", False)
+
+    def _has_writes(self) -> bool:
+        """True when the open transaction wrote (Core statement or ORM flush) or has ORM changes pending"""
+        session = self.session
+        if session.new or session.dirty or session.deleted:
+            return True
+        written = session.info.get(WRITE_TRANSACTION)
+        return written is not None and written is session.sync_session.get_transaction()
+
+    async def _release(self):
+        """
+        Give the connection back to the pool right after a read instead of holding it until the request ends.
+        Loaded objects stay usable (sessions don't expire on commit). A transaction that wrote is left open,
+        only an explicit commit ends it.
+        """
+        session = self.session
+        if self._grouped:
+            return
+        if session.in_transaction() and not self._has_writes():
+            await self._commit()
+
+    async def _execute(self, stmt: Executable, *, replica: bool = False) -> Result:
+        """
+        Execute a statement, every repo query goes through here.
+
+        - the duration is observed in ``db_statement_duration_seconds`` by statement kind and outcome
+        - failures are rolled back and raised as typed ``RepoError`` (conflict, unavailable, timeout ...)
+        - a statement that opened its transaction is replayed with exponential backoff after a serialization
+          or connection error, statements of a running transaction are not (the earlier ones would be lost)
+        - ``replica=True`` lets a ``RoutingSession`` serve it from a replica, falling back to the primary
+          when the replica is unavailable
+        """
+        session = self.session
+        kind = stmt.__visit_name__
+        replayable = not session.in_transaction() and not self._grouped
+        if replica:
+            stmt = stmt.execution_options(**{USE_REPLICA: True})
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                result = await session.execute(stmt)
+                DB_STATEMENT_LATENCY.labels(kind, "ok").observe(time.perf_counter() - start)
+                if is_write(stmt):
+                    _mark_written(session.sync_session)
+                return result
+            except DB_ERRORS as e:
+                error = classify(e)
+                DB_STATEMENT_LATENCY.labels(kind, error.outcome).observe(time.perf_counter() - start)
+                failed_replica = session.sync_session.info.pop("replica", None)
+
+                if failed_replica is not None and isinstance(error, UnavailableError):
+                    session.sync_session.router.mark_failed(failed_replica)
+                    await session.rollback()
+                    stmt = stmt.execution_options(**{USE_REPLICA: False})
+                    DB_RETRIES.labels(kind, "replica").inc()
+                    continue
+
+                if not self._grouped:
+                    await session.rollback()
+                if replayable and error.retryable and attempt < settings.db_retry_attempts:
+                    attempt += 1
+                    DB_RETRIES.labels(kind, error.outcome).inc()
+                    backoff = settings.db_retry_backoff_seconds * 2 ** (attempt - 1)
+                    await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+                    continue
+
+                logger.error("Database error on %s: %s", kind, e)
+                raise error from e
+            finally:
+                session.sync_session.info.pop("replica", None)
+
+    async def _commit(self):
+        """Commit the current transaction, or nothing inside ``transaction()`` which commits at its end"""
+        if self._grouped:
+            return
+        try:
+            await self.session.commit()
+        except DB_ERRORS as e:
+            await self.session.rollback()
+            logger.error("Database error on commit: %s", e)
+            raise classify(e) from e
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Group the writes of several repo calls (of any repo on this session) in one transaction:
+            async with repo.transaction():
+                await repo.token.revoke_all_sessions(user_id)
+                await repo.token.save_refresh_token(user_id, token)
+        Commits once at the end of the block, rolls everything back if the block raises. Nested blocks join
+        the outer one.
+        """
+        info = self.session.info
+        if info.get("grouped"):
+            yield self
+            return
+
+        info["grouped"] = True
+        try:
+            yield self
+        except BaseException:
+            info["grouped"] = False
+            await self.session.rollback()
+            raise
+        info["grouped"] = False
+        await self._commit()
+
+    def __init_subclass__(cls, **kwargs):
+        """Every public coroutine of a repo is timed as the ``<Repo>.<method>`` stage"""
+        super().__init_subclass__(**kwargs)
+        for name, member in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(member):
+                setattr(cls, name, timed(f"{cls.__name__}.{name}")(member))
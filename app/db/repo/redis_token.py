@@ -0,0 +1,259 @@
+from datetime import datetime, UTC, timedelta
+from functools import lru_cache
+
+from redis.exceptions import RedisError
+
+from app.core.config import get_settings, logger
+from app.core.metrics import timed
+from app.core.security import decode_refresh_token, hash_refresh_token
+from app.core.tokens import TokenError
+from app.db.errors import UnavailableError
+from app.db.models.refresh_token import RefreshToken
+from app.db.models.user import User
+from app.db.repo.user import UserRepo
+
+settings = get_settings()
+
+# Every key of a user shares the hash tag {<user id>}, so on Redis Cluster they live in one slot and the scripts
+# below can touch them all (the token keys they reach from a member name are in the slot of the declared keys):
+# refresh_token:{<id>}:<sha256 hex>   hash of one session (id, user_id, user_agent, create_at, update_at,
+#                                     expire_at), expires with the token
+# refresh_token:{<id>}:sessions       sorted set of the user's token hashes scored by session id, members whose
+#                                     token expired are dropped by the next save/list
+# refresh_token:{<id>}:next_id        session id counter of the user, expires with the last session
+KEY_PREFIX = "refresh_token:"
+
+# KEYS[1] = token key, KEYS[2] = user sessions key, KEYS[3] = user session id counter
+# ARGV = token hash, user id, user agent, now, expires at (unix seconds), max sessions (0 = no cap),
+#        user key prefix
+SAVE_LUA = """
+local id = redis.call('INCR', KEYS[3])
+redis.call('EXPIREAT', KEYS[3], ARGV[5])
+redis.call('HSET', KEYS[1], 'id', id, 'user_id', ARGV[2], 'user_agent', ARGV[3], 'create_at', ARGV[4],
+           'update_at', ARGV[4], 'expire_at', ARGV[5])
+redis.call('EXPIREAT', KEYS[1], ARGV[5])
+redis.call('ZADD', KEYS[2], id, ARGV[1])
+redis.call('EXPIREAT', KEYS[2], ARGV[5])
+
+local max_sessions = tonumber(ARGV[6])
+if max_sessions > 0 then
+    local live = 0
+    for _, member in ipairs(redis.call('ZREVRANGE', KEYS[2], 0, -1)) do
+        local key = ARGV[7] .. member
+        if redis.call('EXISTS', key) == 0 then
+            redis.call('ZREM', KEYS[2], member)
+        else
+            live = live + 1
+            if live > max_sessions then
+                redis.call('DEL', key)
+                redis.call('ZREM', KEYS[2], member)
+            end
+        end
+    end
+end
+return id
+"""
+
+# KEYS[1] = current token key, KEYS[2] = new token key, KEYS[3] = user sessions key, KEYS[4] = session id counter
+# ARGV = user id, current token hash, new token hash, now, expires at
+ROTATE_LUA = """
+if redis.call('HGET', KEYS[1], 'user_id') ~= ARGV[1] then
+    return 0
+end
+local id = redis.call('HGET', KEYS[1], 'id')
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('HSET', KEYS[2], 'update_at', ARGV[4], 'expire_at', ARGV[5])
+redis.call('EXPIREAT', KEYS[2], ARGV[5])
+redis.call('ZREM', KEYS[3], ARGV[2])
+redis.call('ZADD', KEYS[3], id, ARGV[3])
+redis.call('EXPIREAT', KEYS[3], ARGV[5])
+redis.call('EXPIREAT', KEYS[4], ARGV[5])
+return 1
+"""
+
+# KEYS[1] = user sessions key
+# ARGV = user key prefix, min and max session id, token hash to keep ('' keeps none)
+REVOKE_LUA = """
+local revoked = 0
+for _, member in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[2], ARGV[3])) do
+    if member ~= ARGV[4] then
+        revoked = revoked + redis.call('DEL', ARGV[1] .. member)
+        redis.call('ZREM', KEYS[1], member)
+    end
+end
+return revoked
+"""
+
+# KEYS[1] = token key, KEYS[2] = user sessions key
+# ARGV = token hash
+REVOKE_TOKEN_LUA = """
+if redis.call('DEL', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+return 1
+"""
+
+
+@lru_cache()
+def _scripts(redis) -> dict:
+    return {name: redis.register_script(script) for name, script in
+            (("save", SAVE_LUA), ("rotate", ROTATE_LUA), ("revoke", REVOKE_LUA),
+             ("revoke_token", REVOKE_TOKEN_LUA))}
+
+
+def _user_prefix(user_id: int) -> str:
+    return f"{KEY_PREFIX}{{{user_id}}}:"
+
+
+def _token_key(user_id: int, token_hash: str) -> str:
+    return f"{_user_prefix(user_id)}{token_hash}"
+
+
+def _user_key(user_id: int) -> str:
+    return f"{_user_prefix(user_id)}sessions"
+
+
+def _counter_key(user_id: int) -> str:
+    return f"{_user_prefix(user_id)}next_id"
+
+
+def _owner(refresh_token: str) -> int | None:
+    """User id of a refresh token issued here, None if it is forged, malformed or expired (so is its key)"""
+    try:
+        return int(decode_refresh_token(refresh_token)["sub"])
+    except (TokenError, KeyError, ValueError):
+        return None
+
+
+def _datetime(timestamp: str | None) -> datetime | None:
+    return datetime.fromtimestamp(float(timestamp), UTC) if timestamp else None
+
+
+def _to_model(token_hash: str, fields: dict) -> RefreshToken:
+    return RefreshToken(
+        id=int(fields["id"]),
+        user_id=int(fields["user_id"]),
+        token_hash=token_hash,
+        is_revoked=False,
+        user_agent=fields.get("user_agent") or None,
+        create_at=_datetime(fields.get("create_at")),
+        update_at=_datetime(fields.get("update_at")),
+        expire_at=_datetime(fields["expire_at"]),
+    )
+
+
+class RedisTokenStore:
+    """
+    ``RefreshTokenStore`` kept in redis: a refresh or logout never writes to the database and redis drops
+    expired sessions by itself (no reaper). Writes touching several keys run as Lua scripts, so a token is
+    rotated by exactly one of the concurrent refreshes presenting it. A revoked token is deleted, not flagged.
+    Keys are grouped per user (see the layout above), lookups by token find the user in the token itself.
+    Redis errors are raised as ``UnavailableError`` (503).
+    :param redis: async client created with ``decode_responses=True``
+    :param users: loads the token owner after a rotation
+    """
+
+    def __init__(self, redis, users: UserRepo):
+        self.redis = redis
+        self.users = users
+        self.scripts = _scripts(redis)
+
+    @staticmethod
+    def _expiry(now: datetime) -> datetime:
+        return now + timedelta(days=settings.refresh_token_expire_days)
+
+    async def _call(self, awaitable):
+        try:
+            return await awaitable
+        except (RedisError, OSError) as e:
+            logger.error("Refresh token store error: %s", e)
+            raise UnavailableError(str(e)) from e
+
+    @timed("RedisTokenStore.save_refresh_token")
+    async def save_refresh_token(self, user_id: int, refresh_token: str, user_agent: str | None = None,
+                                 max_sessions: int | None = None) -> RefreshToken:
+        now = datetime.now(UTC)
+        token_hash = hash_refresh_token(refresh_token)
+        user_agent = user_agent[:255] if user_agent else ""
+        expire_at = self._expiry(now)
+        session_id = await self._call(self.scripts["save"](
+            keys=[_token_key(user_id, token_hash), _user_key(user_id), _counter_key(user_id)],
+            args=[token_hash, user_id, user_agent, now.timestamp(), int(expire_at.timestamp()),
+                  max_sessions or 0, _user_prefix(user_id)],
+        ))
+        return RefreshToken(id=int(session_id), user_id=user_id, token_hash=token_hash, is_revoked=False,
+                            user_agent=user_agent or None, create_at=now, update_at=now,
+                            expire_at=datetime.fromtimestamp(int(expire_at.timestamp()), UTC))
+
+    @timed("RedisTokenStore.get_refresh_token")
+    async def get_refresh_token(self, refresh_token: str) -> RefreshToken | None:
+        user_id = _owner(refresh_token)
+        if user_id is None:
+            return None
+        token_hash = hash_refresh_token(refresh_token)
+        fields = await self._call(self.redis.hgetall(_token_key(user_id, token_hash)))
+        return _to_model(token_hash, fields) if fields else None
+
+    @timed("RedisTokenStore.list_sessions")
+    async def list_sessions(self, user_id: int) -> list[RefreshToken]:
+        """Active sessions of the user, newest first, members of expired tokens are dropped on the way"""
+        user_key = _user_key(user_id)
+        token_hashes = await self._call(self.redis.zrevrange(user_key, 0, -1))
+        if not token_hashes:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for token_hash in token_hashes:
+                pipe.hgetall(_token_key(user_id, token_hash))
+            rows = await self._call(pipe.execute())
+
+        sessions, expired = [], []
+        for token_hash, fields in zip(token_hashes, rows):
+            if fields:
+                sessions.append(_to_model(token_hash, fields))
+            else:
+                expired.append(token_hash)
+        if expired:
+            await self._call(self.redis.zrem(user_key, *expired))
+        return sessions
+
+    @timed("RedisTokenStore.revoke_session")
+    async def revoke_session(self, user_id: int, session_id: int) -> bool:
+        revoked = await self._call(self.scripts["revoke"](
+            keys=[_user_key(user_id)], args=[_user_prefix(user_id), session_id, session_id, ""],
+        ))
+        return revoked == 1
+
+    @timed("RedisTokenStore.revoke_all_sessions")
+    async def revoke_all_sessions(self, user_id: int, keep_token: str | None = None) -> int:
+        keep = hash_refresh_token(keep_token) if keep_token else ""
+        return await self._call(self.scripts["revoke"](
+            keys=[_user_key(user_id)], args=[_user_prefix(user_id), "-inf", "+inf", keep],
+        ))
+
+    @timed("RedisTokenStore.revoked_by_token")
+    async def revoked_by_token(self, token: str) -> bool:
+        user_id = _owner(token)
+        revoked = 0
+        if user_id is not None:
+            token_hash = hash_refresh_token(token)
+            revoked = await self._call(self.scripts["revoke_token"](
+                keys=[_token_key(user_id, token_hash), _user_key(user_id)], args=[token_hash],
+            ))
+        if not revoked:
+            logger.warning("No refresh token found to revoke")
+        return revoked == 1
+
+    @timed("RedisTokenStore.rotate_refresh_token")
+    async def rotate_refresh_token(self, user_id: int, refresh_token: str, new_refresh_token: str) -> User | None:
+        """Swap the token for the new one keeping its session id, None if it is unknown, revoked or expired"""
+        now = datetime.now(UTC)
+        token_hash, new_hash = hash_refresh_token(refresh_token), hash_refresh_token(new_refresh_token)
+        rotated = await self._call(self.scripts["rotate"](
+            keys=[_token_key(user_id, token_hash), _token_key(user_id, new_hash), _user_key(user_id),
+                  _counter_key(user_id)],
+            args=[user_id, token_hash, new_hash, now.timestamp(), int(self._expiry(now).timestamp())],
+        ))
+        if not rotated:
+            return None
+        return await self.users.get_by_id(user_id)
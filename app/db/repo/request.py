@@ -1,19 +1,41 @@
 from dataclasses import dataclass
+from functools import cached_property
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.repo.token import Token
+from app.core.config import get_settings
+from app.db.repo.base import BaseRepo
+from app.db.repo.token import RefreshTokenStore, Token
 from app.db.repo.user import UserRepo
 
+settings = get_settings()
+
 
 @dataclass
 class RequestRepo:
+    """
+    Repositories of one request, built on first use and reused for the rest of the request.
+    The session only checks out a connection when a repo runs its first statement.
+    """
     session: AsyncSession
 
-    @property
+    @cached_property
     def user(self) -> UserRepo:
         return UserRepo(self.session)
 
-    @property
-    def token(self) -> Token:
+    @cached_property
+    def token(self) -> RefreshTokenStore:
+        """Refresh token store of ``settings.refresh_token_backend``"""
+        if settings.refresh_token_backend == "redis":
+            from app.core.redis import get_redis
+            from app.db.repo.redis_token import RedisTokenStore
+
+            redis = get_redis()
+            if redis is None:
+                raise RuntimeError('refresh_token_backend="redis" requires: pip install redis')
+            return RedisTokenStore(redis, self.user)
         return Token(self.session)
+
+    def transaction(self):
+        """Group the writes of several repos in one transaction, see ``BaseRepo.transaction``"""
+        return BaseRepo(self.session).transaction()
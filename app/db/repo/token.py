@@ -1,134 +1,211 @@
 from datetime import datetime, UTC, timedelta
-from typing import Union
+from typing import Protocol, Union
 
-from sqlalchemy import Insert, Update, Select
+from sqlalchemy import Insert, Update, Select, Delete, or_, and_
 
-from app.core.config import logger
+from app.core.config import get_settings, logger
+from app.core.security import hash_refresh_token
 from app.db.models.refresh_token import RefreshToken
+from app.db.models.user import User
 from app.db.repo.base import BaseRepo
-from sqlalchemy.exc import SQLAlchemyError
 
+settings = get_settings()
 
-class Token(BaseRepo):
 
-    async def save_refresh_token(self, user_id: int, refresh_token: str) -> Union[RefreshToken, None]:
+def _active(user_id: int, now: datetime) -> tuple:
+    """Active sessions of a user, in the column order of ``ix_refresh_tokens_user_active``"""
+    return RefreshToken.user_id == user_id, RefreshToken.is_revoked.is_(False), RefreshToken.expire_at > now
+
+
+class RefreshTokenStore(Protocol):
+    """
+    Where refresh tokens (sessions) live, selected by ``settings.refresh_token_backend``:
+    ``Token`` (the refresh_tokens table) or ``RedisTokenStore`` (redis keys expiring with the token).
+    Tokens are always stored and looked up by ``hash_refresh_token``.
+    """
+
+    async def save_refresh_token(self, user_id: int, refresh_token: str, user_agent: str | None = None,
+                                 max_sessions: int | None = None) -> RefreshToken | None: ...
+
+    async def get_refresh_token(self, refresh_token: str) -> RefreshToken | None: ...
+
+    async def list_sessions(self, user_id: int) -> list[RefreshToken]: ...
 
-        try:
+    async def revoke_session(self, user_id: int, session_id: int) -> bool: ...
 
-            data = {
-                "user_id": user_id,
-                "token": refresh_token,
-                "expire_at": datetime.now(UTC) + timedelta(days=7)
-            }
+    async def revoke_all_sessions(self, user_id: int, keep_token: str | None = None) -> int: ...
+
+    async def revoked_by_token(self, token: str) -> bool: ...
+
+    async def rotate_refresh_token(self, user_id: int, refresh_token: str,
+                                   new_refresh_token: str) -> User | None: ...
+
+
+class Token(BaseRepo):
+    """``RefreshTokenStore`` over the refresh_tokens table, expired rows are purged by the token reaper"""
+
+    async def save_refresh_token(self, user_id: int, refresh_token: str, user_agent: str | None = None,
+                                 max_sessions: int | None = None) -> Union[RefreshToken, None]:
+        """
+        Store a new session, when ``max_sessions`` is set the oldest active sessions above the cap are revoked
+        in the same transaction
+        """
+        now = datetime.now(UTC)
+        data = {
+            "user_id": user_id,
+            "token_hash": hash_refresh_token(refresh_token),
+            "expire_at": now + timedelta(days=settings.refresh_token_expire_days),
+            "user_agent": user_agent[:255] if user_agent else None,
+        }
+        async with self.transaction():
             stmt = (
                 Insert(RefreshToken)
                 .values(**data)
                 .returning(RefreshToken)
             )
-            result = await self.session.execute(stmt)
-            await self.session.commit()
-            return result.scalar_one_or_none()
-        except SQLAlchemyError as e:
-            await self.session.rollback()
-            logger.error(f"Error while saving refresh token: {e}")
-            raise Exception(f"Error while saving refresh token: {e}")
-
-        except Exception as e:
-            await self.session.rollback()
-            logger.error(f"Error while saving refresh token: {e}")
-            raise Exception(f"Error while saving refresh token: {e}")
+            result = await self._execute(stmt)
+            stored_token = result.scalar_one_or_none()
+
+            if max_sessions:
+                evicted = (
+                    Select(RefreshToken.id)
+                    .where(*_active(user_id, now))
+                    .order_by(RefreshToken.id.desc())
+                    .offset(max_sessions)
+                    .scalar_subquery()
+                )
+                await self._execute(Update(RefreshToken).where(RefreshToken.id.in_(evicted)).values(is_revoked=True))
+        return stored_token
 
     async def get_refresh_token(self, refresh_token: str) -> Union[RefreshToken, None]:
-        try:
-            stmt = (
-                Select(RefreshToken)
-                .where(RefreshToken.token == refresh_token)
-            )
-            result = await self.session.execute(stmt)
-            return result.scalar_one_or_none()
-        except SQLAlchemyError as e:
-            logger.info(f"Error while getting refresh token: {e}")
-            raise Exception(f"Error while getting refresh token: {e}")
-        except Exception as e:
-            logger.info(f"Error while getting refresh token: {e}")
-            raise Exception(f"Error while getting refresh token: {e}")
-
-    async def revoked_by_id(self, token_id: int) -> bool:
-
-        try:
-            stmt = (
-                Update(RefreshToken)
-                .where(RefreshToken.id == token_id)
-                .values(is_revoked=True)
-            )
-            await self.session.execute(stmt)
-            await self.session.commit()
-            return True
-        except SQLAlchemyError as e:
-            await self.session.rollback()
-            logger.error(f"Error while revoke refresh token by id: {e}")
-            raise Exception(f"Error while revoke refresh token by id: {e}")
-
-        except Exception as e:
-            await self.session.rollback()
-            logger.error(f"Error while revoke refresh token by id: {e}")
-            raise Exception(f"Error while revoke refresh token by id: {e}")
+        stmt = (
+            Select(RefreshToken)
+            .where(RefreshToken.token_hash == hash_refresh_token(refresh_token))
+        )
+        result = await self._execute(stmt, replica=True)
+        stored_token = result.scalar_one_or_none()
+        await self._release()
+        return stored_token
+
+    async def list_sessions(self, user_id: int) -> list[RefreshToken]:
+        """Active (not revoked, not expired) sessions of the user, newest first, served by the user_active index"""
+        stmt = (
+            Select(RefreshToken)
+            .where(*_active(user_id, datetime.now(UTC)))
+            .order_by(RefreshToken.id.desc())
+        )
+        result = await self._execute(stmt)
+        sessions = list(result.scalars().all())
+        await self._release()
+        return sessions
+
+    async def revoke_session(self, user_id: int, session_id: int) -> bool:
+        """Revoke one active session of the user, False if the user has no such session"""
+        stmt = (
+            Update(RefreshToken)
+            .where(RefreshToken.id == session_id, *_active(user_id, datetime.now(UTC)))
+            .values(is_revoked=True)
+            .returning(RefreshToken.id)
+        )
+        result = await self._execute(stmt)
+        revoked = result.scalar_one_or_none() is not None
+        await self._commit()
+        return revoked
+
+    async def revoke_all_sessions(self, user_id: int, keep_token: str | None = None) -> int:
+        """
+        Revoke every active session of the user in one statement, e.g. for a compromised account
+        :param keep_token: refresh token of a session to keep (the caller's)
+        :return: number of revoked sessions
+        """
+        stmt = (
+            Update(RefreshToken)
+            .where(*_active(user_id, datetime.now(UTC)))
+            .values(is_revoked=True)
+        )
+        if keep_token:
+            stmt = stmt.where(RefreshToken.token_hash != hash_refresh_token(keep_token))
+        result = await self._execute(stmt)
+        await self._commit()
+        return result.rowcount
 
     async def revoked_by_token(self, token: str) -> bool:
-
-        try:
-            stmt = (
-                Update(RefreshToken)
-                .where(RefreshToken.token == token)
-                .values(is_revoked=True)
-                .returning(RefreshToken.is_revoked)
-            )
-            result = await self.session.execute(stmt)
-            await self.session.commit()
-            is_revoked = result.scalar_one_or_none()
-            if is_revoked:
-                logger.debug(f"✅ Refresh token by id={token} was revoked")
-            else:
-                logger.warning(f"⚠️ No refresh token found with id={token}")
-
-            return is_revoked
-        except SQLAlchemyError as e:
-            await self.session.rollback()
-            logger.error(f"Error while revoke refresh token by id: {e}")
-            raise Exception(f"Error while revoke refresh token by id: {e}")
-
-        except Exception as e:
-            await self.session.rollback()
-            logger.error(f"Error while revoke refresh token by id: {e}")
-            raise Exception(f"Error while revoke refresh token by id: {e}")
-
-    async def update_refresh_token_by_id(self, token_id: int, refresh_token: str) -> Union[RefreshToken, None]:
-
-        try:
-            expire_at = datetime.now(UTC) + timedelta(days=7)
-            stmt = (
-                Update(RefreshToken)
-                .where(RefreshToken.id == token_id)
-                .values(token= refresh_token,expire_at=expire_at)
-                .returning(RefreshToken)
-            )
-            result = await self.session.execute(stmt)
-            await self.session.commit()
-
-            updated_token = result.scalar_one_or_none()
-
-            if updated_token:
-                logger.info(f"✅ Refresh token updated for id={token_id}")
-            else:
-                logger.warning(f"⚠️ No refresh token found with id={token_id}")
-
-            return updated_token
-        except SQLAlchemyError as e:
-            await self.session.rollback()
-            logger.error(f"Error while update refresh token by id: {e}",exc_info=True)
-            raise Exception(f"Error while update refresh token by id: {e}")
-
-        except Exception as e:
-            await self.session.rollback()
-            logger.error(f"Error while update refresh token by id: {e}")
-            raise Exception(f"Error while update refresh token by id: {e}")
+        stmt = (
+            Update(RefreshToken)
+            .where(RefreshToken.token_hash == hash_refresh_token(token))
+            .values(is_revoked=True)
+            .returning(RefreshToken.is_revoked)
+        )
+        result = await self._execute(stmt)
+        await self._commit()
+        is_revoked = result.scalar_one_or_none()
+        if is_revoked:
+            logger.debug("Refresh token revoked")
+        else:
+            logger.warning("No refresh token found to revoke")
+
+        return is_revoked
+
+    async def rotate_refresh_token(self, user_id: int, refresh_token: str,
+                                   new_refresh_token: str) -> Union[User, None]:
+        """
+        Atomically swap a valid (not revoked, not expired) refresh token for a new one and return its user.
+        On PostgreSQL this is a single ``UPDATE ... FROM users ... RETURNING users.*``, under concurrent
+        refreshes with the same token only one of them matches the row, the others get None.
+        :param user_id: user id from the token ``sub`` claim
+        :param refresh_token: current refresh token
+        :param new_refresh_token: refresh token replacing it
+        :return: the token owner or None if the token is unknown, revoked or expired
+        """
+        now = datetime.now(UTC)
+        stmt = (
+            Update(RefreshToken)
+            .where(RefreshToken.token_hash == hash_refresh_token(refresh_token),
+                   RefreshToken.user_id == user_id,
+                   RefreshToken.is_revoked.is_(False),
+                   RefreshToken.expire_at > now)
+            .values(token_hash=hash_refresh_token(new_refresh_token),
+                    expire_at=now + timedelta(days=settings.refresh_token_expire_days))
+        )
+
+        if self.session.get_bind().dialect.name == "postgresql":
+            stmt = stmt.where(User.id == RefreshToken.user_id).returning(User)
+            result = await self._execute(Select(User).from_statement(stmt))
+            user = result.scalar_one_or_none()
+            await self._commit()
+            return user
+
+        # SQLite can't return columns of the joined table, fall back to a second select
+        async with self.transaction():
+            result = await self._execute(stmt.returning(RefreshToken.user_id))
+            rotated_user_id = result.scalar_one_or_none()
+            user = None
+            if rotated_user_id is not None:
+                result = await self._execute(Select(User).where(User.id == rotated_user_id))
+                user = result.scalar_one_or_none()
+        return user
+
+    async def delete_expired_batch(self, cutoff: datetime, batch_size: int) -> int:
+        """
+        Delete up to ``batch_size`` tokens that expired, or were revoked, before ``cutoff``.
+        Rows locked by another reaper are skipped so several workers can purge at the same time.
+        :param cutoff: expired/revoked before this moment
+        :param batch_size: max rows deleted by this call
+        :return: number of deleted rows
+        """
+        batch = (
+            Select(RefreshToken.id)
+            .where(or_(RefreshToken.expire_at < cutoff,
+                       and_(RefreshToken.is_revoked.is_(True), RefreshToken.update_at < cutoff)))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        stmt = (
+            Delete(RefreshToken)
+            .where(RefreshToken.id.in_(batch))
+            .execution_options(synchronize_session=False)
+        )
+        result = await self._execute(stmt)
+        await self._commit()
+        return result.rowcount
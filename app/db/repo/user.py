@@ -1,110 +1,213 @@
-from typing import Union
+from datetime import datetime
+from typing import AsyncIterator, Union
 
-from asyncpg import UniqueViolationError
-from sqlalchemy import Insert, select, or_
-from sqlalchemy.dialects.postgresql import asyncpg
+from sqlalchemy import Row, Update, select, or_
 
-from app.core.config import logger
+from app.db.errors import ConflictError, classify
 from app.db.models.user import User, Role
-from app.db.repo.base import BaseRepo
-from sqlalchemy.exc import SQLAlchemyError
+from app.db.repo.base import BaseRepo, DB_ERRORS
 
 from app.schemas.user import UserSchemaIn
-from app.core.security import hash_password
+from app.core.security import hash_password_async
+
+
+class UserExistsError(ConflictError):
+    """The email or username of a new user is already registered, ``field`` tells which one"""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field.capitalize()} already registered")
+        self.field = field
+
+
+EXPORT_COLUMNS = (User.id, User.username, User.email, User.first_name, User.last_name, User.role, User.create_at)
+
+
+def _filters(role: Role | None, created_from: datetime | None, created_to: datetime | None) -> list:
+    filters = []
+    if role is not None:
+        filters.append(User.role == role)
+    if created_from is not None:
+        filters.append(User.create_at >= created_from)
+    if created_to is not None:
+        filters.append(User.create_at < created_to)
+    return filters
 
 
 class UserRepo(BaseRepo):
 
-    async def create(self, user: UserSchemaIn):
-        try:
-            data = {
-                "username": user.username,
-                "email": user.email,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "role": Role.USER,
-                "hashed_password": hash_password(user.password),
-            }
-            stmt = (
-                Insert(User)
-                .values(**data)
-                .returning(User)
-            )
-            result = await self.session.execute(stmt)
-            await self.session.commit()
-            return result.scalar_one_or_none()
-        except SQLAlchemyError as e:
-            await self.session.rollback()
-            logger.error(f"Failed to create user {user.username}: {e}")
-            raise Exception(f"Failed to create user {user.username}: {e}")
-        except UniqueViolationError as e:
-            logger.error(f"unique error {user.username}: {e}")
-            raise Exception(f"Failed to create user {user.username}: {e}")
-        except Exception as e:
-            logger.error(f"Failed to create user {user.username}: {e}")
-            raise Exception(f"Failed to create user {user.username}: {e}")
+    def _insert(self):
+        # imported here, the engine has loaded its dialect by now and importing the repo stays cheap
+        if self.session.get_bind().dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert
 
-    async def get_by_email(self, email: str) -> Union[User, None]:
-        try:
-            stmt = (
-                select(User)
-                .where(User.email == email)
+    async def create(self, user: UserSchemaIn) -> User:
+        """
+        Insert the user with ``INSERT ... ON CONFLICT DO NOTHING RETURNING``, no existence check before.
+        On a conflict the existing row is selected once to tell an email from a username conflict.
+        :raise UserExistsError: the email or username is already registered
+        """
+        hashed_password = await hash_password_async(user.password)
+        data = {
+            "username": user.username,
+            "email": user.email,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "role": Role.USER,
+            "hashed_password": hashed_password,
+        }
+        stmt = (
+            self._insert()(User)
+            .values(**data)
+            .on_conflict_do_nothing()
+            .returning(User)
+        )
+        result = await self._execute(stmt)
+        created = result.scalar_one_or_none()
+        await self._commit()
+
+        if created is None:
+            # The email and the username may belong to two different users
+            result = await self._execute(
+                select(User.email).where(or_(User.username == user.username, User.email == user.email))
             )
-            result = await self.session.execute(stmt)
-            return result.scalar_one_or_none()
+            emails = set(result.scalars().all())
+            await self._release()
+            raise UserExistsError("email" if not emails or user.email in emails else "username")
+        return created
 
-        except SQLAlchemyError as e:
-            logger.error(f"database error when getting user by email: {e}")
-            raise e
-        except Exception as e:
-            logger.error(f"database error when getting user by email: {e}")
-            raise e
+    async def get_by_email(self, email: str) -> Union[User, None]:
+        stmt = (
+            select(User)
+            .where(User.email == email)
+        )
+        result = await self._execute(stmt, replica=True)
+        user = result.scalar_one_or_none()
+        await self._release()
+        return user
 
     async def get_by_username(self, username: str) -> Union[User, None]:
-        try:
-            stmt = (
-                select(User)
-                .where(User.username == username)
-            )
-            result = await self.session.execute(stmt)
-            return result.scalar_one_or_none()
-
-        except SQLAlchemyError as e:
-            logger.error(f"database error when getting user by username: {e}")
-            raise e
-        except Exception as e:
-            logger.error(f"database error when getting user by username: {e}")
-            raise e
+        stmt = (
+            select(User)
+            .where(User.username == username)
+        )
+        result = await self._execute(stmt, replica=True)
+        user = result.scalar_one_or_none()
+        await self._release()
+        return user
 
     async def get_by_email_or_username(self, username: str, email: str) -> Union[User, None]:
-        try:
-            stmt = (
-                select(User)
-                .where(or_(User.username == username, User.email == email))
-            )
-            result = await self.session.execute(stmt)
-            return result.scalar_one_or_none()
-
-        except SQLAlchemyError as e:
-            logger.error(f"database error when getting user by username: {e}")
-            raise e
-        except Exception as e:
-            logger.error(f"database error when getting user by username: {e}")
-            raise e
+        """
+        Existence check of the previous check-then-insert signup, kept for ``benchmarks/concurrent_signup.py``
+        which compares it with ``AuthService.register_user``. The app relies on the unique constraints instead.
+        """
+        stmt = (
+            select(User)
+            .where(or_(User.username == username, User.email == email))
+            .limit(1)
+        )
+        result = await self._execute(stmt)
+        user = result.scalar_one_or_none()
+        await self._release()
+        return user
 
     async def get_by_id(self, user_id: int) -> Union[User, None]:
+        stmt = (
+            select(User)
+            .where(User.id == user_id)
+        )
+        result = await self._execute(stmt, replica=True)
+        user = result.scalar_one_or_none()
+        await self._release()
+        return user
 
+    async def update_password_hash(self, user_id: int, old_hash: str, new_hash: str) -> bool:
+        """
+        Replace the password hash only if it is still ``old_hash``, a password changed in between is kept
+        :return: False when the hash changed since it was read
+        """
+        stmt = (
+            Update(User)
+            .where(User.id == user_id, User.hashed_password == old_hash)
+            .values(hashed_password=new_hash)
+        )
+        result = await self._execute(stmt)
+        await self._commit()
+        return result.rowcount == 1
+
+    async def bulk_insert(self, users: list[dict]) -> set[tuple[str, str]]:
+        """
+        Insert many users with one multi-row ``INSERT ... ON CONFLICT DO NOTHING RETURNING email, username``.
+        :param users: column values, ``hashed_password`` already computed
+        :return: (email, username) of the inserted rows, the others conflicted with an existing email or username
+        """
+        stmt = (
+            self._insert()(User)
+            .values(users)
+            .on_conflict_do_nothing()
+            .returning(User.email, User.username)
+        )
+        result = await self._execute(stmt)
+        inserted = {(email, username) for email, username in result.all()}
+        await self._commit()
+        return inserted
+
+    async def list_users(self, after_id: int = 0, limit: int = 100, role: Role | None = None,
+                         created_from: datetime | None = None, created_to: datetime | None = None) -> list[User]:
+        """
+        One keyset page ordered by id: ``WHERE id > after_id ... ORDER BY id LIMIT limit``.
+        Unlike OFFSET every page costs the same, the next page starts after the last id of this one.
+        """
+        stmt = (
+            select(User)
+            .where(User.id > after_id, *_filters(role, created_from, created_to))
+            .order_by(User.id)
+            .limit(limit)
+        )
+        result = await self._execute(stmt)
+        users = list(result.scalars().all())
+        await self._release()
+        return users
+
+    async def stream_identities(self, after_id: int = 0, batch_size: int = 1000) -> AsyncIterator[Row]:
+        """Yield (id, email, username) of the users above ``after_id`` ordered by id, from a server side cursor"""
+        stmt = (
+            select(User.id, User.email, User.username)
+            .where(User.id > after_id)
+            .order_by(User.id)
+            .execution_options(yield_per=batch_size)
+        )
         try:
-            stmt = (
-                select(User)
-                .where(User.id == user_id)
-            )
-            result = await self.session.execute(stmt)
-            return result.scalar_one_or_none()
-
-        except SQLAlchemyError as e:
-            logger.error(f"database error when getting user by id: {e}")
-            raise e
-        except Exception as e:
-            logger.error(f"database error when getting user by id: {e}")
-            raise e
+            result = await self.session.stream(stmt)
+            async for partition in result.partitions():
+                for row in partition:
+                    yield row
+        except DB_ERRORS as e:
+            raise classify(e) from e
+        finally:
+            await self._release()
+
+    async def stream_users(self, role: Role | None = None, created_from: datetime | None = None,
+                           created_to: datetime | None = None, batch_size: int = 1000) -> AsyncIterator[Row]:
+        """
+        Yield ``EXPORT_COLUMNS`` rows of every matching user ordered by id.
+        Rows come from a server side cursor ``batch_size`` at a time and are plain tuples (no identity map),
+        so memory stays constant whatever the table size.
+        """
+        stmt = (
+            select(*EXPORT_COLUMNS)
+            .where(*_filters(role, created_from, created_to))
+            .order_by(User.id)
+            .execution_options(yield_per=batch_size)
+        )
+        try:
+            result = await self.session.stream(stmt)
+            async for partition in result.partitions():
+                for row in partition:
+                    yield row
+        except DB_ERRORS as e:
+            raise classify(e) from e
+        finally:
+            await self._release()
@@ -0,0 +1,121 @@
+import itertools
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.context import FromStatement
+
+from app.core.config import logger
+
+# Execution option of the statements that may run on a replica, see ``BaseRepo._execute``
+USE_REPLICA = "use_replica"
+
+
+def is_write(stmt) -> bool:
+    """
+    True unless the statement only reads. ``select(Entity).from_statement(<UPDATE ... RETURNING>)`` is a
+    write: the ORM loads entities from it but the database runs the UPDATE
+    """
+    if isinstance(stmt, FromStatement):
+        stmt = stmt.element
+    return not stmt.is_select
+
+
+class ReplicaRouter:
+    """
+    Pick a read replica engine for a statement.
+
+    :param replicas: replica engines
+    :param strategy: "round_robin" or "least_connections" (fewest checked out connections, needs a queue pool)
+    :param retry_seconds: a replica that failed is skipped for this long, reads go to the others or the primary
+    """
+
+    def __init__(self, replicas: list[AsyncEngine], strategy: str = "round_robin", retry_seconds: float = 30):
+        if strategy not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown replica strategy: {strategy}")
+        self.replicas = replicas
+        self.strategy = strategy
+        self.retry_seconds = retry_seconds
+        self.reads = 0
+        self.failures = 0
+        self._cycle = itertools.cycle(range(len(replicas))) if replicas else None
+        self._down_until: dict[int, float] = {}
+
+    def _healthy(self) -> list[int]:
+        now = time.monotonic()
+        return [i for i in range(len(self.replicas)) if self._down_until.get(i, 0) <= now]
+
+    def pick(self):
+        """Return the sync engine of a healthy replica or None when there is none"""
+        healthy = self._healthy()
+        if not healthy:
+            return None
+        if self.strategy == "least_connections":
+            index = min(healthy, key=lambda i: getattr(self.replicas[i].pool, "checkedout", lambda: 0)())
+        else:
+            index = next(i for i in self._cycle if i in healthy)
+        self.reads += 1
+        return self.replicas[index].sync_engine
+
+    def mark_failed(self, sync_engine):
+        for i, replica in enumerate(self.replicas):
+            if replica.sync_engine is sync_engine:
+                self.failures += 1
+                self._down_until[i] = time.monotonic() + self.retry_seconds
+                logger.warning("Read replica %s failed, using the others for %ss", replica.url.render_as_string(),
+                               self.retry_seconds)
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "healthy": len(self._healthy()),
+            "reads": self.reads,
+            "failures": self.failures,
+        }
+
+
+class RoutingSession(Session):
+    """
+    Session sending statements marked with the ``use_replica`` execution option to a replica.
+
+    Everything else, flushes included, goes to the primary (the session bind). Once the session wrote
+    anything, its reads stay on the primary too so a request always reads its own writes.
+    """
+
+    def __init__(self, *args, router: ReplicaRouter | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.router = router
+
+    @property
+    def wrote(self) -> bool:
+        return self.info.get("wrote", False)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (
+            self.router is not None
+            and clause is not None
+            and not self._flushing
+            and not self.wrote
+            and clause.get_execution_options().get(USE_REPLICA)
+        ):
+            replica = self.router.pick()
+            if replica is not None:
+                self.info["replica"] = replica  # lets ``BaseRepo._execute`` fall back when it fails
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _track_writes(orm_execute_state):
+    if is_write(orm_execute_state.statement):
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _track_flush(session, flush_context):
+    session.info["wrote"] = True
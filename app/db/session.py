@@ -1,19 +1,67 @@
-from .setup import create_async_engine, create_session_pool
+from functools import lru_cache
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from .routing import ReplicaRouter
+from .setup import create_engine, create_session_pool
 from app.core.config import get_settings, logger
 
-settings = get_settings()
 
-engine = create_async_engine(url=settings.database_url)
-SessionPool = create_session_pool(engine)
+@lru_cache()
+def get_engine() -> AsyncEngine:
+    """The primary engine, built on first use (importing the app doesn't load the driver or open a pool)"""
+    settings = get_settings()
+    return create_engine(settings.database_url, settings)
+
+
+@lru_cache()
+def get_replica_router() -> ReplicaRouter | None:
+    """Router over the read replica engines, None when no replica is configured"""
+    settings = get_settings()
+    if not settings.database_replica_urls:
+        return None
+    return ReplicaRouter(
+        [create_engine(url, settings) for url in settings.database_replica_urls],
+        strategy=settings.db_replica_strategy,
+        retry_seconds=settings.db_replica_retry_seconds,
+    )
+
+
+@lru_cache()
+def get_session_factory() -> async_sessionmaker[AsyncSession]:
+    return create_session_pool(get_engine(), get_replica_router())
+
+
+async def dispose_engines():
+    """Close the pools of the engines that were built, nothing happens for the others"""
+    if get_engine.cache_info().currsize:
+        await get_engine().dispose()
+    if get_replica_router.cache_info().currsize and get_replica_router() is not None:
+        await get_replica_router().dispose()
+
+
+def __getattr__(name: str):
+    # ``engine``, ``replica_router`` and ``SessionPool`` stay importable, they are built on first access
+    if name == "engine":
+        return get_engine()
+    if name == "replica_router":
+        return get_replica_router()
+    if name == "SessionPool":
+        return get_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 async def get_session_pool():
-    async with SessionPool() as session:
+    """
+    Yield the request session. Creating it is cheap: a pooled connection is only checked out on the first
+    statement, repos release it after reads, so requests that never query never touch the pool.
+    """
+    async with get_session_factory()() as session:
         try:
             yield session
         except Exception as e:
             await session.rollback()
-            logger.exception(f"DB session rollback due to: {e}", exc_info=True)
+            logger.exception("DB session rollback due to: %s", e)
             raise
         finally:
             await session.close()
@@ -1,36 +1,89 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import time
+
+from sqlalchemy import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker, AsyncEngine
 from sqlalchemy.orm import DeclarativeBase
 
+from app.core.config import Settings
+from app.core.metrics import DB_POOL_CHECKOUT_WAIT
+from app.db.routing import RoutingSession
+
 
 class Base(DeclarativeBase):
     """Base class for all database models"""
     pass
 
 
-def create_engine(data_base_url: str, echo=False):
-    """ Create engine
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+def create_engine(data_base_url: str, settings: Settings) -> AsyncEngine:
+    """ Create engine, pool and driver caches are tuned from settings
      :param data_base_url: database url
-     :param echo: boolean
+     :param settings: application settings (db_* fields)
      :return: engine
      """
-    engine = create_async_engine(
-        url=data_base_url,
-        echo=echo,
-        query_cache_size=1200,
-        pool_size=20,
-        max_overflow=200,
-        future=True
-    )
-    return engine
+    options = {
+        "echo": settings.db_echo,
+        "query_cache_size": settings.db_query_cache_size,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+    # SQLite (tests, local) uses a static/singleton pool, the queue pool options don't apply
+    if make_url(data_base_url).get_backend_name() != "sqlite":
+        options.update(
+            poolclass=TimedAsyncQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+        )
 
+    if make_url(data_base_url).get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "statement_cache_size": settings.db_statement_cache_size,
+            "prepared_statement_cache_size": settings.db_prepared_statement_cache_size,
+        }
 
-def create_session_pool(engin) -> AsyncSession:
+    return create_async_engine(url=data_base_url, **options)
+
+
+def create_session_pool(engin, router=None) -> async_sessionmaker[AsyncSession]:
     """ Create session pool
-    :param engin: Engine instance
+    :param engin: Engine instance, the primary
+    :param router: optional ``ReplicaRouter``, marked reads of the sessions then go to its replicas
     :return: session pool
     """
+    if router is not None:
+        return async_sessionmaker(
+            engin, class_=AsyncSession, expire_on_commit=False, sync_session_class=RoutingSession, router=router
+        )
+
     session_pool = async_sessionmaker(
         engin, class_=AsyncSession, expire_on_commit=False
     )
 
     return session_pool
+
+
+def pool_stats(engine: AsyncEngine) -> dict:
+    """ Current connection pool usage of the engine
+    :param engine: Engine instance
+    :return: pool size, checked in/out and overflow connections
+    """
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if method is not None:
+            stats[name] = method()
+    return stats
@@ -1,11 +1,16 @@
 from typing import Annotated
 from fastapi import Depends, HTTPException, status, Cookie, Request, Response
 
-from app.core.config import logger
-from app.core.security import decode_token
-from app.db.models.user import User
+from app.core.config import logger, get_settings
+from app.core.revocation import revocation_list
+from app.core.security import decode_token, token_id
+from app.db.errors import RepoError
+from app.db.models.user import User, Role
 from app.dependencies.repo import RepoRequestDep
 from app.services.auth_service import auth_service
+from app.services.user_cache import user_cache
+
+settings = get_settings()
 
 
 async def get_current_user(request: Request, response: Response, repo: RepoRequestDep,
@@ -30,12 +35,12 @@ async def get_current_user(request: Request, response: Response, repo: RepoReque
     try:
         if access_token is None and refresh_token is None:
             try:
-                logger.info("Extracting access token")
+                logger.debug("Extracting access token")
                 token_schema = await auth_service.extract_access_token(request=request)
                 access_token = token_schema.access_token
                 refresh_token = token_schema.refresh_token
             except Exception as exc:
-                logger.info(f"Failed to extract access token {exc}")
+                logger.info("Failed to extract access token: %s", exc)
                 raise credentials_exception
 
         if refresh_token is None:
@@ -46,25 +51,67 @@ async def get_current_user(request: Request, response: Response, repo: RepoReque
                                                              response=response)
             access_token = tokens.access_token
 
-            logger.debug(f"Refreshed tokens: {tokens}")
+            logger.debug("Access token refreshed from the refresh token")
             if access_token is None and refresh_token is None:
                 raise credentials_exception
 
         payload = decode_token(access_token)
-        logger.debug(f"payload: {payload}")
-        user = payload.get("sub")
-        if user is None:
+        logger.debug("Access token payload: sub=%s exp=%s", payload.get("sub"), payload.get("exp"))
+        user_id = payload.get("sub")
+        if user_id is None:
             raise credentials_exception
 
-        user = await repo.user.get_by_id(user_id=int(user))
+        if revocation_list.is_revoked_for_user(int(user_id), payload.get("iat")):
+            # sessions of the user were revoked since, a device still signed in gets a new access token
+            logger.info("Access token issued before the sessions of user %s were revoked", user_id)
+            tokens = await auth_service.refresh_token_update(refresh_token=refresh_token, repo=repo,
+                                                             response=response)
+            access_token = tokens.access_token
+            payload = decode_token(access_token)
+            user_id = payload["sub"]
+
+        access_token_id = token_id(payload, access_token)
+        if revocation_list.is_revoked(access_token_id):
+            logger.info("Revoked access token used")
+            raise credentials_exception
+
+        if settings.stateless_access_tokens:
+            user = auth_service.user_from_claims(payload)
+            if user is not None:
+                return user
+
+        user = await user_cache.get(int(user_id), access_token_id)
+        if user is not None:
+            return user
+
+        user = await repo.user.get_by_id(user_id=int(user_id))
         if user is None:
-            logger.error(f"User {user} not found")
+            logger.error("User %s not found", user_id)
             raise credentials_exception
+        await user_cache.set(user, access_token_id, payload.get("exp"))
         return user
 
+    except RepoError:
+        # database trouble is not a credentials problem, let it surface as 503/504
+        raise
     except Exception as error:
-        logger.error(f"Error decoding access token: {error}")
+        logger.error("Error decoding access token: %s", error)
         raise credentials_exception
 
 
 CurrentUserDep = Annotated[User, Depends(get_current_user)]
+
+
+async def get_current_admin(user: CurrentUserDep) -> User:
+    """
+    This dependence only lets users with the admin role through.
+
+    :user: Current user
+    :return: User Model
+    """
+    if user.role != Role.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin role required")
+    return user
+
+
+CurrentAdminDep = Annotated[User, Depends(get_current_admin)]
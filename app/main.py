@@ -1,28 +1,120 @@
-import logging
-import sys
+from contextlib import asynccontextmanager
 
-import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 from app.api.v1.routes.users import router as users_router
 from app.api.v1.routes.auth import router as auth_router
+from app.api.v1.routes.admin import router as admin_router
 from app.core.config import get_settings
+from app.core.log import log_pipeline, setup_logging
+from app.core.metrics import PrometheusMiddleware, metrics_response, stats_collector
+from app.core.revocation import revocation_list
+from app.core.security import password_hasher, access_token_codec
+from app.core.tokens import CachedTokenCodec
+from app.db.errors import ConflictError, RepoTimeoutError, SerializationError, UnavailableError
+from app.db.session import dispose_engines, get_engine, get_replica_router, get_session_factory
+from app.db.setup import pool_stats
+from app.services.auth_service import auth_service
+from app.services.identity_filter import identity_filter
+from app.services.token_reaper import create_token_reaper
+from app.services.user_cache import user_cache
 
 settings = get_settings()
 
-logging.basicConfig(stream=sys.stdout, level=logging.DEBUG if settings.log_level == "DEBUG" else logging.INFO)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging(settings)
+    token_reaper = create_token_reaper(get_session_factory())
+    if settings.token_reaper_enabled and settings.refresh_token_backend == "sql":
+        token_reaper.start()
+    app.state.token_reaper = token_reaper
+    stats_collector.register("token_reaper", token_reaper.stats)
+    revocation_list.start()
+    user_cache.start()
+    if settings.identity_filter_backend != "off":
+        identity_filter.start()
 
-app = FastAPI(title=settings.project_name, docs_url="/api/docs")
+    yield
+
+    await identity_filter.stop()
+    await user_cache.stop()
+    await revocation_list.stop()
+    await token_reaper.stop()
+    await auth_service.wait_rehashes()
+    password_hasher.shutdown()
+    await dispose_engines()
+    log_pipeline.stop()
+
+
+async def conflict_handler(request: Request, exc: ConflictError):
+    return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={"detail": "Conflicting data"})
+
+
+async def unavailable_handler(request: Request, exc: UnavailableError | SerializationError):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"},
+                        content={"detail": "Database unavailable, retry later"})
+
+
+async def timeout_handler(request: Request, exc: RepoTimeoutError):
+    return JSONResponse(status_code=status.HTTP_504_GATEWAY_TIMEOUT, headers={"Retry-After": "1"},
+                        content={"detail": "Database timeout"})
 
 
-@app.get("/")
 async def root():
     return {"message": "Hello World"}
 
 
-# Routers
-app.include_router(users_router,prefix="/api/v1", tags=["users"])
-app.include_router(auth_router,prefix="/api/v1", tags=["auth"])
+async def metrics():
+    return metrics_response()
+
+
+def _db_replica_stats() -> dict:
+    router = get_replica_router()
+    return router.stats() if router is not None else {}
+
+
+def create_app() -> FastAPI:
+    """
+    Build the application: middleware, stats, error handlers and routers.
+    Nothing here connects to the database or installs log handlers, that happens when the server starts
+    (``lifespan``), engines are built on the first query and disposed on shutdown.
+    Run it with ``uvicorn --factory app.main:create_app``.
+    """
+    app = FastAPI(title=settings.project_name, docs_url="/api/docs", lifespan=lifespan)
+    app.add_middleware(PrometheusMiddleware)
+
+    stats_collector.register("password_hasher", password_hasher.stats)
+    stats_collector.register("user_cache", user_cache.stats)
+    stats_collector.register("signup_taken_identities", auth_service.taken_identities.stats)
+    stats_collector.register("access_token_revocation", revocation_list.stats)
+    stats_collector.register("logging", log_pipeline.stats)
+    stats_collector.register("identity_filter", identity_filter.stats)
+    if isinstance(access_token_codec, CachedTokenCodec):
+        stats_collector.register("access_token_decode_cache", access_token_codec.stats)
+    if settings.database_replica_urls:
+        stats_collector.register("db_replicas", _db_replica_stats)
+    stats_collector.register("db_pool", lambda: pool_stats(get_engine()))
+
+    app.add_exception_handler(ConflictError, conflict_handler)
+    app.add_exception_handler(UnavailableError, unavailable_handler)
+    app.add_exception_handler(SerializationError, unavailable_handler)
+    app.add_exception_handler(RepoTimeoutError, timeout_handler)
+
+    app.add_api_route("/", root, methods=["GET"])
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+
+    # Routers
+    app.include_router(users_router, prefix="/api/v1", tags=["users"])
+    app.include_router(auth_router, prefix="/api/v1", tags=["auth"])
+    app.include_router(admin_router, prefix="/api/v1", tags=["admin"])
+    return app
+
+
+# Module level app for ``uvicorn app.main:app``, the tests and the benchmarks
+app = create_app()
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", reload=True, port=8000)
\ No newline at end of file
+    import uvicorn
+
+    uvicorn.run("app.main:app", host="0.0.0.0", reload=True, port=8000)
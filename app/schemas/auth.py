@@ -1,4 +1,6 @@
-from pydantic import BaseModel, Field
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class TokenSchema(BaseModel):
@@ -12,3 +14,20 @@ class LoginSchema(BaseModel):
     """This model use for get login data"""
     username: str = Field(description="Username", default="admin@mail.com")
     password: str = Field(description="password", default="admin")
+
+
+class SessionSchema(BaseModel):
+    """This model use for send the active sessions (devices) of a user"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    user_agent: str | None = None
+    create_at: datetime | None = None
+    update_at: datetime | None = None
+    expire_at: datetime
+    current: bool = False
+
+
+class RevokedSessionsSchema(BaseModel):
+    """This model use for send the number of revoked sessions"""
+    revoked: int
@@ -1,5 +1,9 @@
+from datetime import datetime
+
 from pydantic import BaseModel, ConfigDict, Field
 
+from app.db.models.user import Role
+
 
 class UserSchemaIn(BaseModel):
     """This model use for get signup data"""
@@ -19,3 +23,15 @@ class UserSchema(BaseModel):
     email: str
     first_name: str
     last_name: str
+
+
+class AdminUserSchema(UserSchema):
+    """This model use for the admin user listing"""
+    role: Role
+    create_at: datetime | None = None
+
+
+class UserPageSchema(BaseModel):
+    """One keyset page, pass ``next_after_id`` as ``after_id`` to get the next page, None on the last page"""
+    items: list[AdminUserSchema]
+    next_after_id: int | None = None
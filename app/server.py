@@ -0,0 +1,100 @@
+"""
+Production entry point:
+
+    $ python -m app.server
+    $ SERVER_WORKERS=4 python -m app.server --port 8080
+
+Runs ``app.main:app`` on ``settings.server_workers`` processes (the number of CPUs by default, password hashing
+is CPU bound and one process only gets one core for the event loop). uvloop and httptools are used when they are
+installed. On SIGTERM/SIGINT every worker stops accepting connections, lets the in-flight requests finish for up
+to ``server_graceful_timeout_seconds`` and then runs the lifespan shutdown (background tasks stopped, database
+pools disposed, queued logs written).
+
+For development with auto reload use ``python -m app.main``.
+"""
+import argparse
+import importlib.util
+import os
+import tempfile
+
+from app.core.config import get_settings, logger
+from app.core.log import setup_logging
+
+APP = "app.main:app"
+
+
+def resolve_workers(workers: int | None) -> int:
+    return workers or os.cpu_count() or 1
+
+
+def resolve_loop(loop: str) -> str:
+    if loop == "auto":
+        return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    return loop
+
+
+def resolve_http(http: str) -> str:
+    if http == "auto":
+        return "httptools" if importlib.util.find_spec("httptools") else "h11"
+    return http
+
+
+def prepare_worker_env(workers: int):
+    """
+    Environment inherited by the worker processes, set before they are spawned:
+    - the password hasher pool of each worker gets its share of the CPUs instead of one thread per CPU each
+    - prometheus metrics are written to a shared directory so /metrics adds up every worker
+    """
+    settings = get_settings()
+    if settings.password_hash_workers is None:
+        os.environ.setdefault("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+    if workers > 1 and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+
+def preload():
+    """
+    Import the app once in the supervisor, so a configuration or import error stops the launch before any
+    worker is spawned. uvicorn spawns its workers (no fork), each one imports the app again.
+    """
+    importlib.import_module(APP.split(":")[0])
+
+
+def run(host: str, port: int, workers: int | None = None):
+    import uvicorn
+
+    settings = get_settings()
+    setup_logging(settings)
+    workers = resolve_workers(workers or settings.server_workers)
+    loop, http = resolve_loop(settings.server_loop), resolve_http(settings.server_http)
+    prepare_worker_env(workers)
+    preload()
+    logger.info("Starting %d workers on %s:%d (loop=%s, http=%s)", workers, host, port, loop, http)
+
+    uvicorn.run(
+        APP,
+        host=host,
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=settings.server_backlog,
+        timeout_keep_alive=settings.server_keepalive_seconds,
+        timeout_graceful_shutdown=settings.server_graceful_timeout_seconds,
+        limit_concurrency=settings.server_limit_concurrency,
+        limit_max_requests=settings.server_max_requests,
+        access_log=settings.server_access_log,
+        proxy_headers=True,
+        forwarded_allow_ips=settings.server_forwarded_allow_ips,
+        log_config=None,  # uvicorn logs go through the app log pipeline (json in production)
+    )
+
+
+if __name__ == "__main__":
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run the API with the production server settings")
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to settings.server_workers or the CPUs")
+    args = parser.parse_args()
+    run(args.host, args.port, args.workers)
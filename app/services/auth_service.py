@@ -1,28 +1,202 @@
+import asyncio
+import time
+from collections import OrderedDict
+
 from fastapi import HTTPException, status, Response, Request
-from app.db.models.user import User
-from app.core.security import verify_password, create_refresh_token, create_access_token
-from jose import jwt, JWTError, ExpiredSignatureError
+from app.db.models.user import User, Role
+from app.core.metrics import PASSWORD_REHASHES
+from app.core.security import verify_password_async, create_refresh_token, create_access_token, decode_refresh_token, \
+    hash_password_async, password_hasher, password_needs_rehash, verify_dummy_password_async
+from app.core.tokens import TokenError, ExpiredTokenError
 
 from app.core.config import get_settings
 from app.db.repo.request import RequestRepo
+from app.db.repo.user import UserExistsError, UserRepo
+from app.db.session import get_session_factory
+from app.services.identity_filter import identity_filter
 from app.core.config import logger
-from app.schemas.auth import LoginSchema, TokenSchema
+from app.schemas.auth import TokenSchema
+from app.schemas.user import UserSchemaIn
 
 settings = get_settings()
 
+
+class TakenIdentities:
+    """
+    Bounded LRU of emails and usernames known to be registered, filled by signups, signins and conflicts.
+
+    A signup for a remembered identity is rejected before bcrypt runs; a miss proves nothing, the insert
+    still resolves the conflict. Entries expire after ``ttl_seconds`` so a deleted user is not remembered long.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl_seconds: int = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self._entries: OrderedDict[tuple[str, str], float] = OrderedDict()
+
+    def add(self, field: str, value: str):
+        if self.max_size <= 0:
+            return
+        key = (field, value)
+        self._entries[key] = time.monotonic() + self.ttl_seconds
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def add_user(self, user: User):
+        self.add("email", user.email)
+        self.add("username", user.username)
+
+    def taken(self, user: UserSchemaIn) -> str | None:
+        """Return the remembered field ("email" first, then "username") or None"""
+        for field in ("email", "username"):
+            key = (field, getattr(user, field))
+            expires_at = self._entries.get(key)
+            if expires_at is None:
+                continue
+            if expires_at > time.monotonic():
+                self.hits += 1
+                return field
+            del self._entries[key]
+        return None
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits}
+
+
 class AuthService:
     """
     This service is responsible for handling authentication.
 
     """
+    def __init__(self):
+        self.taken_identities = TakenIdentities(max_size=settings.signup_taken_cache_size,
+                                                ttl_seconds=settings.signup_taken_cache_ttl_seconds)
+        self._pending_signups: dict[tuple[str, str], asyncio.Event] = {}
+        self._rehashes: dict[int, asyncio.Task] = {}
+        # sessions of the background rehash writes, the request session is closed by the time they run
+        self.session_factory = None
+
     async def authenticate_user(self, repo: RequestRepo, email, password):
-        user = await repo.user.get_by_email(email=email)
-        if not user or not verify_password(plain_password=password, hashed_password=str(user.hashed_password)):
+        """
+        Check the credentials. An email the identity filter has never seen is rejected without a query. Unknown
+        users still cost one password verification, so the hash time doesn't tell whether the email exists; the
+        skipped lookup does make a filter miss faster by one database round trip.
+        """
+        user = None
+        if await identity_filter.might_exist("email", email):
+            user = await repo.user.get_by_email(email=email)
+        if user is None:
+            await verify_dummy_password_async(password)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
+        if not await verify_password_async(plain_password=password, hashed_password=str(user.hashed_password)):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
+        self.taken_identities.add_user(user)
+        if settings.password_rehash_on_login and password_needs_rehash(user.hashed_password):
+            self.schedule_rehash(user.id, password, user.hashed_password)
         return user
 
+    def schedule_rehash(self, user_id: int, password: str, old_hash: str):
+        """
+        Hash the password again with the configured scheme and cost and store it, in the background so the
+        login doesn't pay for a second hash. One rehash per user at a time and at most
+        ``password_rehash_max_in_flight`` overall; while logins wait for the hasher pool the rehash is skipped,
+        the user's next login tries again.
+        """
+        if user_id in self._rehashes:
+            return
+        if len(self._rehashes) >= settings.password_rehash_max_in_flight or password_hasher.queue_depth:
+            PASSWORD_REHASHES.labels("deferred").inc()
+            return
+        task = asyncio.create_task(self._rehash(user_id, password, old_hash))
+        self._rehashes[user_id] = task
+        task.add_done_callback(lambda _: self._rehashes.pop(user_id, None))
+
+    async def _rehash(self, user_id: int, password: str, old_hash: str):
+        try:
+            new_hash = await hash_password_async(password)
+            session_factory = self.session_factory or get_session_factory()
+            async with session_factory() as session:
+                updated = await UserRepo(session).update_password_hash(user_id, old_hash, new_hash)
+        except Exception as exc:
+            PASSWORD_REHASHES.labels("failed").inc()
+            logger.warning("Password rehash failed for user_id=%s: %s", user_id, exc)
+            return
+        PASSWORD_REHASHES.labels("updated" if updated else "stale").inc()
+        logger.debug("Password hash of user_id=%s upgraded", user_id)
+
+    async def wait_rehashes(self):
+        """Wait for the background rehashes, called on shutdown before the engines are disposed"""
+        if self._rehashes:
+            await asyncio.gather(*self._rehashes.values(), return_exceptions=True)
+
+    async def register_user(self, repo: RequestRepo, user: UserSchemaIn) -> User:
+        """
+        Create the user in one ``INSERT ... ON CONFLICT DO NOTHING``, email/username conflicts map to 409.
+        Identities seen recently are rejected first without hashing the password, and a signup for an identity
+        already being registered by this worker waits for that one instead of hashing in parallel.
+        """
+        keys = [("email", user.email), ("username", user.username)]
+        for key in keys:
+            pending = self._pending_signups.get(key)
+            if pending is not None:
+                await pending.wait()
+
+        field = self.taken_identities.taken(user)
+        if field is None:
+            done = asyncio.Event()
+            for key in keys:
+                self._pending_signups.setdefault(key, done)
+            try:
+                created = await repo.user.create(user)
+                self.taken_identities.add_user(created)
+                await identity_filter.add_user(created)
+                return created
+            except UserExistsError as e:
+                field = e.field
+                self.taken_identities.add(field, getattr(user, field))
+                await identity_filter.add(field, getattr(user, field))
+            finally:
+                for key in keys:
+                    if self._pending_signups.get(key) is done:
+                        del self._pending_signups[key]
+                done.set()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"{field.capitalize()} already registered")
+
+    @staticmethod
+    def access_token_claims(user: User) -> dict:
+        """Claims of the access token, identity and role are embedded when stateless access tokens are on"""
+        claims = {"sub": str(user.id)}
+        if settings.stateless_access_tokens:
+            claims.update(
+                username=user.username,
+                email=user.email,
+                first_name=user.first_name,
+                last_name=user.last_name,
+                role=user.role.value if isinstance(user.role, Role) else user.role,
+            )
+        return claims
+
+    @staticmethod
+    def user_from_claims(payload: dict) -> User | None:
+        """Build a transient user from a stateless access token, None if the token has no identity claims"""
+        if "role" not in payload:
+            return None
+        return User(
+            id=int(payload["sub"]),
+            username=payload["username"],
+            email=payload["email"],
+            first_name=payload["first_name"],
+            last_name=payload["last_name"],
+            role=Role(payload["role"]),
+        )
+
     async def create_token(self, user: User) -> TokenSchema:
-        access_token = create_access_token({"sub": str(user.id)})
+        access_token = create_access_token(self.access_token_claims(user))
         refresh_token = create_refresh_token({"sub": str(user.id)})
         return TokenSchema(access_token=access_token, refresh_token=refresh_token)
 
@@ -31,34 +205,25 @@ class AuthService:
             raise HTTPException(status_code=401, detail="Missing refresh token")
 
         try:
-            payload = jwt.decode(
-                refresh_token,
-                settings.jwt_refresh_secret_key,
-                algorithms=["HS256"],
-            )
+            payload = decode_refresh_token(refresh_token)
             user_id = int(payload.get("sub"))
-        except ExpiredSignatureError:
+        except ExpiredTokenError:
             logger.warning("Refresh token expired")
             raise HTTPException(status_code=401, detail="Refresh token expired")
-        except JWTError:
+        except (TokenError, TypeError, ValueError):
             logger.warning("Invalid refresh token")
             raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-        stored_refresh_token = await repo.token.get_refresh_token(refresh_token)
-        if not stored_refresh_token or stored_refresh_token.is_revoked:
+        # Rotate in one statement, the new refresh token only needs the user id
+        new_refresh_token = create_refresh_token({"sub": str(user_id)})
+        user = await repo.token.rotate_refresh_token(user_id=user_id, refresh_token=refresh_token,
+                                                     new_refresh_token=new_refresh_token)
+        if not user:
             logger.warning("Refresh token invalid or revoked")
             raise HTTPException(status_code=401, detail="Invalid or revoked token")
 
-        user = await repo.user.get_by_id(user_id=user_id)
-        if not user:
-            logger.error(f"User not found for refresh token (user_id={user_id})")
-            raise HTTPException(status_code=404, detail="User not found")
-
-        # Generate new tokens
-        token_schema = await self.create_token(user=user)
-
-        await repo.token.update_refresh_token_by_id(int(stored_refresh_token.id),
-                                                    refresh_token=token_schema.refresh_token)
+        token_schema = TokenSchema(access_token=create_access_token(self.access_token_claims(user)),
+                                   refresh_token=new_refresh_token)
 
         # Set cookies (HTTPS-aware)
         cookie_config = {
@@ -70,17 +235,17 @@ class AuthService:
         response.set_cookie(
             key="access_token",
             value=token_schema.access_token,
-            max_age=15 * 60,  # 15 minutes
+            max_age=settings.access_token_expire_minutes * 60,
             **cookie_config,
         )
         response.set_cookie(
             key="refresh_token",
             value=token_schema.refresh_token,
-            max_age=7 * 86400,  # 7 days
+            max_age=settings.refresh_token_expire_days * 86400,
             **cookie_config,
         )
 
-        logger.info(f"Refresh token renewed for user_id={user.id}")
+        logger.info("Refresh token renewed for user_id=%s", user.id)
         return token_schema
 
     async def extract_access_token(self, request: Request) -> TokenSchema:
@@ -0,0 +1,126 @@
+"""
+Pick the password hash cost for this host: the strongest parameters whose hash time stays within the budget.
+
+    $ python -m app.services.hash_calibration --budget-ms 250
+    $ python -m app.services.hash_calibration --scheme argon2 --budget-ms 150 --memory-kib 65536
+
+Prints the settings to put in the environment. Hashes stored with the previous parameters keep working and
+are replaced on the next login of their user (``password_rehash_on_login``), no migration is needed.
+"""
+import argparse
+import json
+import statistics
+import time
+from dataclasses import dataclass, field
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+BCRYPT_ROUNDS = range(10, 18)
+ARGON2_MAX_TIME_COST = 10
+
+
+@dataclass
+class Calibration:
+    scheme: str
+    budget_ms: float
+    params: dict
+    hash_ms: float
+    measured: list[dict] = field(default_factory=list)  # every tried parameter set and its median hash time
+
+    def env(self) -> dict[str, str]:
+        env = {"PASSWORD_HASH_SCHEME": self.scheme}
+        env.update({f"PASSWORD_{self.scheme.upper()}_{name.upper()}": str(value) for name, value in self.params.items()})
+        return env
+
+
+def measure_ms(hasher, samples: int) -> float:
+    """Median time of ``samples`` hashes in milliseconds, after one warm-up"""
+    hasher.hash("calibration-warm-up")
+    durations = []
+    for i in range(samples):
+        start = time.perf_counter()
+        hasher.hash(f"calibration-{i}")
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def calibrate_bcrypt(budget_ms: float, samples: int = 3) -> Calibration:
+    """Highest bcrypt cost within the budget, each extra round doubles the time so the search stops early"""
+    from passlib.hash import bcrypt
+
+    measured = []
+    best = None
+    for rounds in BCRYPT_ROUNDS:
+        hash_ms = measure_ms(bcrypt.using(rounds=rounds, ident="2b"), samples)
+        measured.append({"rounds": rounds, "hash_ms": round(hash_ms, 1)})
+        if hash_ms > budget_ms:
+            break
+        best = (rounds, hash_ms)
+    if best is None:
+        # even the floor is over budget, use it anyway rather than weaker hashes
+        best = (BCRYPT_ROUNDS[0], measured[0]["hash_ms"])
+    return Calibration("bcrypt", budget_ms, {"rounds": best[0]}, round(best[1], 1), measured)
+
+
+def calibrate_argon2(budget_ms: float, memory_kib: int, parallelism: int, samples: int = 3) -> Calibration:
+    """
+    argon2id with the given memory and lanes: the highest time cost within the budget. When a single pass is
+    already over budget the memory is halved (down to 8 MiB) before giving up.
+    """
+    from passlib.hash import argon2
+
+    if not argon2.has_backend():
+        raise RuntimeError("argon2 calibration requires: pip install argon2-cffi")
+
+    measured = []
+    while True:
+        best = None
+        for time_cost in range(1, ARGON2_MAX_TIME_COST + 1):
+            hasher = argon2.using(type="ID", time_cost=time_cost, memory_cost=memory_kib, parallelism=parallelism)
+            hash_ms = measure_ms(hasher, samples)
+            measured.append({"time_cost": time_cost, "memory_cost": memory_kib, "hash_ms": round(hash_ms, 1)})
+            if hash_ms > budget_ms:
+                break
+            best = (time_cost, hash_ms)
+        if best is not None or memory_kib <= 8192:
+            break
+        memory_kib //= 2
+
+    if best is None:
+        best = (1, measured[-1]["hash_ms"])
+    params = {"time_cost": best[0], "memory_cost": memory_kib, "parallelism": parallelism}
+    return Calibration("argon2", budget_ms, params, round(best[1], 1), measured)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", choices=("bcrypt", "argon2"), default=settings.password_hash_scheme)
+    parser.add_argument("--budget-ms", type=float, default=settings.password_hash_budget_ms,
+                        help="max time of one hash on this host")
+    parser.add_argument("--memory-kib", type=int, default=settings.password_argon2_memory_cost,
+                        help="argon2 memory cost to start from")
+    parser.add_argument("--parallelism", type=int, default=settings.password_argon2_parallelism)
+    parser.add_argument("--samples", type=int, default=3, help="hashes measured per parameter set")
+    parser.add_argument("--json", action="store_true", help="print the full calibration as json")
+    args = parser.parse_args()
+
+    if args.scheme == "argon2":
+        calibration = calibrate_argon2(args.budget_ms, args.memory_kib, args.parallelism, args.samples)
+    else:
+        calibration = calibrate_bcrypt(args.budget_ms, args.samples)
+
+    if args.json:
+        print(json.dumps({**calibration.__dict__, "env": calibration.env()}, indent=2))
+        return
+    for row in calibration.measured:
+        print("  ".join(f"{name}={value}" for name, value in row.items()))
+    print(f"# {calibration.scheme} {calibration.params}: {calibration.hash_ms} ms per hash "
+          f"(budget {calibration.budget_ms} ms)")
+    for name, value in calibration.env().items():
+        print(f"{name}={value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import get_settings, logger
+from app.core.redis import get_redis
+from app.db.repo.user import UserRepo
+from app.db.session import get_session_factory
+from app.utils.bloom import BloomFilter
+
+settings = get_settings()
+
+
+class IdentityFilter:
+    """
+    Bloom filter of every registered email and username, so a signin for an address that was never registered
+    is rejected without a database lookup (credential stuffing mostly tries unknown addresses).
+
+    "Not in the filter" is definite, "in the filter" only means the database has to be asked. The filter is
+    built at startup by streaming the users table; until it is ready every lookup answers "maybe".
+
+    - memory backend (single worker): users created by other processes (CLI import, other workers) are picked
+      up every ``sync_interval`` seconds by reading the rows above the last seen id
+    - redis backend: the bits live in redis and are shared by every worker; the first worker to start builds
+      them, lookups check the local filter first and only ask redis on a local miss. Every sync one worker
+      reads the rows above the shared last seen id, so users inserted outside the app (SQL, migrations) are
+      added too. Redis errors answer "maybe"; adds that failed are replayed before the next redis command and
+      until then this worker doesn't trust redis misses. If the bits are lost (redis restarted without
+      persistence, flushed, key evicted) the ready marker goes with them: lookups answer "maybe" and the
+      filter is rebuilt.
+
+    Rows are picked up by id. Every sync reads again the ``resync_window`` ids below the last seen one, so a
+    row whose transaction committed after a higher id was synced is still added; a commit later than that
+    (a transaction holding its id for longer than the window takes to fill) waits for the next rebuild.
+    """
+
+    KEY_PREFIX = "identity_filter"
+
+    def __init__(self, redis=None, capacity: int = 1_000_000, error_rate: float = 0.001,
+                 sync_interval: float = 5, batch_size: int = 1000, resync_window: int = 1000):
+        self.redis = redis
+        self.sync_interval = sync_interval
+        self.resync_window = resync_window
+        self.batch_size = batch_size
+        self.bloom = BloomFilter(capacity, error_rate)
+        # the sizing is part of the key, workers configured differently never share bits
+        self.key = f"{self.KEY_PREFIX}:{self.bloom.size}:{self.bloom.hash_count}"
+        self.ready_key, self.lock_key, self.last_id_key = f"{self.key}:ready", f"{self.key}:lock", f"{self.key}:last_id"
+        self.ready = False
+        self.last_id = 0
+        # sessions used to read the users table, the engine of the app when not set
+        self.session_factory: async_sessionmaker[AsyncSession] | None = None
+        self.lookups = 0
+        self.definite_misses = 0
+        self._pending: list[str] = []
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def _item(field: str, value: str) -> str:
+        return f"{field}:{value}"
+
+    async def might_exist(self, field: str, value: str) -> bool:
+        """False only if no user was ever registered with this email/username"""
+        self.lookups += 1
+        item = self._item(field, value)
+        if not self.ready or item in self.bloom:
+            return True
+        if self.redis is not None:
+            if self._pending and not await self._flush():
+                return True  # adds of this worker are missing from redis, its misses can't be trusted
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.exists(self.ready_key)
+                    bits = pipe.bitfield(self.key)
+                    for position in self.bloom.positions(item):
+                        bits.get("u1", position)
+                    bits.execute()
+                    built, found = await pipe.execute()
+            except Exception as exc:
+                logger.warning("Identity filter redis lookup failed: %s", exc)
+                return True
+            if not built:
+                logger.warning("Identity filter bits are gone from redis, rebuilding")
+                self.ready = False
+                return True
+            if all(found):
+                self.bloom.add(item)
+                return True
+        self.definite_misses += 1
+        return False
+
+    async def add(self, field: str, value: str):
+        await self._add_items([self._item(field, value)])
+
+    async def add_user(self, user):
+        await self._add_items([self._item("email", user.email), self._item("username", user.username)])
+
+    async def add_identities(self, identities):
+        """Add (email, username) pairs, e.g. the rows inserted by a bulk import"""
+        items = []
+        for email, username in identities:
+            items += [self._item("email", email), self._item("username", username)]
+        await self._add_items(items)
+
+    async def _add_items(self, items: list[str]):
+        for item in items:
+            self.bloom.add(item)
+        if self.redis is not None and items:
+            await self._flush(items)
+
+    async def _flush(self, items: list[str] | None = None) -> bool:
+        """Publish the items with the ones that failed before, False (and kept for later) if redis is down"""
+        items, self._pending = self._pending + (items or []), []
+        if not items:
+            return True
+        try:
+            await self._publish(items)
+        except Exception as exc:
+            logger.warning("Identity filter redis update failed, retrying on the next sync: %s", exc)
+            self._pending = items + self._pending
+            return False
+        return True
+
+    async def _publish(self, items: list[str]):
+        bits = self.redis.bitfield(self.key)
+        for item in items:
+            for position in self.bloom.positions(item):
+                bits.set("u1", position, 1)
+        await bits.execute()
+
+    async def _stream(self, after_id: int):
+        session_factory = self.session_factory or get_session_factory()
+        async with session_factory() as session:
+            async for user_id, email, username in UserRepo(session).stream_identities(after_id, self.batch_size):
+                yield user_id, [self._item("email", email), self._item("username", username)]
+
+    async def build(self):
+        """Add every user to the filter (and to redis if nobody built it yet), then trust its misses"""
+        start = time.perf_counter()
+        if self.redis is not None:
+            if await self.redis.exists(self.ready_key):
+                self.ready = True
+                return
+            if not await self.redis.set(self.lock_key, "1", nx=True, ex=600):
+                return  # another worker is building, the sync loop checks again
+
+        try:
+            batch = []
+            async for user_id, items in self._stream(0):
+                for item in items:
+                    self.bloom.add(item)
+                batch += items
+                self.last_id = max(self.last_id, user_id)
+                if self.redis is not None and len(batch) >= self.batch_size:
+                    await self._publish(batch)
+                    batch = []
+            if self.redis is not None:
+                if batch:
+                    await self._publish(batch)
+                await self.redis.set(self.last_id_key, self.last_id)
+                await self.redis.set(self.ready_key, "1")
+        finally:
+            if self.redis is not None:
+                await self.redis.delete(self.lock_key)  # released on failure too, another worker retries
+        self.ready = True
+        logger.info("Identity filter built with %d identities in %.3fs", len(self.bloom),
+                    time.perf_counter() - start)
+
+    async def sync(self):
+        if self.ready and self.redis is not None and not await self.redis.exists(self.ready_key):
+            logger.warning("Identity filter bits are gone from redis, rebuilding")
+            self.ready = False
+        if not self.ready:
+            await self.build()
+            return
+        if self.redis is None:
+            async for user_id, items in self._stream(max(0, self.last_id - self.resync_window)):
+                for item in items:
+                    self.bloom.add(item)
+                self.last_id = max(self.last_id, user_id)
+            return
+
+        if not await self._flush():
+            return
+        # rows inserted outside the app, read by whichever worker gets there first
+        last_id = int(await self.redis.get(self.last_id_key) or 0)
+        batch = []
+        async for user_id, items in self._stream(max(0, last_id - self.resync_window)):
+            batch += [item for item in items if item not in self.bloom]  # the window was published before
+            last_id = max(last_id, user_id)
+            if len(batch) >= self.batch_size:
+                await self._add_items(batch)
+                batch = []
+        if batch:
+            await self._add_items(batch)
+        if not self._pending:
+            await self.redis.set(self.last_id_key, last_id)
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as exc:
+                logger.warning("Identity filter sync failed: %s", exc)
+            # adds that didn't reach redis are retried sooner, other workers can't see them meanwhile
+            await asyncio.sleep(min(self.sync_interval, 1) if self._pending else self.sync_interval)
+
+    def start(self):
+        """Build the filter in the background, startup doesn't wait for the users table to be read"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever(), name="identity-filter-sync")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "identities": len(self.bloom),
+            "lookups": self.lookups,
+            "definite_misses": self.definite_misses,
+            "bloom_bytes": self.bloom.memory_bytes,
+            "bloom_false_positive_rate": self.bloom.false_positive_rate(),
+        }
+
+
+identity_filter = IdentityFilter(
+    redis=get_redis() if settings.identity_filter_backend == "redis" else None,
+    capacity=settings.identity_filter_capacity,
+    error_rate=settings.identity_filter_error_rate,
+    sync_interval=settings.identity_filter_sync_interval_seconds,
+    resync_window=settings.identity_filter_resync_window,
+)
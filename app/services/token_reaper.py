@@ -0,0 +1,122 @@
+"""
+Purge expired and revoked refresh tokens in bounded batches.
+
+Started from the app lifespan when ``token_reaper_enabled`` is set, or run by hand :
+    $ python -m app.services.token_reaper --once
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import get_settings, logger
+from app.core.log import setup_logging
+from app.db.repo.token import Token
+from app.db.session import dispose_engines, get_session_factory
+
+settings = get_settings()
+
+
+class TokenReaper:
+    """
+    Delete refresh tokens that expired or were revoked more than ``retention`` ago.
+
+    Each run deletes ``batch_size`` rows per statement and sleeps ``batch_sleep`` seconds between batches
+    so the purge never holds long locks or saturates the primary.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker[AsyncSession], batch_size: int = 1000,
+                 batch_sleep: float = 0.1, retention: timedelta = timedelta(hours=24), interval: float = 3600):
+        self.session_pool = session_pool
+        self.batch_size = batch_size
+        self.batch_sleep = batch_sleep
+        self.retention = retention
+        self.interval = interval
+        self.runs = 0
+        self.rows_purged = 0
+        self.seconds_spent = 0.0
+        self.last_run_at: datetime | None = None
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> int:
+        """Purge until a batch comes back short, return the number of deleted rows"""
+        cutoff = datetime.now(UTC) - self.retention
+        start = time.perf_counter()
+        purged = 0
+        try:
+            while True:
+                async with self.session_pool() as session:
+                    deleted = await Token(session).delete_expired_batch(cutoff=cutoff, batch_size=self.batch_size)
+                purged += deleted
+                if deleted < self.batch_size:
+                    break
+                await asyncio.sleep(self.batch_sleep)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.runs += 1
+            self.rows_purged += purged
+            self.seconds_spent += elapsed
+            self.last_run_at = datetime.now(UTC)
+            logger.info("Token reaper purged %d refresh tokens in %.3fs", purged, elapsed)
+        return purged
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:
+                logger.error("Token reaper run failed: %s", exc)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever(), name="token-reaper")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "rows_purged": self.rows_purged,
+            "seconds_spent": self.seconds_spent,
+            "last_run_at": self.last_run_at,
+        }
+
+
+def create_token_reaper(session_pool: async_sessionmaker[AsyncSession]) -> TokenReaper:
+    """Build a reaper configured from settings"""
+    return TokenReaper(
+        session_pool=session_pool,
+        batch_size=settings.token_reaper_batch_size,
+        batch_sleep=settings.token_reaper_batch_sleep_seconds,
+        retention=timedelta(hours=settings.token_reaper_retention_hours),
+        interval=settings.token_reaper_interval_seconds,
+    )
+
+
+async def main(once: bool):
+    reaper = create_token_reaper(get_session_factory())
+    try:
+        if once:
+            await reaper.run_once()
+        else:
+            await reaper.run_forever()
+    finally:
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Purge expired and revoked refresh tokens")
+    parser.add_argument("--once", action="store_true", help="run a single purge and exit")
+    args = parser.parse_args()
+    setup_logging(settings)
+    asyncio.run(main(args.once))
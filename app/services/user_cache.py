@@ -0,0 +1,226 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from app.core.config import get_settings, logger
+from app.core.redis import get_redis
+from app.db.models.user import User, Role
+
+settings = get_settings()
+
+# What get_current_user and the routes behind it read. Never the password hash, the snapshot sits in every
+# worker's memory and in the shared redis.
+_USER_COLUMNS = ("id", "username", "email", "first_name", "last_name", "role", "create_at", "update_at")
+
+
+def _to_snapshot(user: User) -> dict:
+    return {key: getattr(user, key) for key in _USER_COLUMNS}
+
+
+def _from_snapshot(snapshot: dict) -> User:
+    """Build a new transient (session-less) user from a snapshot, every hit gets its own instance"""
+    return User(**snapshot)
+
+
+def _dump_snapshot(snapshot: dict) -> str:
+    data = dict(snapshot)
+    data["role"] = data["role"].value if isinstance(data["role"], Role) else data["role"]
+    for key in ("create_at", "update_at"):
+        if isinstance(data.get(key), datetime):
+            data[key] = data[key].isoformat()
+    return json.dumps(data)
+
+
+def _load_snapshot(raw: str) -> dict:
+    data = json.loads(raw)
+    data["role"] = Role(data["role"]) if data.get("role") else None
+    for key in ("create_at", "update_at"):
+        if data.get(key):
+            data[key] = datetime.fromisoformat(data[key])
+    return data
+
+
+class UserCache:
+    """
+    Cache of users for verified access tokens, used by ``get_current_user`` to skip the user SELECT.
+
+    Entries are keyed by (user id, token id) where the token id is the ``jti`` claim, they live until the
+    token expires or ``ttl_seconds`` whichever comes first, and the memory tier is a bounded LRU.
+    With the "redis" backend a shared redis tier sits behind the memory tier so workers share entries, and
+    invalidations are published so every worker drops the user from its memory tier (``start`` runs the
+    listener). Without redis an invalidation only reaches the calling process.
+    """
+
+    CHANNEL = "user_cache:invalidate"
+
+    def __init__(self, max_size: int = 10_000, ttl_seconds: int = 60, backend: str = "memory",
+                 enabled: bool = True):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[int, str], tuple[float, dict]] = OrderedDict()
+        self._by_user: dict[int, set[str]] = {}
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def _redis_key(user_id: int, token_id: str | None = None) -> str:
+        if token_id is None:
+            return f"user_cache:{user_id}"
+        return f"user_cache:{user_id}:{token_id}"
+
+    def _redis(self):
+        return get_redis() if self.backend == "redis" else None
+
+    def _ttl(self, token_exp: int | float | None) -> float:
+        ttl = float(self.ttl_seconds)
+        if token_exp is not None:
+            ttl = min(ttl, float(token_exp) - time.time())
+        return ttl
+
+    def _store(self, user_id: int, token_id: str, ttl: float, snapshot: dict):
+        key = (user_id, token_id)
+        self._entries[key] = (time.monotonic() + ttl, snapshot)
+        self._entries.move_to_end(key)
+        self._by_user.setdefault(user_id, set()).add(token_id)
+        while len(self._entries) > self.max_size:
+            self._drop(*self._entries.popitem(last=False)[0], pop=False)
+
+    def _drop(self, user_id: int, token_id: str, pop: bool = True):
+        if pop:
+            self._entries.pop((user_id, token_id), None)
+        token_ids = self._by_user.get(user_id)
+        if token_ids is not None:
+            token_ids.discard(token_id)
+            if not token_ids:
+                del self._by_user[user_id]
+
+    async def get(self, user_id: int, token_id: str) -> User | None:
+        """Return a detached copy of the cached user or None on a miss"""
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get((user_id, token_id))
+        if entry is not None:
+            expires_at, snapshot = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end((user_id, token_id))
+                self.hits += 1
+                return _from_snapshot(snapshot)
+            self._drop(user_id, token_id)
+
+        redis = self._redis()
+        if redis is not None:
+            try:
+                key = self._redis_key(user_id, token_id)
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.get(key)
+                    pipe.pttl(key)
+                    raw, ttl_ms = await pipe.execute()
+            except Exception as exc:
+                logger.warning("User cache redis get failed: %s", exc)
+                raw = None
+            if raw is not None and ttl_ms > 0:
+                snapshot = _load_snapshot(raw)
+                self._store(user_id, token_id, ttl_ms / 1000, snapshot)
+                self.hits += 1
+                return _from_snapshot(snapshot)
+
+        self.misses += 1
+        return None
+
+    async def set(self, user: User, token_id: str, token_exp: int | float | None = None):
+        """Cache the user for the given token until ``token_exp`` (unix timestamp) or the cache ttl"""
+        if not self.enabled:
+            return
+
+        ttl = self._ttl(token_exp)
+        if ttl <= 0:
+            return
+
+        snapshot = _to_snapshot(user)
+        self._store(user.id, token_id, ttl, snapshot)
+
+        redis = self._redis()
+        if redis is not None:
+            try:
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.set(self._redis_key(user.id, token_id), _dump_snapshot(snapshot), ex=max(1, int(ttl)))
+                    pipe.sadd(self._redis_key(user.id), token_id)
+                    pipe.expire(self._redis_key(user.id), self.ttl_seconds)
+                    await pipe.execute()
+            except Exception as exc:
+                logger.warning("User cache redis set failed: %s", exc)
+
+    def _drop_user(self, user_id: int):
+        for token_id in list(self._by_user.get(user_id, ())):
+            self._drop(user_id, token_id)
+
+    async def invalidate_user(self, user_id: int):
+        """Drop every cached token of the user on every worker, call it on logout, password change and role change"""
+        self._drop_user(user_id)
+
+        redis = self._redis()
+        if redis is not None:
+            try:
+                token_ids = await redis.smembers(self._redis_key(user_id))
+                keys = [self._redis_key(user_id, token_id) for token_id in token_ids]
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.delete(self._redis_key(user_id), *keys)
+                    pipe.publish(self.CHANNEL, user_id)
+                    await pipe.execute()
+            except Exception as exc:
+                logger.warning("User cache redis invalidation failed: %s", exc)
+
+    async def listen(self):
+        """Drop the memory entries of the users invalidated by any worker, until the connection fails"""
+        pubsub = self._redis().pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self._drop_user(int(message["data"]))
+        finally:
+            await pubsub.aclose()
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.listen()
+            except Exception as exc:
+                logger.warning("User cache invalidation listener failed: %s", exc)
+            # invalidations published while disconnected are lost, forget what they may have covered
+            self.clear()
+            await asyncio.sleep(1)
+
+    def start(self):
+        if self.enabled and self._redis() is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run_forever(), name="user-cache-invalidation")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def clear(self):
+        self._entries.clear()
+        self._by_user.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+user_cache = UserCache(
+    max_size=settings.user_cache_max_size,
+    ttl_seconds=settings.user_cache_ttl_seconds,
+    backend=settings.user_cache_backend,
+    enabled=settings.user_cache_enabled,
+)
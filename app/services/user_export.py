@@ -0,0 +1,60 @@
+"""
+Streaming user export, used by ``GET /api/v1/admin/users/export``.
+
+Rows are read from a server side cursor and written out batch by batch, memory use doesn't grow with the
+number of users.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator
+
+from app.core.config import get_settings
+from app.db.models.user import Role
+from app.db.repo.user import EXPORT_COLUMNS, UserRepo
+
+settings = get_settings()
+
+FIELDS = [column.key for column in EXPORT_COLUMNS]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _value(value):
+    if isinstance(value, Role):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def export_users(repo: UserRepo, fmt: str = "ndjson", role: Role | None = None,
+                       created_from: datetime | None = None, created_to: datetime | None = None,
+                       batch_size: int | None = None) -> AsyncIterator[str]:
+    """Yield the export as text chunks of ``batch_size`` rows, csv starts with a header line"""
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unknown export format: {fmt}")
+    batch_size = batch_size or settings.user_export_batch_size
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(FIELDS)
+
+    rows = 0
+    async for row in repo.stream_users(role=role, created_from=created_from, created_to=created_to,
+                                       batch_size=batch_size):
+        values = [_value(value) for value in row]
+        if writer is not None:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(FIELDS, values))))
+            buffer.write("\n")
+        rows += 1
+        if rows % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,249 @@
+"""
+Bulk user import from NDJSON or CSV streams.
+
+Used by ``POST /api/v1/admin/users/import`` and from the command line :
+    $ python -m app.services.user_import users.ndjson
+    $ python -m app.services.user_import users.csv --format csv
+
+Every record needs ``username``, ``email``, ``first_name``, ``last_name`` and either ``password`` (hashed here)
+or ``hashed_password`` (an existing bcrypt digest, stored as is). The command line hashes on a process pool of
+its own, an HTTP import shares the app's password hasher pool with the logins.
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+from app.core.config import get_settings, logger
+from app.core.log import setup_logging
+from app.core.security import PasswordHasherPool, hash_passwords, mark_imported_hash, password_hasher
+from app.db.models.user import Role
+from app.db.repo.user import UserRepo
+from app.db.session import dispose_engines, get_session_factory
+from app.services.identity_filter import identity_filter
+
+settings = get_settings()
+
+REQUIRED_FIELDS = ("username", "email", "first_name", "last_name")
+MAX_REPORTED_FAILURES = 1000
+MAX_CSV_RECORD_LINES = 100
+
+
+@dataclass
+class ImportReport:
+    received: int = 0
+    inserted: int = 0
+    skipped: int = 0  # email or username already registered
+    failed: int = 0
+    failures: list[dict] = field(default_factory=list)
+
+    def fail(self, line: int, error: str):
+        self.failed += 1
+        if len(self.failures) < MAX_REPORTED_FAILURES:
+            self.failures.append({"line": line, "error": error})
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream in text lines without holding more than one chunk in memory"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, list[str] | None, str | None]]:
+    """
+    Yield (first line number, values, parse error) for every csv record, a quoted field may span lines.
+
+    One ``csv.reader`` reads the whole stream from a line queue. A record is handed over once its lines are
+    complete, that is when the quotes read so far are balanced (an escaped quote is doubled).
+    """
+    lines: deque[str] = deque()
+    reader = csv.reader(iter(lines.popleft, None))  # only asked for a record whose lines are all queued
+    start = quotes = 0
+
+    def parse() -> tuple[list[str] | None, str | None]:
+        try:
+            return next(reader), None
+        except csv.Error as exc:
+            return None, f"parse error: {exc}"
+        finally:
+            lines.clear()
+
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        if not lines:
+            if not line.strip():
+                continue
+            start, quotes = line_number, 0
+        lines.append(line + "\n")
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            yield start, *parse()
+        elif len(lines) >= MAX_CSV_RECORD_LINES:
+            lines.clear()
+            yield start, None, f"parse error: quoted field not closed within {MAX_CSV_RECORD_LINES} lines"
+    if lines:
+        lines.clear()
+        yield start, None, "parse error: unexpected end of data in a quoted field"
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """Yield (line number, record, parse error) for every non empty line (csv record), csv needs a header"""
+    if fmt == "csv":
+        header = None
+        async for line_number, values, error in iter_csv_rows(chunks):
+            if error is not None:
+                yield line_number, None, error
+            elif header is None:
+                header = [name.strip() for name in values]
+            else:
+                yield line_number, dict(zip(header, values)), None
+        return
+
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("record is not an object")
+        except ValueError as exc:
+            yield line_number, None, f"parse error: {exc}"
+            continue
+        yield line_number, record, None
+
+
+def _validate(record: dict) -> dict:
+    missing = [name for name in REQUIRED_FIELDS if not record.get(name)]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    if not record.get("password") and not record.get("hashed_password"):
+        raise ValueError("missing password or hashed_password")
+
+    row = {name: str(record[name]).strip() for name in REQUIRED_FIELDS}
+    row["role"] = Role.USER
+    if record.get("hashed_password"):
+        row["hashed_password"] = mark_imported_hash(str(record["hashed_password"]).strip())
+    return row
+
+
+class UserImporter:
+    """
+    Validate, hash and insert records in chunks of ``chunk_size``.
+
+    Plain passwords of a chunk are hashed in batches on ``hasher``, rows are written with one multi-row
+    ``INSERT ... ON CONFLICT DO NOTHING`` per chunk, so existing users are skipped and reported, not fatal.
+    :param hasher: pool the batches run on, the app's ``password_hasher`` by default
+    :param concurrency: batches in flight, defaults to half the concurrency of the shared pool (logins keep
+        the other half) or all of it for a dedicated pool
+    """
+
+    def __init__(self, repo: UserRepo, chunk_size: int | None = None, hasher: PasswordHasherPool | None = None,
+                 concurrency: int | None = None):
+        self.repo = repo
+        self.chunk_size = chunk_size or settings.user_import_chunk_size
+        self.hasher = hasher or password_hasher
+        shared = self.hasher is password_hasher
+        self.concurrency = concurrency or max(1, self.hasher.max_concurrency // (2 if shared else 1))
+        self.report = ImportReport()
+
+    async def _hash(self, passwords: list[str]) -> list[str]:
+        # small batches, a login waiting for the shared pool never queues behind a whole chunk
+        size = max(1, min(settings.user_import_hash_batch_size, -(-len(passwords) // self.concurrency)))
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def hash_batch(batch: list[str]) -> list[str]:
+            async with slots:
+                return await self.hasher.run(hash_passwords, batch)
+
+        hashed = await asyncio.gather(*(hash_batch(passwords[i:i + size]) for i in range(0, len(passwords), size)))
+        return [digest for batch in hashed for digest in batch]
+
+    async def _flush(self, chunk: list[tuple[int, dict, str | None]]):
+        to_hash = [(row, password) for _, row, password in chunk if password is not None]
+        if to_hash:
+            digests = await self._hash([password for _, password in to_hash])
+            for (row, _), digest in zip(to_hash, digests):
+                row["hashed_password"] = digest
+
+        inserted = await self.repo.bulk_insert([row for _, row, _ in chunk])
+        self.report.inserted += len(inserted)
+        await identity_filter.add_identities(inserted)
+        for line, row, _ in chunk:
+            key = (row["email"], row["username"])
+            if key in inserted:
+                inserted.discard(key)  # a repeated row of the same chunk is a conflict
+            else:
+                self.report.skipped += 1
+                if len(self.report.failures) < MAX_REPORTED_FAILURES:
+                    self.report.failures.append({"line": line, "error": "email or username already registered"})
+
+    async def run(self, chunks: AsyncIterator[bytes], fmt: str = "ndjson") -> ImportReport:
+        if fmt not in ("ndjson", "csv"):
+            raise ValueError(f"Unknown import format: {fmt}")
+
+        chunk: list[tuple[int, dict, str | None]] = []
+        async for line, record, error in iter_records(chunks, fmt):
+            self.report.received += 1
+            if error is None:
+                try:
+                    row = _validate(record)
+                except ValueError as exc:
+                    error = str(exc)
+            if error is not None:
+                self.report.fail(line, error)
+                continue
+
+            chunk.append((line, row, None if "hashed_password" in row else str(record["password"])))
+            if len(chunk) >= self.chunk_size:
+                await self._flush(chunk)
+                chunk = []
+        if chunk:
+            await self._flush(chunk)
+
+        logger.info("User import done: %d received, %d inserted, %d skipped, %d failed", self.report.received,
+                    self.report.inserted, self.report.skipped, self.report.failed)
+        return self.report
+
+
+async def _read_file(path: str, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := await asyncio.to_thread(file.read, chunk_size):
+            yield chunk
+
+
+async def main(path: str, fmt: str):
+    # nothing else runs in this process, every CPU hashes
+    hasher = PasswordHasherPool("process", max_workers=settings.user_import_workers or os.cpu_count() or 1)
+    try:
+        async with get_session_factory()() as session:
+            report = await UserImporter(UserRepo(session), hasher=hasher).run(_read_file(path), fmt)
+        print(json.dumps(report.__dict__, indent=2))
+    finally:
+        hasher.shutdown()
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import users from NDJSON or CSV")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("ndjson", "csv"), default=None,
+                        help="defaults to csv for .csv files, ndjson otherwise")
+    args = parser.parse_args()
+    setup_logging(settings)
+    asyncio.run(main(args.path, args.format or ("csv" if args.path.endswith(".csv") else "ndjson")))
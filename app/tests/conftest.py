@@ -11,6 +11,7 @@ logger.info(f"SET ENV : test")
 
 import pytest
 import asyncio
+import time
 from fastapi.testclient import TestClient
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from app.db.setup import Base
@@ -59,14 +60,47 @@ def create_session_pool(create_engine):
 
 
 @pytest.fixture(scope="session")
-def pre_load(create_session_pool):
+def pre_load(create_session_pool, create_engine):
+    from app.services.auth_service import auth_service
+    from app.services.identity_filter import identity_filter
+
     logger.info("Setting up override session pool")
     app.dependency_overrides[get_session_pool] = create_session_pool
+    # background password rehashes and the identity filter open their own sessions
+    auth_service.session_factory = async_sessionmaker(bind=create_engine, expire_on_commit=False)
+    identity_filter.session_factory = auth_service.session_factory
 
 
 @pytest.fixture(scope="session")
 def client(pre_load):
     logger.info("Setting up test client")
+    from app.services.identity_filter import identity_filter
+
     with TestClient(app) as c:
+        # the filter is built in the background, on the one connection of the in-memory database
+        deadline = time.monotonic() + 10
+        while not identity_filter.ready and time.monotonic() < deadline:
+            time.sleep(0.05)
         yield c
     app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="session")
+def admin_cookies(client, create_engine):
+    """Sign up a user, promote it to admin directly in the database and return its auth cookies"""
+    from sqlalchemy import update
+    from app.db.models.user import User, Role
+
+    signup_data = {"username": "root", "email": "root@mail.com", "first_name": "root", "last_name": "admin",
+                   "password": "root"}
+    assert client.post("/api/v1/auth/signup", json=signup_data).status_code == 200
+
+    async def promote():
+        async with create_engine.begin() as conn:
+            await conn.execute(update(User).where(User.email == signup_data["email"]).values(role=Role.ADMIN))
+
+    asyncio.get_event_loop().run_until_complete(promote())
+    response = client.post("/api/v1/auth/signin",
+                           json={"username": signup_data["email"], "password": signup_data["password"]})
+    assert response.status_code == 200
+    return dict(response.cookies)
@@ -0,0 +1,169 @@
+import time
+
+import fakeredis
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.security import hash_password
+from app.db.models.user import User
+from app.db.repo.user import UserRepo
+from app.services.identity_filter import IdentityFilter, identity_filter
+
+root_api_path = "/api/v1"
+
+
+class BrokenRedis:
+    """Redis client whose commands always fail, as if the server was down"""
+
+    def bitfield(self, key):
+        raise ConnectionError("redis is down")
+
+    def pipeline(self, transaction=True):
+        raise ConnectionError("redis is down")
+
+
+async def _insert_user(create_engine, name: str, **values):
+    async with create_engine.begin() as conn:
+        await conn.execute(insert(User).values(email=f"{name}@mail.com", username=name, first_name=name,
+                                               last_name=name, hashed_password=hash_password(name), **values))
+
+
+def test_memory_filter_builds_and_syncs(create_engine, event_loop):
+    """Built from the users table, rows written by another process are picked up by the next sync"""
+    bloom = IdentityFilter(capacity=1000, error_rate=0.001)
+    bloom.session_factory = async_sessionmaker(bind=create_engine, expire_on_commit=False)
+
+    async def run():
+        await _insert_user(create_engine, "bloom_before")
+        assert await bloom.might_exist("email", "never@mail.com")  # not built yet, every lookup is a maybe
+        await bloom.sync()
+        assert bloom.ready
+        results = [await bloom.might_exist("email", "bloom_before@mail.com"),
+                   await bloom.might_exist("username", "bloom_before"),
+                   await bloom.might_exist("email", "never@mail.com")]
+        await _insert_user(create_engine, "bloom_after")
+        await bloom.sync()
+        results.append(await bloom.might_exist("email", "bloom_after@mail.com"))
+        return results
+
+    assert event_loop.run_until_complete(run()) == [True, True, False, True]
+    assert bloom.stats()["definite_misses"] == 1
+
+
+def test_late_commit_below_the_last_seen_id_is_picked_up(create_engine, event_loop):
+    """A row committed after a higher id was synced is read again by the resync window"""
+    from sqlalchemy import func, select
+
+    bloom = IdentityFilter(capacity=1000, error_rate=0.001, resync_window=100)
+    bloom.session_factory = async_sessionmaker(bind=create_engine, expire_on_commit=False)
+
+    async def run():
+        await bloom.sync()
+        async with create_engine.connect() as conn:
+            top = (await conn.execute(select(func.max(User.id)))).scalar() or 0
+        await _insert_user(create_engine, "bloom_early_id_later", id=top + 20)
+        await bloom.sync()
+        await _insert_user(create_engine, "bloom_late_commit", id=top + 10)  # id taken before, committed after
+        await bloom.sync()
+        return await bloom.might_exist("email", "bloom_late_commit@mail.com")
+
+    assert event_loop.run_until_complete(run())
+
+
+def test_redis_filter_is_shared(create_engine, event_loop):
+    """One worker builds the bits in redis, the others use them and see each other's adds"""
+    redis = fakeredis.FakeAsyncRedis()
+    session_factory = async_sessionmaker(bind=create_engine, expire_on_commit=False)
+    first, second = IdentityFilter(redis, capacity=1000), IdentityFilter(redis, capacity=1000)
+    first.session_factory = second.session_factory = session_factory
+
+    async def run():
+        await first.sync()
+        await second.sync()
+        assert first.ready and second.ready
+        assert len(second.bloom) == 0  # the second worker didn't read the users table
+        await first.add("email", "shared@mail.com")
+        return [await second.might_exist("email", "shared@mail.com"),
+                await second.might_exist("email", "never@mail.com")]
+
+    assert event_loop.run_until_complete(run()) == [True, False]
+
+
+def test_redis_filter_rebuilds_after_losing_its_bits(create_engine, event_loop):
+    """A flushed redis (restart without persistence, eviction) is noticed instead of rejecting every user"""
+    redis = fakeredis.FakeAsyncRedis()
+    session_factory = async_sessionmaker(bind=create_engine, expire_on_commit=False)
+    first, second = IdentityFilter(redis, capacity=1000), IdentityFilter(redis, capacity=1000)
+    first.session_factory = second.session_factory = session_factory
+
+    async def run():
+        await _insert_user(create_engine, "bloom_flushed")
+        await first.sync()
+        await second.sync()
+        await redis.flushall()
+        results = [await second.might_exist("email", "bloom_flushed@mail.com")]  # maybe, not "unknown"
+        await second.sync()  # rebuilds the bits
+        results += [second.ready, await first.might_exist("email", "bloom_flushed@mail.com"),
+                    await first.might_exist("email", "never@mail.com")]
+        return results
+
+    assert event_loop.run_until_complete(run()) == [True, True, True, False]
+
+
+def test_redis_filter_picks_up_rows_inserted_outside_the_app(create_engine, event_loop):
+    redis = fakeredis.FakeAsyncRedis()
+    bloom = IdentityFilter(redis, capacity=1000)
+    bloom.session_factory = async_sessionmaker(bind=create_engine, expire_on_commit=False)
+    other = IdentityFilter(redis, capacity=1000)
+
+    async def run():
+        await bloom.sync()
+        await _insert_user(create_engine, "bloom_external")
+        await bloom.sync()
+        await other.build()  # already built, only checks the ready marker
+        return await other.might_exist("email", "bloom_external@mail.com")
+
+    assert event_loop.run_until_complete(run())
+
+
+def test_failed_publish_is_replayed_and_misses_untrusted_meanwhile(event_loop):
+    redis = fakeredis.FakeAsyncRedis()
+    bloom = IdentityFilter(redis, capacity=1000)
+
+    async def run():
+        await redis.set(bloom.ready_key, "1")
+        bloom.ready = True
+        bloom.redis = BrokenRedis()
+        await bloom.add("email", "pending@mail.com")
+        assert bloom._pending
+        # redis is back, the first command replays the add before trusting a miss
+        bloom.redis = redis
+        other = IdentityFilter(redis, capacity=1000)
+        other.ready = True
+        unknown = await bloom.might_exist("email", "never@mail.com")
+        return [unknown, bloom._pending, await other.might_exist("email", "pending@mail.com")]
+
+    assert event_loop.run_until_complete(run()) == [False, [], True]
+
+
+def test_redis_failure_answers_maybe(event_loop):
+    bloom = IdentityFilter(BrokenRedis(), capacity=1000)
+    bloom.ready = True
+    assert event_loop.run_until_complete(bloom.might_exist("email", "unknown@mail.com"))
+
+
+def test_signin_with_unknown_email_skips_the_database(client, monkeypatch):
+    deadline = time.monotonic() + 10
+    while not identity_filter.ready and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert identity_filter.ready
+
+    async def no_query(self, email):
+        raise AssertionError("the unknown email was looked up")
+
+    monkeypatch.setattr(UserRepo, "get_by_email", no_query)
+    misses = identity_filter.definite_misses
+    response = client.post(f"{root_api_path}/auth/signin",
+                           json={"username": "stuffing@mail.com", "password": "guess"})
+    assert response.status_code == 401
+    assert identity_filter.definite_misses == misses + 1
@@ -0,0 +1,91 @@
+import io
+import json
+import logging
+
+from app.core import log
+from app.core.log import LogPipeline, RateLimitFilter
+
+
+def make_record(name="app", level=logging.INFO, line=10, msg="hot path %s", args=("x",)):
+    return logging.LogRecord(name, level, "/app/hot.py", line, msg, args, None)
+
+
+def test_rate_limit_per_call_site(monkeypatch):
+    """A call site gets `limit` records per second, the next one let through reports the dropped ones"""
+    now = [100.0]
+    monkeypatch.setattr(log.time, "monotonic", lambda: now[0])
+    rate_limit = RateLimitFilter({"app": 2, "app.quiet": 0})
+
+    assert [rate_limit.filter(make_record()) for _ in range(5)] == [True, True, False, False, False]
+    assert rate_limit.filter(make_record(line=11))
+    assert rate_limit.filter(make_record(level=logging.ERROR))
+    assert all(rate_limit.filter(make_record(name="app.quiet")) for _ in range(5))
+    assert rate_limit.filter(make_record(name="app.auth", line=12))  # inherits the "app" limit
+    assert rate_limit.dropped == 3
+
+    now[0] += 1
+    record = make_record()
+    assert rate_limit.filter(record)
+    assert record.suppressed == 3
+    assert record.getMessage() == "hot path x (3 similar messages suppressed)"
+
+
+def test_json_pipeline_writes_from_listener():
+    """Records go through the queue and come out as one JSON object per line, extra fields included"""
+    stream = io.StringIO()
+    pipeline = LogPipeline()
+    pipeline.start("INFO", "json", {"app": 1}, stream=stream)
+    try:
+        logger = logging.getLogger("app.test")
+        for user_id, request_id in ((42, "abc"), (43, "def")):  # same call site, the second is rate limited
+            logger.info("user %s signed in", user_id, extra={"request_id": request_id})
+        logger.debug("not enabled %s", object())
+    finally:
+        pipeline.stop()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["message"] == "user 42 signed in"
+    assert lines[0]["level"] == "INFO"
+    assert lines[0]["logger"] == "app.test"
+    assert lines[0]["request_id"] == "abc"
+    assert pipeline.stats() == {"running": False, "records": 1, "rate_limited": 1}
+    assert not logging.getLogger().handlers
+
+
+def test_json_exception_keeps_the_traceback_apart():
+    stream = io.StringIO()
+    pipeline = LogPipeline()
+    pipeline.start("INFO", "json", stream=stream)
+    try:
+        try:
+            {}["missing"]
+        except KeyError:
+            logging.getLogger("app.test").exception("lookup of %s failed", "missing")
+    finally:
+        pipeline.stop()
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    entry = json.loads(lines[0])
+    assert entry["message"] == "lookup of missing failed"
+    assert entry["level"] == "ERROR"
+    assert entry["exc"].startswith("Traceback (most recent call last):")
+    assert "KeyError: 'missing'" in entry["exc"]
+
+
+def test_text_exception_keeps_the_traceback():
+    stream = io.StringIO()
+    pipeline = LogPipeline()
+    pipeline.start("INFO", "text", stream=stream)
+    try:
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            logging.getLogger("app.test").exception("failed")
+    finally:
+        pipeline.stop()
+
+    output = stream.getvalue()
+    assert "| failed\nTraceback (most recent call last):" in output
+    assert output.rstrip().endswith("ValueError: broken")
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from app.core.security import PasswordHasherPool
+
+
+def test_concurrency_is_bounded_and_waiters_are_counted(event_loop):
+    """At most max_concurrency jobs reach the executor, the other callers wait in queue_depth"""
+    pool = PasswordHasherPool("thread", max_workers=4, max_concurrency=2)
+    release = threading.Event()
+    running = []
+
+    def job(i):
+        running.append(i)
+        release.wait(5)
+        return i * 2
+
+    async def run():
+        tasks = [asyncio.create_task(pool.run(job, i)) for i in range(5)]
+        while len(running) < 2:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)  # the free workers stay idle, the semaphore holds the other jobs
+        busy = pool.stats()
+        release.set()
+        return busy, await asyncio.gather(*tasks)
+
+    try:
+        busy, results = event_loop.run_until_complete(run())
+    finally:
+        release.set()
+        pool.shutdown()
+    assert (busy["in_flight"], busy["queue_depth"]) == (2, 3)
+    assert results == [0, 2, 4, 6, 8]
+    assert (pool.in_flight, pool.queue_depth) == (0, 0)
+
+
+def test_executor_kind():
+    thread_pool = PasswordHasherPool("thread", max_workers=1)
+    process_pool = PasswordHasherPool("process", max_workers=1)
+    try:
+        assert isinstance(thread_pool._get_executor(), ThreadPoolExecutor)
+        assert isinstance(process_pool._get_executor(), ProcessPoolExecutor)
+        assert process_pool.max_concurrency == 1  # defaults to the executor size
+    finally:
+        thread_pool.shutdown()
+        process_pool.shutdown()
+
+    with pytest.raises(ValueError):
+        PasswordHasherPool("greenlet")
+
+
+def test_process_pool_runs_jobs(event_loop):
+    pool = PasswordHasherPool("process", max_workers=1)
+    try:
+        assert event_loop.run_until_complete(pool.run(pow, 2, 10)) == 1024
+    finally:
+        pool.shutdown()
+
+
+def test_shutdown_releases_the_executor_and_the_pool_restarts(event_loop):
+    pool = PasswordHasherPool("thread", max_workers=1)
+    assert event_loop.run_until_complete(pool.run(sum, [1, 2])) == 3
+    executor = pool._executor
+
+    pool.shutdown()
+    assert pool._executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(sum, [1])  # shut down for good
+    pool.shutdown()  # a second call is a no-op
+
+    assert event_loop.run_until_complete(pool.run(sum, [3, 4])) == 7
+    assert pool._executor is not executor
+    pool.shutdown()
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+from sqlalchemy import select
+
+from app.core import security
+from app.core.security import build_pwd_context, hash_password, password_needs_rehash, mark_imported_hash
+from app.db.models.user import User
+from app.db.repo.user import UserRepo
+from app.services import hash_calibration
+
+root_api_path = "/api/v1"
+
+signup_data = {"username": "rehash", "email": "rehash@mail.com", "first_name": "re", "last_name": "hash",
+               "password": "rehash"}
+
+
+def _stored_hash(create_engine, email: str) -> str:
+    async def load():
+        async with create_engine.connect() as conn:
+            return (await conn.execute(select(User.hashed_password).where(User.email == email))).scalar_one()
+
+    return asyncio.get_event_loop().run_until_complete(load())
+
+
+def _wait_for_hash(create_engine, email: str, prefix: str) -> str:
+    deadline = time.monotonic() + 10
+    while True:
+        stored = _stored_hash(create_engine, email)
+        if stored.startswith(prefix) or time.monotonic() > deadline:
+            return stored
+        time.sleep(0.05)
+
+
+def test_needs_rehash_follows_the_configured_cost(monkeypatch):
+    old = hash_password("secret")
+    monkeypatch.setattr(security, "pwd_context", build_pwd_context(bcrypt_rounds=10))
+    assert password_needs_rehash(old)
+    assert not password_needs_rehash(hash_password("secret"))
+    assert password_needs_rehash(mark_imported_hash(old))
+
+
+def test_signin_rehashes_in_the_background(client, create_engine, monkeypatch):
+    """Lowering the configured cost upgrades the stored hash on the next signin, the password keeps working"""
+    assert client.post(f"{root_api_path}/auth/signup", json=signup_data).status_code == 200
+    assert _stored_hash(create_engine, signup_data["email"]).startswith("$2b$12$")
+
+    monkeypatch.setattr(security, "pwd_context", build_pwd_context(bcrypt_rounds=10))
+    credentials = {"username": signup_data["email"], "password": signup_data["password"]}
+    assert client.post(f"{root_api_path}/auth/signin", json=credentials).status_code == 200
+
+    assert _wait_for_hash(create_engine, signup_data["email"], "$2b$10$").startswith("$2b$10$")
+    assert client.post(f"{root_api_path}/auth/signin", json=credentials).status_code == 200
+
+
+def test_rehashes_are_capped_and_skipped_while_logins_wait(monkeypatch, event_loop):
+    from app.services import auth_service as auth_module
+    from app.services.auth_service import AuthService
+
+    service = AuthService()
+    started = []
+
+    async def rehash(user_id, password, old_hash):
+        started.append(user_id)
+        await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(service, "_rehash", rehash)
+    monkeypatch.setattr(auth_module.settings, "password_rehash_max_in_flight", 1)
+
+    async def run():
+        service.schedule_rehash(1, "secret", "old")
+        service.schedule_rehash(2, "secret", "old")  # over the cap, left to the next login
+        await service.wait_rehashes()
+        monkeypatch.setattr(security.password_hasher, "queue_depth", 3)
+        service.schedule_rehash(2, "secret", "old")  # logins are waiting for the pool
+        await service.wait_rehashes()
+        monkeypatch.setattr(security.password_hasher, "queue_depth", 0)
+        service.schedule_rehash(2, "secret", "old")
+        await service.wait_rehashes()
+
+    event_loop.run_until_complete(run())
+    assert started == [1, 2]
+
+
+def test_update_password_hash_keeps_a_newer_password(create_engine):
+    """The write-back is skipped when the hash changed since the login read it"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async def run():
+        async with async_sessionmaker(bind=create_engine, expire_on_commit=False)() as session:
+            current = hash_password("newer")
+            user = User(username="rehash_newer", email="rehash_newer@mail.com", first_name="re", last_name="hash",
+                        hashed_password=current)
+            session.add(user)
+            await session.commit()
+            updated = await UserRepo(session).update_password_hash(user.id, "not-the-current-hash", "new")
+            stored = await session.execute(select(User.hashed_password).where(User.id == user.id))
+            return updated, stored.scalar_one() == current
+
+    assert asyncio.get_event_loop().run_until_complete(run()) == (False, True)
+
+
+def test_bcrypt_calibration_picks_the_highest_cost_within_budget(monkeypatch):
+    # every round doubles the cost: 10 -> 50 ms, 11 -> 100 ms, 12 -> 200 ms, 13 -> 400 ms
+    monkeypatch.setattr(hash_calibration, "measure_ms", lambda hasher, samples: 50 * 2 ** (hasher.default_rounds - 10))
+
+    calibration = hash_calibration.calibrate_bcrypt(250)
+    assert calibration.params == {"rounds": 12}
+    assert [row["rounds"] for row in calibration.measured] == [10, 11, 12, 13]
+    assert calibration.env() == {"PASSWORD_HASH_SCHEME": "bcrypt", "PASSWORD_BCRYPT_ROUNDS": "12"}
+    assert hash_calibration.calibrate_bcrypt(10).params == {"rounds": 10}
@@ -10,3 +10,11 @@ def test_00_hello_world(client):
     data = json.loads(response.text)
     logger.info(data)
     assert 'Hello World' in data['message']
+
+
+def test_01_metrics(client):
+    """Prometheus metrics endpoint : /metrics"""
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in response.text
+    assert 'password_hasher_queue_depth' in response.text
@@ -0,0 +1,62 @@
+import fakeredis
+import pytest
+from fastapi import HTTPException
+
+from app.core import rate_limiter
+from app.core.rate_limiter import RateLimiter
+
+
+class BrokenRedis:
+    """Redis client whose scripts always fail, as if the server was down"""
+
+    def register_script(self, script):
+        async def run(keys, args):
+            raise ConnectionError("redis is down")
+        return run
+
+
+def test_redis_sliding_window(event_loop):
+    """The lua script allows `limit` hits per window and reports when to retry"""
+    limiter = RateLimiter("test", limit=3, window=60, redis=fakeredis.FakeAsyncRedis())
+
+    async def run():
+        return [await limiter.hit("1.2.3.4") for _ in range(4)], await limiter.hit("5.6.7.8")
+
+    results, other_key = event_loop.run_until_complete(run())
+    assert [result.allowed for result in results] == [True, True, True, False]
+    assert [result.remaining for result in results[:3]] == [2, 1, 0]
+    assert 0 < results[3].retry_after <= 60
+    assert other_key.allowed
+
+
+def test_fallback_to_local_bucket(event_loop):
+    """When redis fails the limiter keeps enforcing the limit in-process"""
+    limiter = RateLimiter("test", limit=2, window=60, redis=BrokenRedis())
+
+    async def run():
+        return [(await limiter.hit("mail@mail.com")).allowed for _ in range(3)]
+
+    assert event_loop.run_until_complete(run()) == [True, True, False]
+
+
+def test_check_raises_429(event_loop):
+    """check() turns a rejected hit into 429 with Retry-After"""
+    limiter = RateLimiter("test", limit=1, window=60)
+
+    async def run():
+        await limiter.check("key")
+        await limiter.check("key")
+
+    with pytest.raises(HTTPException) as exc:
+        event_loop.run_until_complete(run())
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) >= 1
+
+
+def test_signin_is_limited_per_email(client, monkeypatch):
+    """Sign in attempts for the same email are shed before reaching the password check"""
+    monkeypatch.setattr(rate_limiter, "email_rate_limiter", RateLimiter("email", limit=2, window=60))
+    data = {"username": "brute@mail.com", "password": "wrong"}
+
+    statuses = [client.post("/api/v1/auth/signin", json=data).status_code for _ in range(3)]
+    assert statuses == [401, 401, 429]
@@ -0,0 +1,115 @@
+import fakeredis
+from redis.crc import key_slot
+
+from app.core import redis as redis_module
+from app.core.config import get_settings
+from app.core.security import create_refresh_token
+from app.db.repo.redis_token import RedisTokenStore
+
+root_api_path = "/api/v1"
+
+signup_data = {"username": "redis_sessions", "email": "redis_sessions@mail.com", "first_name": "redis",
+               "last_name": "sessions", "password": "redis_sessions"}
+
+
+def _tokens(user_id: int, *names: str) -> list[str]:
+    return [create_refresh_token({"sub": str(user_id), "name": name}) for name in names]
+
+
+class Users:
+    async def get_by_id(self, user_id: int):
+        return {"id": user_id}
+
+
+def test_store_rotate_revoke_and_cap(event_loop):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    store = RedisTokenStore(redis, Users())
+
+    first_token, second, third, second_rotated, second_again, stolen = _tokens(
+        1, "first", "second", "third", "second-rotated", "second-again", "stolen")
+
+    async def run():
+        first = await store.save_refresh_token(1, first_token, user_agent="phone")
+        await store.save_refresh_token(1, second, user_agent="laptop")
+        await store.save_refresh_token(1, third, user_agent="tablet", max_sessions=2)
+        assert [s.user_agent for s in await store.list_sessions(1)] == ["tablet", "laptop"]
+        assert await store.get_refresh_token(first_token) is None  # evicted above the cap
+
+        # only one of two refreshes presenting the same token rotates it, the session id is kept
+        assert await store.rotate_refresh_token(1, second, second_rotated) == {"id": 1}
+        assert await store.rotate_refresh_token(1, second, second_again) is None
+        assert await store.rotate_refresh_token(2, third, stolen) is None  # wrong owner
+        rotated = await store.get_refresh_token(second_rotated)
+        assert rotated.id == first.id + 1 and rotated.user_agent == "laptop"
+        assert await redis.ttl("refresh_token:{1}:" + rotated.token_hash) > 6 * 86400
+
+        tablet = (await store.list_sessions(1))[0]
+        assert await store.revoke_session(1, tablet.id)
+        assert not await store.revoke_session(1, tablet.id)
+        assert await store.revoke_all_sessions(1, keep_token=second_rotated) == 0
+        assert await store.revoked_by_token(second_rotated)
+        assert not await store.revoked_by_token(second_rotated)
+        assert not await store.revoked_by_token("not-a-token")
+        assert await store.list_sessions(1) == []
+
+    event_loop.run_until_complete(run())
+
+
+def test_keys_of_a_user_share_one_cluster_slot(event_loop):
+    """Every key a script touches carries the user's hash tag, so they map to the same Redis Cluster slot"""
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    store = RedisTokenStore(redis, Users())
+    tokens = _tokens(7, "a", "b", "c")
+
+    async def run():
+        for token in tokens:
+            await store.save_refresh_token(7, token, max_sessions=2)
+        await store.rotate_refresh_token(7, tokens[2], _tokens(7, "d")[0])
+        return await redis.keys("*")
+
+    keys = event_loop.run_until_complete(run())
+    assert len(keys) == 4  # two sessions, the session list and the id counter
+    assert all(key.startswith("refresh_token:{7}:") for key in keys)
+    assert len({key_slot(key.encode()) for key in keys}) == 1
+
+
+def test_expired_tokens_leave_the_session_list(event_loop):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    store = RedisTokenStore(redis, Users())
+    old, new = _tokens(1, "old", "new")
+
+    async def run():
+        await store.save_refresh_token(1, old)
+        await store.save_refresh_token(1, new)
+        await redis.delete("refresh_token:{1}:" + (await store.get_refresh_token(old)).token_hash)  # as if expired
+        assert [s.token_hash for s in await store.list_sessions(1)] == [(await store.get_refresh_token(new)).token_hash]
+        assert await redis.zcard("refresh_token:{1}:sessions") == 1
+
+    event_loop.run_until_complete(run())
+
+
+def test_auth_flow_on_redis_backend(client, monkeypatch):
+    """Signin, refresh, session listing and logout with the sessions in redis"""
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(get_settings(), "refresh_token_backend", "redis")
+    monkeypatch.setattr(redis_module, "get_redis", lambda: redis)
+
+    assert client.post(f"{root_api_path}/auth/signup", json=signup_data).status_code == 200
+    response = client.post(f"{root_api_path}/auth/signin",
+                           json={"username": signup_data["email"], "password": signup_data["password"]})
+    assert response.status_code == 200
+    cookies = dict(response.cookies)
+
+    response = client.post(f"{root_api_path}/auth/refresh", cookies={"refresh_token": cookies["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.json()["refresh_token"]
+    # the previous refresh token was consumed by the rotation
+    assert client.post(f"{root_api_path}/auth/refresh",
+                       cookies={"refresh_token": cookies["refresh_token"]}).status_code == 401
+
+    cookies = {"access_token": response.json()["access_token"], "refresh_token": rotated}
+    sessions = client.get(f"{root_api_path}/users/me/sessions", cookies=cookies).json()
+    assert [session["current"] for session in sessions] == [True]
+
+    assert client.post(f"{root_api_path}/auth/logout", cookies=cookies).status_code == 200
+    assert client.post(f"{root_api_path}/auth/refresh", cookies={"refresh_token": rotated}).status_code == 401
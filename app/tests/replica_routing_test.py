@@ -0,0 +1,119 @@
+import tempfile
+
+import pytest
+from sqlalchemy import Select, Update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.models.user import User
+from app.db.repo.request import RequestRepo
+from app.db.routing import ReplicaRouter
+from app.db.setup import Base, create_session_pool
+from app.schemas.user import UserSchemaIn
+
+
+def _user(name: str) -> User:
+    return User(username=name, email=f"{name}@mail.com", first_name=name, last_name="replica", hashed_password="-")
+
+
+@pytest.fixture(scope="module")
+def databases(event_loop):
+    """A primary and two replicas as separate sqlite files, each holding a different user"""
+    directory = tempfile.mkdtemp()
+    engines = {name: create_async_engine(f"sqlite+aiosqlite:///{directory}/{name}.db")
+               for name in ("primary", "replica1", "replica2")}
+
+    async def init():
+        for name, engine in engines.items():
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with create_session_pool(engine)() as session:
+                session.add(_user(name))
+                await session.commit()
+
+    async def dispose():
+        for engine in engines.values():
+            await engine.dispose()
+
+    event_loop.run_until_complete(init())
+    yield engines
+    event_loop.run_until_complete(dispose())
+
+
+def test_reads_round_robin_over_replicas(databases, event_loop):
+    router = ReplicaRouter([databases["replica1"], databases["replica2"]])
+    session_pool = create_session_pool(databases["primary"], router)
+
+    async def run():
+        found = []
+        for _ in range(4):
+            async with session_pool() as session:
+                repo = RequestRepo(session)
+                found.append(await repo.user.get_by_id(1))
+        return [user.username for user in found]
+
+    assert event_loop.run_until_complete(run()) == ["replica1", "replica2", "replica1", "replica2"]
+    assert router.stats()["reads"] == 4
+
+
+def test_reads_after_a_write_stay_on_the_primary(databases, event_loop):
+    session_pool = create_session_pool(databases["primary"], ReplicaRouter([databases["replica1"]]))
+
+    async def run():
+        async with session_pool() as session:
+            repo = RequestRepo(session)
+            await repo.user.create(UserSchemaIn(username="written", email="written@mail.com", first_name="w",
+                                                last_name="w", password="written"))
+            return await repo.user.get_by_email("written@mail.com")
+
+    user = event_loop.run_until_complete(run())
+    assert user is not None and user.username == "written"
+
+
+def test_failed_replica_falls_back_to_the_primary(databases, event_loop):
+    broken = create_async_engine("sqlite+aiosqlite:////nonexistent/directory/replica.db")
+    router = ReplicaRouter([broken, databases["replica1"]], retry_seconds=60)
+    session_pool = create_session_pool(databases["primary"], router)
+
+    async def run():
+        found = []
+        for _ in range(3):
+            async with session_pool() as session:
+                found.append(await RequestRepo(session).user.get_by_id(1))
+        await broken.dispose()
+        return [user.username for user in found]
+
+    # first read fails over to the primary, then the broken replica is skipped
+    assert event_loop.run_until_complete(run()) == ["primary", "replica1", "replica1"]
+    assert router.stats() == {"replicas": 2, "healthy": 1, "reads": 3, "failures": 1}
+
+
+def test_reads_after_a_rotation_stay_on_the_primary(databases, event_loop):
+    session_pool = create_session_pool(databases["primary"], ReplicaRouter([databases["replica1"]]))
+
+    async def run():
+        async with session_pool() as session:
+            await RequestRepo(session).token.save_refresh_token(1, "replica-rotation")
+        async with session_pool() as session:
+            repo = RequestRepo(session)
+            owner = await repo.token.rotate_refresh_token(1, "replica-rotation", "replica-rotated")
+            return owner, await repo.user.get_by_id(1)
+
+    owner, user = event_loop.run_until_complete(run())
+    assert owner.username == user.username == "primary"
+
+
+def test_update_loaded_through_from_statement_is_a_write(databases, event_loop):
+    """The shape of the PostgreSQL rotation: ``select(User).from_statement(UPDATE ... RETURNING users)``"""
+    session_pool = create_session_pool(databases["primary"], ReplicaRouter([databases["replica1"]]))
+
+    async def run():
+        async with session_pool() as session:
+            repo = RequestRepo(session)
+            stmt = Update(User).where(User.id == 1).values(last_name="rotated").returning(User)
+            await repo.user._execute(Select(User).from_statement(stmt))
+            assert session.sync_session.wrote and repo.user._has_writes()
+            username = (await repo.user.get_by_id(1)).username
+            await session.rollback()
+            return username
+
+    assert event_loop.run_until_complete(run()) == "primary"
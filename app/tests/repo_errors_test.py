@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.metrics import DB_RETRIES
+from app.db.errors import (ConflictError, RepoTimeoutError, SerializationError, UnavailableError, classify)
+from app.db.models.refresh_token import RefreshToken
+from app.db.repo import user as user_repo_module
+from app.db.repo.request import RequestRepo
+
+root_api_path = "/api/v1"
+
+
+class _Orig(Exception):
+    def __init__(self, sqlstate):
+        self.sqlstate = sqlstate
+
+
+def test_classify():
+    assert isinstance(classify(IntegrityError("INSERT", {}, Exception("unique"))), ConflictError)
+    assert isinstance(classify(OperationalError("SELECT", {}, Exception("gone"))), UnavailableError)
+    assert isinstance(classify(ConnectionRefusedError()), UnavailableError)
+    assert isinstance(classify(PoolTimeoutError("pool")), RepoTimeoutError)
+    assert isinstance(classify(OperationalError("UPDATE", {}, _Orig("40001"))), SerializationError)
+    assert isinstance(classify(OperationalError("SELECT", {}, _Orig("57014"))), RepoTimeoutError)
+    assert classify(OperationalError("SELECT", {}, Exception("gone"))).retryable
+    assert not classify(IntegrityError("INSERT", {}, Exception("unique"))).retryable
+
+
+def test_transient_errors_are_retried(create_engine, event_loop, monkeypatch):
+    session_pool = async_sessionmaker(bind=create_engine, expire_on_commit=False)
+
+    async def run():
+        async with session_pool() as session:
+            execute = session.execute
+            failures = []
+
+            async def flaky_execute(stmt, *args, **kwargs):
+                if not failures:
+                    failures.append(stmt)
+                    raise OperationalError("SELECT", {}, Exception("connection reset"))
+                return await execute(stmt, *args, **kwargs)
+
+            monkeypatch.setattr(session, "execute", flaky_execute)
+            return await RequestRepo(session).user.get_by_id(1), failures
+
+    retries = DB_RETRIES.labels("select", "unavailable")._value.get()
+    _, failures = event_loop.run_until_complete(run())
+    assert len(failures) == 1
+    assert DB_RETRIES.labels("select", "unavailable")._value.get() == retries + 1
+
+
+def test_transaction_groups_writes(client, create_engine, event_loop):
+    signup_data = {"username": "grouped", "email": "grouped@mail.com", "first_name": "grouped",
+                   "last_name": "writes", "password": "grouped"}
+    user_id = client.post(f"{root_api_path}/auth/signup", json=signup_data).json()["id"]
+    session_pool = async_sessionmaker(bind=create_engine, expire_on_commit=False)
+
+    async def count_tokens():
+        async with session_pool() as session:
+            result = await session.execute(select(RefreshToken).where(RefreshToken.user_id == user_id))
+            return len(result.scalars().all())
+
+    async def failing_block():
+        async with session_pool() as session:
+            repo = RequestRepo(session)
+            async with repo.transaction():
+                await repo.token.save_refresh_token(user_id, "grouped-1")
+                await repo.token.save_refresh_token(user_id, "grouped-2")
+                raise RuntimeError("abort")
+
+    async def block():
+        async with session_pool() as session:
+            repo = RequestRepo(session)
+            async with repo.transaction():
+                await repo.token.save_refresh_token(user_id, "grouped-1")
+                await repo.token.save_refresh_token(user_id, "grouped-2")
+                assert session.in_transaction()
+
+    with pytest.raises(RuntimeError):
+        event_loop.run_until_complete(failing_block())
+    assert event_loop.run_until_complete(count_tokens()) == 0
+    event_loop.run_until_complete(block())
+    assert event_loop.run_until_complete(count_tokens()) == 2
+
+
+def test_unavailable_database_is_a_503(client, monkeypatch):
+    async def unavailable(password):
+        raise UnavailableError("connection refused")
+
+    monkeypatch.setattr(user_repo_module, "hash_password_async", unavailable)
+    response = client.post(f"{root_api_path}/auth/signup",
+                           json={"username": "down", "email": "down@mail.com", "first_name": "db",
+                                 "last_name": "down", "password": "down"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
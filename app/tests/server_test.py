@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from app import server
+
+
+def test_resolve_workers_defaults_to_cpus():
+    assert server.resolve_workers(3) == 3
+    assert server.resolve_workers(None) == (os.cpu_count() or 1)
+
+
+def test_resolve_loop_and_http_fall_back_when_not_installed(monkeypatch):
+    monkeypatch.setattr(server.importlib.util, "find_spec", lambda name: None)
+    assert server.resolve_loop("auto") == "asyncio"
+    assert server.resolve_http("auto") == "h11"
+    assert server.resolve_loop("uvloop") == "uvloop"
+    assert server.resolve_http("h11") == "h11"
+
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    monkeypatch.delenv("PASSWORD_HASH_WORKERS", raising=False)
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    monkeypatch.setattr(server.os, "cpu_count", lambda: 8)
+    yield
+    os.environ.pop("PASSWORD_HASH_WORKERS", None)
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+
+def test_prepare_worker_env_splits_the_hash_pool(clean_env):
+    server.prepare_worker_env(4)
+    assert os.environ["PASSWORD_HASH_WORKERS"] == "2"
+    assert os.path.isdir(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
+def test_prepare_worker_env_single_worker_keeps_local_metrics(clean_env):
+    server.prepare_worker_env(1)
+    assert os.environ["PASSWORD_HASH_WORKERS"] == "8"
+    assert "PROMETHEUS_MULTIPROC_DIR" not in os.environ
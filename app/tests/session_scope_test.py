@@ -0,0 +1,90 @@
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.db.repo.request import RequestRepo
+
+root_api_path = "/api/v1"
+
+
+def test_cache_hit_never_checks_out_a_connection(client, create_engine):
+    """A /users/me served from the user cache doesn't touch the connection pool"""
+    signup_data = {"username": "lazy", "email": "lazy@mail.com", "first_name": "lazy", "last_name": "session",
+                   "password": "lazy"}
+    assert client.post(f"{root_api_path}/auth/signup", json=signup_data).status_code == 200
+    response = client.post(f"{root_api_path}/auth/signin",
+                           json={"username": signup_data["email"], "password": signup_data["password"]})
+    cookies = dict(response.cookies)
+
+    # First call loads the user from the database and fills the cache
+    assert client.get(f"{root_api_path}/users/me", cookies=cookies).status_code == 200
+
+    checkouts = []
+
+    def on_checkout(*args):
+        checkouts.append(args)
+
+    event.listen(create_engine.sync_engine, "checkout", on_checkout)
+    try:
+        response = client.get(f"{root_api_path}/users/me", cookies=cookies)
+    finally:
+        event.remove(create_engine.sync_engine, "checkout", on_checkout)
+    assert response.status_code == 200
+    assert checkouts == []
+
+
+def test_reads_release_the_connection(create_engine, event_loop):
+    """Repos are cached per request and a read gives its connection back right away"""
+    session_pool = async_sessionmaker(bind=create_engine, expire_on_commit=False)
+
+    async def run():
+        async with session_pool() as session:
+            repo = RequestRepo(session)
+            assert repo.user is repo.user
+            user = await repo.user.get_by_email("lazy@mail.com")
+            return user, session.in_transaction()
+
+    user, in_transaction = event_loop.run_until_complete(run())
+    assert user is not None and user.username == "lazy"
+    assert in_transaction is False
+
+
+def test_read_after_an_uncommitted_write_keeps_the_transaction(tmp_path, event_loop):
+    """A read never commits a Core write or an ORM flush it didn't issue, rolling back still undoes them"""
+    from sqlalchemy import insert
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    import app.db.models  # noqa: F401, registers the tables
+    from app.core.security import hash_password
+    from app.db.models.user import User
+    from app.db.setup import Base
+
+    # own database, the shared in-memory one is a single connection the background tasks commit on too
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/scope.db")
+    session_pool = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    def user(name):
+        return dict(email=f"{name}@mail.com", username=name, first_name=name, last_name=name,
+                    hashed_password=hash_password(name))
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with session_pool() as session:
+            repo = RequestRepo(session)
+            await repo.user._execute(insert(User).values(**user("core_write")))
+            assert await repo.user.get_by_email("core_write@mail.com") is not None
+            still_open = session.in_transaction()
+            await session.rollback()
+
+            session.add(User(**user("orm_write")))
+            assert await repo.user.get_by_email("orm_write@mail.com") is not None  # autoflushed
+            still_open = still_open and session.in_transaction()
+            await session.rollback()
+
+            assert await repo.user.get_by_email("core_write@mail.com") is None
+            assert await repo.user.get_by_email("orm_write@mail.com") is None
+            result = still_open, session.in_transaction()
+        await engine.dispose()
+        return result
+
+    assert event_loop.run_until_complete(run()) == (True, False)
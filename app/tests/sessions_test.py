@@ -0,0 +1,87 @@
+from app.core.config import get_settings
+
+root_api_path = "/api/v1"
+
+signup_data = {"username": "devices", "email": "devices@mail.com", "first_name": "many", "last_name": "devices",
+               "password": "devices"}
+
+
+def _signin(client, device: str) -> dict:
+    response = client.post(f"{root_api_path}/auth/signin",
+                           json={"username": signup_data["email"], "password": signup_data["password"]},
+                           headers={"User-Agent": device})
+    assert response.status_code == 200
+    return dict(response.cookies)
+
+
+def _renewed(cookies: dict, response) -> dict:
+    """Cookies of the device after the response, a revocation makes the server rotate its tokens"""
+    return {**cookies, **dict(response.cookies)}
+
+
+def test_list_and_revoke_sessions(client):
+    assert client.post(f"{root_api_path}/auth/signup", json=signup_data).status_code == 200
+    phone = _signin(client, "phone")
+    laptop = _signin(client, "laptop")
+
+    response = client.get(f"{root_api_path}/users/me/sessions", cookies=laptop)
+    assert response.status_code == 200
+    sessions = response.json()
+    assert [(s["user_agent"], s["current"]) for s in sessions] == [("laptop", True), ("phone", False)]
+
+    phone_id = sessions[1]["id"]
+    assert client.delete(f"{root_api_path}/users/me/sessions/{phone_id}", cookies=laptop).status_code == 204
+    # the access token of the phone is revoked with its session, the laptop gets new tokens
+    assert client.get(f"{root_api_path}/users/me", cookies=phone).status_code == 401
+    response = client.get(f"{root_api_path}/users/me", cookies=laptop)
+    assert response.status_code == 200
+    laptop = _renewed(laptop, response)
+    assert client.delete(f"{root_api_path}/users/me/sessions/{phone_id}", cookies=laptop).status_code == 404
+    # the revoked refresh token can't be rotated anymore
+    assert client.post(f"{root_api_path}/auth/refresh", cookies=phone).status_code == 401
+
+    tablet = _signin(client, "tablet")
+    response = client.delete(f"{root_api_path}/users/me/sessions", cookies=laptop)
+    assert response.json() == {"revoked": 1}
+    assert client.get(f"{root_api_path}/users/me", cookies=tablet).status_code == 401
+    sessions = client.get(f"{root_api_path}/users/me/sessions", cookies=laptop).json()
+    assert [s["user_agent"] for s in sessions] == ["laptop"]
+
+
+def test_signin_evicts_the_oldest_sessions_above_the_cap(client, monkeypatch):
+    monkeypatch.setattr(get_settings(), "max_sessions_per_user", 2)
+    first = _signin(client, "first")
+    _signin(client, "second")
+    last = _signin(client, "third")
+
+    sessions = client.get(f"{root_api_path}/users/me/sessions", cookies=last).json()
+    assert [s["user_agent"] for s in sessions] == ["third", "second"]
+    assert client.post(f"{root_api_path}/auth/refresh", cookies=first).status_code == 401
+
+
+def test_refresh_token_lifetime_follows_the_setting(client, monkeypatch):
+    """The stored session, the refresh JWT and the cookie all expire after refresh_token_expire_days"""
+    from datetime import datetime, UTC
+
+    from app.core.security import decode_refresh_token
+
+    monkeypatch.setattr(get_settings(), "refresh_token_expire_days", 2)
+    user = {"username": "lifetime", "email": "lifetime@mail.com", "first_name": "life", "last_name": "time",
+            "password": "lifetime"}
+    assert client.post(f"{root_api_path}/auth/signup", json=user).status_code == 200
+    response = client.post(f"{root_api_path}/auth/signin",
+                           json={"username": user["email"], "password": user["password"]})
+    response = client.post(f"{root_api_path}/auth/refresh",
+                           cookies={"refresh_token": response.cookies["refresh_token"]})
+    assert response.status_code == 200
+    tokens = response.json()
+
+    two_days_from_now = datetime.now(UTC).timestamp() + 2 * 86400
+    assert f"Max-Age={2 * 86400}" in response.headers["set-cookie"]
+    assert abs(decode_refresh_token(tokens["refresh_token"])["exp"] - two_days_from_now) < 60
+
+    sessions = client.get(f"{root_api_path}/users/me/sessions", cookies=tokens).json()
+    expire_at = datetime.fromisoformat(sessions[0]["expire_at"])
+    if expire_at.tzinfo is None:  # sqlite drops the offset
+        expire_at = expire_at.replace(tzinfo=UTC)
+    assert abs(expire_at.timestamp() - two_days_from_now) < 60
@@ -0,0 +1,49 @@
+from app.db.repo import user as user_repo_module
+from app.services.auth_service import auth_service
+
+root_api_path = "/api/v1"
+
+signup_data = {"username": "unique", "email": "unique@mail.com", "first_name": "unique", "last_name": "user",
+               "password": "unique"}
+
+
+def test_signup_conflicts_resolved_by_the_insert(client):
+    """With nothing remembered, the insert itself reports which of email or username is taken"""
+    assert client.post(f"{root_api_path}/auth/signup", json=signup_data).status_code == 200
+    auth_service.taken_identities.clear()
+
+    response = client.post(f"{root_api_path}/auth/signup", json={**signup_data, "username": "other"})
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Email already registered"
+
+    auth_service.taken_identities.clear()
+    response = client.post(f"{root_api_path}/auth/signup", json={**signup_data, "email": "other@mail.com"})
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Username already registered"
+
+
+def test_signup_for_a_known_identity_skips_hashing(client, monkeypatch):
+    hashed = []
+
+    async def counting_hash(password):
+        hashed.append(password)
+        return "-"
+
+    monkeypatch.setattr(user_repo_module, "hash_password_async", counting_hash)
+    hits = auth_service.taken_identities.hits
+
+    response = client.post(f"{root_api_path}/auth/signup", json={**signup_data, "email": "other@mail.com"})
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Username already registered"
+    assert hashed == []
+    assert auth_service.taken_identities.hits == hits + 1
+
+
+def test_signup_conflicting_with_two_users(client):
+    other = {**signup_data, "username": "unique2", "email": "unique2@mail.com"}
+    assert client.post(f"{root_api_path}/auth/signup", json=other).status_code == 200
+    auth_service.taken_identities.clear()
+
+    response = client.post(f"{root_api_path}/auth/signup", json={**signup_data, "username": "unique2"})
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Email already registered"
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+
+def test_import_has_no_side_effects():
+    # a fresh interpreter, the test session already built the engine and installed handlers
+    code = (
+        "import logging, sys\n"
+        "import app.main\n"
+        "from app.db.session import get_engine, get_session_factory\n"
+        "assert get_engine.cache_info().currsize == 0, 'engine built at import'\n"
+        "assert get_session_factory.cache_info().currsize == 0, 'session factory built at import'\n"
+        "assert not logging.getLogger().handlers, 'log handlers installed at import'\n"
+        "loaded = {'asyncpg', 'uvicorn', 'coloredlogs'} & set(sys.modules)\n"
+        "assert not loaded, loaded\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], env={**os.environ, "ENV": "test"},
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_create_app_builds_independent_apps():
+    from app.main import create_app
+
+    first, second = create_app(), create_app()
+    assert first is not second
+    assert {route.path for route in first.routes} == {route.path for route in second.routes}
@@ -0,0 +1,90 @@
+from sqlalchemy import event
+
+from app.core.config import get_settings
+
+root_api_path = "/api/v1"
+
+
+def test_stateless_access_token(client, create_engine, monkeypatch):
+    """With stateless access tokens /users/me runs no query and logout revokes the access token"""
+    monkeypatch.setattr(get_settings(), "stateless_access_tokens", True)
+    signup_data = {"username": "stateless", "email": "stateless@mail.com", "first_name": "state",
+                   "last_name": "less", "password": "stateless"}
+    assert client.post(f"{root_api_path}/auth/signup", json=signup_data).status_code == 200
+    response = client.post(f"{root_api_path}/auth/signin",
+                           json={"username": signup_data["email"], "password": signup_data["password"]})
+    assert response.status_code == 200
+    cookies = dict(response.cookies)
+
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(create_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        response = client.get(f"{root_api_path}/users/me", cookies=cookies)
+    finally:
+        event.remove(create_engine.sync_engine, "before_cursor_execute", listener)
+    assert response.status_code == 200
+    assert response.json()["username"] == "stateless"
+    assert statements == []
+
+    assert client.post(f"{root_api_path}/auth/logout", cookies=cookies).status_code == 200
+    assert client.get(f"{root_api_path}/users/me", cookies=cookies).status_code == 401
+
+
+def test_revocation_made_during_a_sync_is_kept(event_loop):
+    """A revoke() landing while sync awaits redis survives the rebuild, even if redis didn't have it yet"""
+    import time
+
+    import fakeredis
+
+    from app.core.revocation import AccessTokenRevocationList
+
+    redis = fakeredis.FakeAsyncRedis()
+    revocations = AccessTokenRevocationList(redis, capacity=100)
+    expires_at = time.time() + 60
+    pipeline = redis.pipeline
+
+    def pipeline_with_a_revoke(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def execute_then_revoke():
+            result = await execute()
+            # the redis snapshot is taken, the local revoke lands before sync resumes
+            revocations._revoked["late"] = expires_at
+            revocations._bloom.add("late")
+            return result
+
+        pipe.execute = execute_then_revoke
+        return pipe
+
+    redis.pipeline = pipeline_with_a_revoke
+    event_loop.run_until_complete(revocations.sync())
+    assert revocations.is_revoked("late")
+
+
+def test_revoked_sessions_reach_every_worker(event_loop):
+    """Access tokens issued before the user revoked sessions are refused by the other workers after a sync"""
+    import time
+
+    import fakeredis
+
+    from app.core.revocation import AccessTokenRevocationList
+
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    worker, other = AccessTokenRevocationList(redis, token_ttl=60), AccessTokenRevocationList(redis, token_ttl=60)
+    issued_at = time.time()
+
+    event_loop.run_until_complete(worker.revoke_user(7))
+    assert worker.is_revoked_for_user(7, issued_at) and not other.is_revoked_for_user(7, issued_at)
+    event_loop.run_until_complete(other.sync())
+    assert other.is_revoked_for_user(7, issued_at) and other.is_revoked_for_user(7, None)
+    assert not other.is_revoked_for_user(7, time.time() + 1) and not other.is_revoked_for_user(8, issued_at)
+
+    # once every token it covers expired the cutoff is dropped
+    other.token_ttl = 0
+    event_loop.run_until_complete(other.sync())
+    assert other.stats()["revoked_users"] == 0
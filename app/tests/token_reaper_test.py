@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import Insert, Select, func
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.security import hash_refresh_token
+from app.db.models import RefreshToken, User
+from app.services.token_reaper import TokenReaper
+
+
+def test_reaper_purges_expired_and_revoked_tokens(create_engine, event_loop):
+    """Expired and old revoked tokens are deleted in batches, live tokens are kept"""
+    session_pool = async_sessionmaker(bind=create_engine, expire_on_commit=False)
+    now = datetime.now(UTC)
+
+    async def run():
+        async with session_pool() as session:
+            user_id = (await session.execute(
+                Insert(User).values(username="reaper", email="reaper@mail.com", first_name="reaper",
+                                    last_name="reaper", hashed_password="-").returning(User.id))).scalar_one()
+            tokens = [{"user_id": user_id, "token_hash": hash_refresh_token(f"expired-{i}"),
+                       "expire_at": now - timedelta(days=3)} for i in range(5)]
+            tokens.append({"user_id": user_id, "token_hash": hash_refresh_token("live"),
+                           "expire_at": now + timedelta(days=3)})
+            await session.execute(Insert(RefreshToken), tokens)
+            await session.commit()
+
+        reaper = TokenReaper(session_pool, batch_size=2, batch_sleep=0, retention=timedelta(days=1))
+        purged = await reaper.run_once()
+
+        async with session_pool() as session:
+            left = (await session.execute(
+                Select(func.count()).select_from(RefreshToken).where(RefreshToken.user_id == user_id))).scalar_one()
+        return purged, left, reaper.stats()
+
+    purged, left, stats = event_loop.run_until_complete(run())
+    assert purged == 5
+    assert left == 1
+    assert stats["runs"] == 1 and stats["rows_purged"] == 5
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+from jose import jwt
+
+from app.core import tokens
+from app.core.tokens import HS256Codec, JoseCodec, AsymmetricCodec, CachedTokenCodec, TokenError, ExpiredTokenError
+
+SECRET = "test-secret"
+
+
+def test_hs256_codec_is_interchangeable_with_jose():
+    """Tokens of the built-in codec decode with python-jose and the other way around"""
+    codec = HS256Codec(SECRET)
+    claims = {"sub": "1", "exp": int(time.time()) + 60, "jti": "abc"}
+
+    assert jwt.decode(codec.encode(claims), SECRET, algorithms=["HS256"]) == claims
+    assert codec.decode(JoseCodec(SECRET).encode(claims)) == claims
+
+
+def test_hs256_codec_rejects_bad_tokens():
+    """Tampered, foreign-key, expired and 'none' algorithm tokens are rejected"""
+    codec = HS256Codec(SECRET)
+    token = codec.encode({"sub": "1", "exp": int(time.time()) + 60})
+    header, payload, signature = token.split(".")
+
+    with pytest.raises(TokenError):
+        codec.decode(f"{header}.{payload}.{signature[:-2]}AA")
+    with pytest.raises(TokenError):
+        HS256Codec("other-secret").decode(token)
+    with pytest.raises(TokenError):
+        codec.decode(jwt.encode({"sub": "1"}, SECRET, algorithm="HS512"))
+    with pytest.raises(TokenError):
+        codec.decode("not-a-token")
+    with pytest.raises(ExpiredTokenError):
+        codec.decode(codec.encode({"sub": "1", "exp": int(time.time()) - 1}))
+
+
+def test_asymmetric_codec_key_rotation():
+    """Tokens signed with a retired key still verify while its public key is configured"""
+    pytest.importorskip("jwt")
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+    def pem_pair():
+        key = Ed25519PrivateKey.generate()
+        private = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption()).decode()
+        public = key.public_key().public_bytes(serialization.Encoding.PEM,
+                                               serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+        return private, public
+
+    (old_private, old_public), (new_private, new_public) = pem_pair(), pem_pair()
+    old_codec = AsymmetricCodec(old_private, "2026-01", {"2026-01": old_public})
+    new_codec = AsymmetricCodec(new_private, "2026-10", {"2026-01": old_public, "2026-10": new_public})
+    claims = {"sub": "1", "exp": int(time.time()) + 60}
+
+    assert new_codec.decode(old_codec.encode(claims)) == claims
+    assert new_codec.decode(new_codec.encode(claims)) == claims
+    with pytest.raises(TokenError):
+        old_codec.decode(new_codec.encode(claims))
+
+
+def test_cached_codec_serves_tokens_until_exp(monkeypatch):
+    """Repeated tokens are served from the cache, never past their exp, and the cache stays bounded"""
+    codec = CachedTokenCodec(HS256Codec(SECRET), max_size=2)
+    now = time.time()
+    token = codec.encode({"sub": "1", "exp": int(now) + 60})
+
+    first = codec.decode(token)
+    first["sub"] = "changed"
+    assert codec.decode(token)["sub"] == "1"
+    assert codec.stats()["hits"] == 1 and codec.stats()["misses"] == 1
+
+    for sub in ("2", "3"):
+        codec.decode(codec.encode({"sub": sub, "exp": int(now) + 60}))
+    assert codec.stats()["size"] == 2
+
+    monkeypatch.setattr(tokens.time, "time", lambda: now + 120)
+    with pytest.raises(ExpiredTokenError):
+        codec.decode(token)
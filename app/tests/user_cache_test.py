@@ -0,0 +1,136 @@
+import time
+
+from app.db.models.user import User, Role
+from app.services.user_cache import UserCache
+
+
+def make_user(user_id: int) -> User:
+    return User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@mail.com",
+                first_name="first", last_name="last", hashed_password="hash", role=Role.USER)
+
+
+def test_cache_returns_detached_copy(event_loop):
+    """Every hit returns a new user instance built from the snapshot"""
+    cache = UserCache(max_size=10, ttl_seconds=60)
+
+    async def run():
+        await cache.set(make_user(1), "jti-1", time.time() + 60)
+        first = await cache.get(1, "jti-1")
+        second = await cache.get(1, "jti-1")
+        return first, second
+
+    first, second = event_loop.run_until_complete(run())
+    assert first is not second
+    assert first.username == "user1" and first.role == Role.USER
+    assert cache.stats()["hits"] == 2
+
+
+def test_cache_is_bounded_and_invalidated(event_loop):
+    """LRU eviction keeps the cache bounded and invalidate_user drops every token of the user"""
+    cache = UserCache(max_size=2, ttl_seconds=60)
+
+    async def run():
+        await cache.set(make_user(1), "a")
+        await cache.set(make_user(1), "b")
+        await cache.set(make_user(2), "c")
+        evicted = await cache.get(1, "a")
+        await cache.invalidate_user(1)
+        return evicted, await cache.get(1, "b"), await cache.get(2, "c")
+
+    evicted, invalidated, kept = event_loop.run_until_complete(run())
+    assert evicted is None
+    assert invalidated is None
+    assert kept is not None and kept.id == 2
+
+
+def test_cache_skips_expired_tokens(event_loop):
+    """Tokens that are already expired are never cached"""
+    cache = UserCache(max_size=10, ttl_seconds=60)
+
+    async def run():
+        await cache.set(make_user(3), "old", time.time() - 1)
+        return await cache.get(3, "old")
+
+    assert event_loop.run_until_complete(run()) is None
+
+
+def test_redis_snapshot_leaves_the_password_hash_out(event_loop, monkeypatch):
+    import json
+
+    import fakeredis
+
+    from app.services import user_cache as user_cache_module
+
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(user_cache_module, "get_redis", lambda: redis)
+    cache = UserCache(max_size=10, ttl_seconds=60, backend="redis")
+
+    async def run():
+        await cache.set(make_user(4), "jti-4", time.time() + 60)
+        cache.clear()  # the next get is served by redis
+        return json.loads(await redis.get("user_cache:4:jti-4")), await cache.get(4, "jti-4")
+
+    stored, user = event_loop.run_until_complete(run())
+    assert "hashed_password" not in stored
+    assert stored["username"] == "user4"
+    assert user.username == "user4" and user.role == Role.USER and user.hashed_password is None
+
+
+def test_redis_hit_is_one_round_trip(event_loop, monkeypatch):
+    import fakeredis
+
+    from app.services import user_cache as user_cache_module
+
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(user_cache_module, "get_redis", lambda: redis)
+    cache = UserCache(max_size=10, ttl_seconds=60, backend="redis")
+    pipelines = []
+
+    async def run():
+        await cache.set(make_user(5), "jti-5", time.time() + 60)
+        cache.clear()
+        pipeline = redis.pipeline
+
+        def counting(*args, **kwargs):
+            pipelines.append(kwargs)
+            return pipeline(*args, **kwargs)
+
+        async def single_command(*args, **kwargs):
+            raise AssertionError("separate round trip")
+
+        monkeypatch.setattr(redis, "pipeline", counting)
+        monkeypatch.setattr(redis, "get", single_command)
+        monkeypatch.setattr(redis, "ttl", single_command)
+        return await cache.get(5, "jti-5")
+
+    assert event_loop.run_until_complete(run()).id == 5
+    assert pipelines == [{"transaction": False}]  # GET and PTTL in one round trip
+    assert 0 < cache._entries[(5, "jti-5")][0] - time.monotonic() <= 60
+
+
+def test_invalidation_reaches_the_memory_tier_of_other_workers(event_loop, monkeypatch):
+    import asyncio
+
+    import fakeredis
+
+    from app.services import user_cache as user_cache_module
+
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(user_cache_module, "get_redis", lambda: redis)
+    worker, other = UserCache(backend="redis"), UserCache(backend="redis")
+
+    async def run():
+        other.start()
+        try:
+            await asyncio.sleep(0.05)  # subscribed
+            await other.set(make_user(6), "jti-6", time.time() + 60)
+            await worker.invalidate_user(6)
+            for _ in range(100):
+                if (6, "jti-6") not in other._entries:
+                    break
+                await asyncio.sleep(0.01)
+            return await other.get(6, "jti-6")
+        finally:
+            await other.stop()
+
+    assert event_loop.run_until_complete(run()) is None
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+from passlib.hash import bcrypt
+
+root_api_path = "/api/v1"
+
+
+def _ndjson(records: list) -> bytes:
+    return "\n".join(record if isinstance(record, str) else json.dumps(record) for record in records).encode()
+
+
+def test_import_requires_admin(client):
+    response = client.post(f"{root_api_path}/admin/users/import", content=b"")
+    assert response.status_code == 401
+
+
+def test_import_ndjson_reports_conflicts_and_bad_lines(client, admin_cookies):
+    records = [
+        {"username": "bulk1", "email": "bulk1@mail.com", "first_name": "bulk", "last_name": "one", "password": "bulk1"},
+        {"username": "bulk2", "email": "bulk2@mail.com", "first_name": "bulk", "last_name": "two",
+         "hashed_password": bcrypt.using(rounds=4).hash("legacy-password")},
+        # same email as the first record
+        {"username": "bulk3", "email": "bulk1@mail.com", "first_name": "bulk", "last_name": "three", "password": "x"},
+        {"username": "bulk4", "email": "bulk4@mail.com", "first_name": "bulk", "last_name": "four"},
+        "{not json",
+        {"username": "bulk5", "email": "bulk5@mail.com", "first_name": "bulk", "last_name": "five",
+         "hashed_password": "plain-text"},
+    ]
+    response = client.post(f"{root_api_path}/admin/users/import", content=_ndjson(records), cookies=admin_cookies)
+    assert response.status_code == 200
+    report = response.json()
+    assert report["received"] == 6
+    assert report["inserted"] == 2
+    assert report["skipped"] == 1
+    assert report["failed"] == 3
+    assert {failure["line"] for failure in report["failures"]} == {3, 4, 5, 6}
+
+    response = client.post(f"{root_api_path}/auth/signin", json={"username": "bulk1@mail.com", "password": "bulk1"})
+    assert response.status_code == 200
+    response = client.post(f"{root_api_path}/auth/signin",
+                           json={"username": "bulk2@mail.com", "password": "legacy-password"})
+    assert response.status_code == 200
+
+
+def test_import_csv(client, admin_cookies):
+    body = b"username,email,first_name,last_name,password\r\ncsv1,csv1@mail.com,csv,one,csv1\r\n"
+    response = client.post(f"{root_api_path}/admin/users/import?format=csv", content=body, cookies=admin_cookies)
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 1
+
+
+def test_import_csv_quoted_field_spanning_lines(client, admin_cookies):
+    body = (b'username,email,first_name,last_name,password\n'
+            b'csv2,csv2@mail.com,"two\nlines","with ""quotes""",csv2\n'
+            b'csv3,csv3@mail.com,csv,three,csv3\n'
+            b'csv4,csv4@mail.com,"never closed,four,csv4\n')
+    response = client.post(f"{root_api_path}/admin/users/import?format=csv", content=body, cookies=admin_cookies)
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["failed"]) == (2, 1)
+    assert report["failures"] == [{"line": 5, "error": "parse error: unexpected end of data in a quoted field"}]
+
+
+def test_http_import_leaves_half_of_the_hasher_pool_to_logins(event_loop):
+    from app.core.security import password_hasher
+    from app.services.user_import import UserImporter
+
+    class CountingHasher:
+        max_concurrency = 4
+        in_flight = peak = jobs = 0
+
+        async def run(self, func, batch):
+            self.jobs += 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return [f"hash-{password}" for password in batch]
+
+    shared = UserImporter(repo=None)
+    assert shared.hasher is password_hasher
+    assert shared.concurrency == max(1, password_hasher.max_concurrency // 2)
+    hasher = CountingHasher()
+    importer = UserImporter(repo=None, hasher=hasher, concurrency=2)
+    digests = event_loop.run_until_complete(importer._hash([str(i) for i in range(100)]))
+    assert digests == [f"hash-{i}" for i in range(100)]
+    assert hasher.peak == 2
+    assert hasher.jobs == 10  # user_import_hash_batch_size passwords per job
@@ -0,0 +1,4 @@
+import os
+
+# benchmarks use the test settings (sqlite, no redis) unless ENV is set explicitly
+os.environ.setdefault("ENV", "test")
@@ -0,0 +1,96 @@
+"""
+Import time benchmark: how long ``import app.main`` takes in a fresh interpreter, i.e. the cold start of
+every worker, CLI run (token reaper, user import) and test session.
+
+Runs ``python -X importtime`` in a subprocess, reports the total (best of ``--runs``) and the slowest
+top level packages. ``--budget`` makes the run fail (exit 1) when the total goes over it so it can gate CI :
+
+    $ python -m benchmarks.import_time --runs 5 --budget 1500
+    $ python -m benchmarks.import_time --module app.services.token_reaper --top 20
+
+Importing must not build an engine, load a database driver or install log handlers, the check fails when
+one of ``--forbid`` (asyncpg, uvicorn and coloredlogs by default) is imported.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+DEFAULT_FORBIDDEN = ["asyncpg", "uvicorn", "coloredlogs"]
+
+
+def measure(module: str) -> dict[str, int]:
+    """Cumulative import time in microseconds of every module imported by ``import module``"""
+    env = {**os.environ, "ENV": os.environ.get("ENV", "test")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def run(module: str, runs: int) -> dict:
+    best = None
+    for _ in range(runs):
+        timings = measure(module)
+        if best is None or timings.get(module, 0) < best.get(module, 0):
+            best = timings
+
+    packages = defaultdict(int)
+    for name, cumulative in best.items():
+        # nested imports are already part of the cumulative time of their top level package
+        if "." not in name.strip():
+            packages[name.strip()] = max(packages[name.strip()], cumulative)
+    return {
+        "module": module,
+        "total_ms": best.get(module, 0) / 1000,
+        "packages_ms": {name: us / 1000 for name, us in sorted(packages.items(), key=lambda item: -item[1])},
+        "modules": sorted(best),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main", help="module to import")
+    parser.add_argument("--runs", type=int, default=3, help="imports measured, the fastest is reported")
+    parser.add_argument("--top", type=int, default=15, help="slowest top level packages printed")
+    parser.add_argument("--budget", type=float, default=None, metavar="MS",
+                        help="fail when the import takes more than MS milliseconds")
+    parser.add_argument("--forbid", action="append", default=None, metavar="PACKAGE",
+                        help="fail when PACKAGE is imported (default: asyncpg, uvicorn, coloredlogs)")
+    parser.add_argument("--json", action="store_true", help="print the report as json")
+    args = parser.parse_args()
+
+    report = run(args.module, args.runs)
+    forbidden = args.forbid if args.forbid is not None else DEFAULT_FORBIDDEN
+    imported = [name for name in forbidden if name in report["modules"]]
+
+    if args.json:
+        print(json.dumps({key: value for key, value in report.items() if key != "modules"}, indent=2))
+    else:
+        print(f"import {report['module']}: {report['total_ms']:.1f} ms")
+        print(f"{'package':<32}{'cumulative ms':>14}")
+        for name, ms in list(report["packages_ms"].items())[:args.top]:
+            print(f"{name:<32}{ms:>14.1f}")
+
+    failed = False
+    if args.budget is not None and report["total_ms"] > args.budget:
+        print(f"BUDGET FAILED import {args.module}: {report['total_ms']:.1f} ms > {args.budget} ms", file=sys.stderr)
+        failed = True
+    if imported:
+        print(f"FORBIDDEN IMPORTS {args.module}: {', '.join(imported)}", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
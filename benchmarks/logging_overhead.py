@@ -0,0 +1,118 @@
+"""
+Per-request logging overhead: time spent in the request (i.e. blocking the event loop) by the log lines of an
+authenticated request, with the handler writing directly against the queue pipeline of ``app.core.log``.
+
+    $ python -m benchmarks.logging_overhead --requests 20000
+    $ python -m benchmarks.logging_overhead --sink-latency-us 200 --format json
+
+``--sink-latency-us`` makes every write to the output slow, like a full stdout pipe or a log shipper pushing
+back. The direct handler pays it inside the request, the pipeline pays it in its listener thread.
+"""
+import argparse
+import logging
+import os
+import statistics
+import time
+
+os.environ.setdefault("ENV", "test")
+
+from app.core.log import TEXT_FORMAT, DATE_FORMAT, JsonFormatter, LogPipeline  # noqa: E402
+
+PAYLOAD = {"sub": "42", "exp": 1_900_000_000, "jti": "5f0c1a", "role": "user", "type": "access"}
+
+
+class SlowSink:
+    """A write-only stream taking ``latency`` seconds per write"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.writes = 0
+
+    def write(self, data: str):
+        self.writes += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+def eager_request(logger: logging.Logger, user_id: int):
+    # the log lines of get_current_user before the pipeline
+    logger.info("Extracting access token")
+    logger.debug(f"Refreshed tokens: {PAYLOAD}")
+    logger.debug(f"payload: {PAYLOAD}")
+    logger.info(f"Refresh token renewed for user_id={user_id}")
+
+
+def lazy_request(logger: logging.Logger, user_id: int):
+    logger.debug("Extracting access token")
+    logger.debug("Access token refreshed from the refresh token")
+    logger.debug("Access token payload: sub=%s exp=%s", PAYLOAD["sub"], PAYLOAD["exp"])
+    logger.info("Refresh token renewed for user_id=%s", user_id)
+
+
+def measure(request, logger: logging.Logger, requests: int) -> list[float]:
+    durations = []
+    for i in range(requests):
+        start = time.perf_counter()
+        request(logger, i)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def direct(level: int, fmt: str, sink: SlowSink):
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT, DATE_FORMAT))
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
+
+
+def run(args) -> dict:
+    logger = logging.getLogger("app.bench")
+    report = {}
+
+    for name, level, request in (("direct, eager, DEBUG", logging.DEBUG, eager_request),
+                                 ("direct, eager, INFO", logging.INFO, eager_request),
+                                 ("direct, lazy, INFO", logging.INFO, lazy_request)):
+        sink = SlowSink(args.sink_latency_us / 1e6)
+        handler = direct(level, args.format, sink)
+        durations = measure(request, logger, args.requests)
+        logging.getLogger().removeHandler(handler)
+        report[name] = (durations, sink.writes, 0)
+
+    for name, limits in (("queue, lazy, INFO", {}), ("queue, lazy, INFO, rate limited", {"app": args.rate_limit})):
+        sink = SlowSink(args.sink_latency_us / 1e6)
+        pipeline = LogPipeline()
+        pipeline.start("INFO", args.format, limits, stream=sink)
+        durations = measure(lazy_request, logger, args.requests)
+        pipeline.stop()
+        report[name] = (durations, sink.writes, pipeline.stats()["rate_limited"])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10_000)
+    parser.add_argument("--format", choices=("text", "json"), default="text")
+    parser.add_argument("--sink-latency-us", type=float, default=0, help="time taken by every write to the output")
+    parser.add_argument("--rate-limit", type=int, default=100, help="records per second per call site")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(f"{'setup':<34}{'mean us':>9}{'p99 us':>9}{'max us':>10}{'written':>9}{'dropped':>9}")
+    for name, (durations, written, dropped) in report.items():
+        micros = sorted(d * 1e6 for d in durations)
+        print(f"{name:<34}{statistics.fmean(micros):>9.1f}{micros[int(len(micros) * 0.99) - 1]:>9.1f}"
+              f"{micros[-1]:>10.1f}{written:>9}{dropped:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare the previous refresh flow (select token, select user, then update + commit) with the
+single statement rotation used by ``AuthService.refresh_token_update``. Both flows update through
+``rotate_refresh_token``, the previous one pays for the two selects in front of it.
+
+    $ python -m benchmarks.refresh_rotation --rounds 2000
+
+Runs against ``DATABASE_URL``, tables must exist (``alembic upgrade head``) or pass ``--create-tables``.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from sqlalchemy import delete
+
+from app.db.models.user import User
+from app.db.repo.request import RequestRepo
+from app.db.session import engine, SessionPool
+from app.db.setup import Base
+
+
+def report(name: str, timings: list[float]):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<10} mean={statistics.mean(timings) * 1000:.3f}ms p95={p95 * 1000:.3f}ms "
+          f"ops/s={len(timings) / sum(timings):.0f}")
+
+
+async def run(rounds: int, create_tables: bool):
+    if create_tables:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    async with SessionPool() as session:
+        repo = RequestRepo(session)
+        name = f"bench-{uuid.uuid4().hex[:8]}"
+        user = User(username=name, email=f"{name}@bench.local", first_name="bench", last_name="bench",
+                    hashed_password="-")
+        session.add(user)
+        await session.commit()
+
+        token = uuid.uuid4().hex
+        await repo.token.save_refresh_token(user_id=user.id, refresh_token=token)
+
+        legacy = []
+        for _ in range(rounds):
+            new_token = uuid.uuid4().hex
+            start = time.perf_counter()
+            await repo.token.get_refresh_token(token)
+            await repo.user.get_by_id(user_id=user.id)
+            await repo.token.rotate_refresh_token(user.id, token, new_token)
+            legacy.append(time.perf_counter() - start)
+            token = new_token
+
+        rotation = []
+        for _ in range(rounds):
+            new_token = uuid.uuid4().hex
+            start = time.perf_counter()
+            assert await repo.token.rotate_refresh_token(user.id, token, new_token) is not None
+            rotation.append(time.perf_counter() - start)
+            token = new_token
+
+        await session.execute(delete(User).where(User.id == user.id))
+        await session.commit()
+
+    report("legacy", legacy)
+    report("rotation", rotation)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=1000)
+    parser.add_argument("--create-tables", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.rounds, args.create_tables))
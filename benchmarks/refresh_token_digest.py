@@ -0,0 +1,75 @@
+"""
+Index size and lookup latency of refresh tokens stored as full JWT strings vs SHA-256 hex digests.
+
+    $ python -m benchmarks.refresh_token_digest --rows 2000000 --lookups 5000
+
+PostgreSQL only, runs against ``DATABASE_URL`` in two scratch tables that are dropped at the end.
+Rows look like real tokens: the common HS256 header segment followed by payload and signature segments.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.db.session import engine
+
+JWT_SQL = ("'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.' || encode(convert_to(repeat(md5(i::text), 3), 'UTF8'), 'base64')"
+           " || '.' || md5((i * 7)::text) || md5((i * 13)::text)")
+
+TABLES = {
+    "jwt": ("bench_refresh_jwt", "token varchar NOT NULL", JWT_SQL),
+    "digest": ("bench_refresh_digest", "token_hash varchar(64) NOT NULL",
+               f"encode(sha256(convert_to({JWT_SQL}, 'UTF8')), 'hex')"),
+}
+
+
+async def setup(conn, rows: int):
+    for table, column, value in TABLES.values():
+        await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        await conn.execute(text(f"CREATE UNLOGGED TABLE {table} (id bigserial PRIMARY KEY, {column})"))
+        await conn.execute(text(f"INSERT INTO {table} ({column.split()[0]}) "
+                                f"SELECT replace({value}, E'\\n', '') FROM generate_series(1, :rows) AS i"),
+                           {"rows": rows})
+        await conn.execute(text(f"CREATE UNIQUE INDEX {table}_idx ON {table} ({column.split()[0]})"))
+        await conn.execute(text(f"ANALYZE {table}"))
+
+
+async def measure(conn, name: str, rows: int, lookups: int):
+    table, column, _ = TABLES[name]
+    column = column.split()[0]
+    size = (await conn.execute(text(f"SELECT pg_relation_size('{table}_idx')"))).scalar_one()
+
+    ids = random.sample(range(1, rows + 1), min(lookups, rows))
+    keys = (await conn.execute(text(f"SELECT {column} FROM {table} WHERE id = ANY(:ids)"), {"ids": ids})).scalars().all()
+    timings = []
+    for key in keys:
+        start = time.perf_counter()
+        (await conn.execute(text(f"SELECT id FROM {table} WHERE {column} = :key"), {"key": key})).scalar_one()
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    print(f"{name:<7} index={size / 1024 / 1024:8.1f}MiB lookup mean={statistics.mean(timings) * 1000:.3f}ms "
+          f"p95={timings[int(len(timings) * 0.95) - 1] * 1000:.3f}ms")
+
+
+async def run(rows: int, lookups: int):
+    async with engine.connect() as conn:
+        await setup(conn, rows)
+        await conn.commit()
+        for name in TABLES:
+            await measure(conn, name, rows, lookups)
+        for table, _, _ in TABLES.values():
+            await conn.execute(text(f"DROP TABLE {table}"))
+        await conn.commit()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.lookups))
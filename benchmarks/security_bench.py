@@ -0,0 +1,76 @@
+"""
+Micro-benchmarks of the password and token primitives used on every auth request.
+
+    $ pytest benchmarks/security_bench.py --benchmark-only
+    $ pytest benchmarks/security_bench.py --benchmark-only --benchmark-autosave
+    $ pytest benchmarks/security_bench.py --benchmark-only --benchmark-compare --benchmark-compare-fail=mean:15%
+"""
+import time
+
+import pytest
+
+from app.core.security import hash_password, verify_password, create_access_token, decode_token
+from app.core.tokens import HS256Codec, JoseCodec
+
+PASSWORD = "correct horse battery staple"
+
+
+@pytest.fixture(scope="module")
+def hashed_password():
+    return hash_password(PASSWORD)
+
+
+@pytest.fixture(scope="module")
+def access_token():
+    return create_access_token({"sub": "1"})
+
+
+def test_hash_password(benchmark):
+    benchmark.pedantic(hash_password, args=(PASSWORD,), rounds=10, iterations=1)
+
+
+def test_verify_password(benchmark, hashed_password):
+    assert benchmark.pedantic(verify_password, args=(PASSWORD, hashed_password), rounds=10, iterations=1)
+
+
+def test_create_access_token(benchmark):
+    benchmark(create_access_token, {"sub": "1"})
+
+
+def test_decode_token(benchmark, access_token):
+    assert benchmark(decode_token, access_token)["sub"] == "1"
+
+
+CLAIMS = {"sub": "1", "jti": "0123456789abcdef0123456789abcdef"}
+CODECS = {"jose": lambda: JoseCodec("bench-secret"), "hs256": lambda: HS256Codec("bench-secret")}
+
+
+def asymmetric_codec(algorithm: str):
+    pytest.importorskip("jwt")
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    from app.core.tokens import AsymmetricCodec
+
+    key = ed25519.Ed25519PrivateKey.generate() if algorithm == "EdDSA" else ec.generate_private_key(ec.SECP256R1())
+    private = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption()).decode()
+    public = key.public_key().public_bytes(serialization.Encoding.PEM,
+                                           serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+    return AsymmetricCodec(private, "bench", {"bench": public}, algorithm)
+
+
+CODECS.update({"eddsa": lambda: asymmetric_codec("EdDSA"), "es256": lambda: asymmetric_codec("ES256")})
+
+
+@pytest.mark.parametrize("backend", CODECS)
+def test_codec_encode(benchmark, backend):
+    codec = CODECS[backend]()
+    benchmark(codec.encode, {**CLAIMS, "exp": int(time.time()) + 900})
+
+
+@pytest.mark.parametrize("backend", CODECS)
+def test_codec_decode(benchmark, backend):
+    codec = CODECS[backend]()
+    token = codec.encode({**CLAIMS, "exp": int(time.time()) + 900})
+    assert benchmark(codec.decode, token)["sub"] == "1"
@@ -0,0 +1,51 @@
+"""store refresh tokens as sha256 digests
+
+Revision ID: 8b4d6e0f2c31
+Revises: 3f1c2a9e7b10
+Create Date: 2026-10-18 15:09:47.902114
+
+"""
+import hashlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4d6e0f2c31'
+down_revision: Union[str, Sequence[str], None] = '3f1c2a9e7b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('refresh_tokens', sa.Column('token_hash', sa.String(length=64), nullable=True))
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute("UPDATE refresh_tokens SET token_hash = encode(sha256(convert_to(token, 'UTF8')), 'hex')")
+    else:
+        rows = bind.execute(sa.text("SELECT id, token FROM refresh_tokens")).all()
+        for row_id, token in rows:
+            bind.execute(sa.text("UPDATE refresh_tokens SET token_hash = :digest WHERE id = :id"),
+                         {"digest": hashlib.sha256(token.encode("utf-8")).hexdigest(), "id": row_id})
+
+    op.drop_index('ix_refresh_tokens_token', table_name='refresh_tokens')
+    with op.batch_alter_table('refresh_tokens') as batch_op:
+        batch_op.alter_column('token_hash', existing_type=sa.String(length=64), nullable=False)
+        batch_op.drop_column('token')
+    op.create_index(op.f('ix_refresh_tokens_token_hash'), 'refresh_tokens', ['token_hash'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Digests can't be turned back into tokens, the restored ``token`` column holds the digest so every
+    existing session has to sign in again.
+    """
+    op.drop_index(op.f('ix_refresh_tokens_token_hash'), table_name='refresh_tokens')
+    with op.batch_alter_table('refresh_tokens') as batch_op:
+        batch_op.alter_column('token_hash', new_column_name='token', existing_type=sa.String(length=64),
+                              type_=sa.String(), existing_nullable=False)
+    op.create_index('ix_refresh_tokens_token', 'refresh_tokens', ['token'], unique=True)
@@ -0,0 +1,26 @@
+"""index users by role and id for keyset pagination
+
+Revision ID: c5e7a1d3f920
+Revises: 8b4d6e0f2c31
+Create Date: 2026-10-18 18:42:11.530871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e7a1d3f920'
+down_revision: Union[str, Sequence[str], None] = '8b4d6e0f2c31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_users_role_id', 'users', ['role', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_role_id', table_name='users')
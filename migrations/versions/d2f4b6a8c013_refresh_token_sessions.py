@@ -0,0 +1,31 @@
+"""index active refresh tokens per user and store the session user agent
+
+Revision ID: d2f4b6a8c013
+Revises: c5e7a1d3f920
+Create Date: 2026-10-18 19:27:36.184402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f4b6a8c013'
+down_revision: Union[str, Sequence[str], None] = 'c5e7a1d3f920'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('refresh_tokens', sa.Column('user_agent', sa.String(length=255), nullable=True))
+    op.create_index('ix_refresh_tokens_user_active', 'refresh_tokens', ['user_id', 'is_revoked', 'expire_at'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_refresh_tokens_user_active', table_name='refresh_tokens')
+    with op.batch_alter_table('refresh_tokens') as batch_op:
+        batch_op.drop_column('user_agent')